@@ -7,15 +7,17 @@ if sys.version_info < (3, 5):
 
 from .base import Baseset
 from .batch import Batch
-from .batch_image import ImagesBatch
+from .batch_pool import BatchPool
+from .batch_image import ImagesBatch, ArrayImagesBatch
+from .image_cache import ImageCache
 from .config import Config
-from .dataset import Dataset
+from .dataset import Dataset, StreamDataset
 from .pipeline import Pipeline
 from .named_expr import B, C, F, L, V, R, W, P
-from .dsindex import DatasetIndex, FilesIndex
+from .dsindex import DatasetIndex, FilesIndex, RangeIndex, StreamIndex, BlockShuffle, Buckets
 from .decorators import action, inbatch_parallel, parallel, any_action_failed, mjit
 from .exceptions import SkipBatchException
-from .sampler import Sampler, ConstantSampler, NumpySampler, HistoSampler, ScipySampler
+from .sampler import Sampler, ConstantSampler, NumpySampler, HistoSampler, ScipySampler, BufferedSampler
 
 
 __version__ = '0.3.0'
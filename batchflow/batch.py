@@ -27,6 +27,7 @@ except ImportError:
 from .dsindex import DatasetIndex, FilesIndex
 from .decorators import action, inbatch_parallel, any_action_failed
 from .components import MetaComponentsTuple
+from .rng import make_rng
 
 
 class Batch:
@@ -34,6 +35,9 @@ class Batch:
     _item_class = None
     components = None
 
+    # attributes which pooled batches keep when they are recycled (see :class:`~batchflow.BatchPool`)
+    _POOLED_ATTRS = ('_preloaded_lock', '_local', '_pool', '_buffers', '_retired', '_item_classes')
+
     def __init__(self, index, preloaded=None, *args, **kwargs):
         _ = args, kwargs
         if  self.components is not None and not isinstance(self.components, tuple):
@@ -45,6 +49,107 @@ class Batch:
         self._preloaded = preloaded
         self._local = None
         self._pipeline = None
+        self._random = None
+        self.random_seed = None
+        self._pool = None
+        self._buffers = None
+        self._retired = None
+        self._item_classes = None
+
+    def _recycle(self, index, preloaded=None, *args, **kwargs):
+        """ Initialize a released batch for the given items, but keep the attributes which pooled batches keep """
+        state = {name: self.__dict__[name] for name in self._POOLED_ATTRS if name in self.__dict__}
+        self.__init__(index, preloaded, *args, **kwargs)     # pylint: disable=unnecessary-dunder-call
+        self.__dict__.update(state)
+
+    def release(self):
+        """ Return the batch to a pool it has been taken from (see :class:`~batchflow.BatchPool`)
+
+        Neither the batch nor its data (if the pool reuses buffers) should be used after that.
+        Batches which are not taken from a pool are left intact.
+        """
+        if self._pool is not None:
+            self._pool.release(self)
+
+    def _clear(self, reuse_buffers=False):
+        """ Drop all the state, but the attributes which pooled batches keep
+
+        If `reuse_buffers` is True, component arrays owned by the batch (including replaced ones)
+        become buffers for the next items (see :meth:`_get_buffer`).
+        """
+        if reuse_buffers:
+            data = self.__dict__.get('_data')
+            arrays = list(data) if isinstance(data, tuple) else [data]
+            arrays.extend(self._retired or [])
+            buffers, seen = {}, set()
+            for array in arrays:
+                if self._is_reusable(array) and id(array) not in seen:
+                    seen.add(id(array))
+                    buffers.setdefault((array.shape, array.dtype), []).append(array)
+        state = {name: self.__dict__[name] for name in self._POOLED_ATTRS if name in self.__dict__}
+        self.__dict__.clear()
+        self.__dict__.update(state)
+        if reuse_buffers:
+            self._buffers = buffers
+            self._retired = []
+
+    @staticmethod
+    def _is_reusable(array):
+        """ Check whether an array owns its memory and can be overwritten with new items """
+        if not isinstance(array, np.ndarray) or array.base is not None:
+            return False
+        return array.flags.writeable and array.flags.c_contiguous and not array.dtype.hasobject
+
+    def _get_buffer(self, shape, dtype):
+        """ Return a recycled array of the given shape and dtype or None """
+        if self._buffers:
+            arrays = self._buffers.get((shape, dtype))
+            if arrays:
+                return arrays.pop()
+        return None
+
+    def _stack_items(self, items):
+        """ Stack items into an array (a recycled one if it fits) """
+        buffer = None
+        if self._buffers and len(items) > 0 and isinstance(items[0], np.ndarray):
+            dtype = items[0].dtype
+            if all(isinstance(item, np.ndarray) and item.dtype == dtype for item in items):
+                buffer = self._get_buffer((len(items),) + items[0].shape, dtype)
+        if buffer is None:
+            return np.stack(items)
+        try:
+            return np.stack(items, out=buffer)
+        except ValueError:
+            return np.stack(items)
+
+    def _take_items(self, data, pos):
+        """ Return data items at given positions (into a recycled array if it fits) """
+        if self._buffers and self._is_position_array(data, pos):
+            shape = (len(pos),) + data.shape[1:]
+            if (shape, data.dtype) in self._buffers and pos.min() >= 0 and pos.max() < len(data):
+                buffer = self._get_buffer(shape, data.dtype)
+                if buffer is not None:
+                    # positions are checked, so clipping just avoids a temporary copy
+                    return np.take(data, pos, axis=0, out=buffer, mode='clip')
+        return data[pos]
+
+    @staticmethod
+    def _is_position_array(data, pos):
+        """ Check whether `pos` is a non-empty array of integer positions along the first axis of `data` """
+        if not isinstance(data, np.ndarray) or data.ndim == 0 or not isinstance(pos, np.ndarray):
+            return False
+        return pos.ndim == 1 and pos.dtype.kind in 'iu' and len(pos) > 0
+
+    @property
+    def random(self):
+        """: numpy.random.Generator - a random number generator of the batch
+
+        It is seeded with :attr:`random_seed`, which pipelines set to a stream spawned from a pipeline run seed,
+        or, if it is None, with a seed drawn from `np.random` (see :mod:`~batchflow.rng`).
+        """
+        if self.__dict__.get('_random') is None:
+            self._random = make_rng(self.__dict__.get('random_seed'))
+        return self._random
 
     @property
     def pipeline(self):
@@ -225,8 +330,13 @@ class Batch:
             comp_class = MetaComponentsTuple(type(self).__name__ + 'Components', components=self.components)
             type(self)._item_class = comp_class
         else:
-            comp_class = MetaComponentsTuple(type(self).__name__ + 'Components' + str(id(self)),
-                                             components=self.components)
+            # pooled batches keep classes for components added before
+            item_classes = self._item_classes if self._item_classes is not None else {}
+            comp_class = item_classes.get(self.components)
+            if comp_class is None:
+                comp_class = MetaComponentsTuple(type(self).__name__ + 'Components' + str(id(self)),
+                                                 components=self.components)
+                item_classes[self.components] = comp_class
             self._item_class = comp_class
 
     @action
@@ -265,6 +375,7 @@ class Batch:
     def __getstate__(self):
         state = self.__dict__.copy()
         state.pop('_data_named')
+        state.update(_pool=None, _buffers=None, _retired=None, _item_classes=None)
         return state
 
     def __setstate__(self, state):
@@ -343,6 +454,8 @@ class Batch:
         raise AttributeError("%s not found in class %s" % (name, self.__class__.__name__))
 
     def __setattr__(self, name, value):
+        if self.__dict__.get('_retired') is not None:
+            self._retire(name)
         if self.components is not None:
             if name == "_data":
                 super().__setattr__(name, value)
@@ -359,6 +472,16 @@ class Batch:
         else:
             super().__setattr__(name, value)
 
+    def _retire(self, name):
+        """ Remember arrays which are about to be replaced, so they can be reused after the batch is released """
+        if name == '_data':
+            data = self.__dict__.get('_data')
+            self._retired.extend(data if isinstance(data, tuple) else [data])
+        elif self.components is not None and name in self.components:    # pylint: disable=unsupported-membership-test
+            data = self.__dict__.get('_data_named')
+            if data is not None:
+                self._retired.append(getattr(data, name))
+
     def put_into_data(self, data, components=None):
         """ Load data into :attr:`_data` property """
         if self.components is None:
@@ -392,13 +515,13 @@ class Batch:
             res = self._item_class(data=_data, pos=pos)    # pylint: disable=not-callable
         elif isinstance(_data, tuple):
             comps = components if components is not None else range(len(_data))
-            res = tuple(data_item[self.get_pos(data, comp, index)] if data_item is not None else None
+            res = tuple(self._take_items(data_item, self.get_pos(data, comp, index)) if data_item is not None else None
                         for comp, data_item in zip(comps, _data))
         elif isinstance(_data, dict):
             res = dict(zip(components, (_data[comp][self.get_pos(data, comp, index)] for comp in components)))
         else:
             pos = self.get_pos(data, None, index)
-            res = _data[pos]
+            res = self._take_items(_data, pos)
         return res
 
     def get(self, item=None, component=None):
@@ -451,8 +574,7 @@ class Batch:
         return self
 
     @action
-    @inbatch_parallel(init='indices', post='_assemble')
-    def apply_transform(self, ix, func, *args, src=None, dst=None, p=None, use_self=False, **kwargs):
+    def apply_transform(self, func, *args, src=None, dst=None, p=None, use_self=False, **kwargs):
         """ Apply a function to each item in the batch
 
         Parameters
@@ -478,8 +600,8 @@ class Batch:
         p : float or None
             probability of applying transform to an element in the batch
 
-            if not None, indices of relevant batch elements will be passed ``func``
-            as a named arg ``indices``.
+            Items to transform are chosen at once with :attr:`random`,
+            while other items are not passed to ``func`` at all and remain unchanged.
 
         use_self : bool
             whether to pass ``self`` to ``func``
@@ -494,28 +616,45 @@ class Batch:
             for item in range(len(batch)):
                 self.dst[item] = func(self.src[item], *args, **kwargs)
         """
+        mask = None if p is None else self.random.random(len(self)) < p
+        return self._apply_transform(func, *args, src=src, dst=dst, use_self=use_self, _mask=mask, **kwargs)
 
-        if src is None:
-            _args = args
-        else:
-            if isinstance(src, str):
-                pos = self.get_pos(None, src, ix)
-                src_attr = (getattr(self, src)[pos],)
-            elif isinstance(src, list) and np.all([isinstance(component, str) for component in src]):
-                src_attr = [getattr(self, component)[self.get_pos(None, component, ix)] for component in src]
-            else:
-                pos = self.get_pos(None, dst, ix)
-                src_attr = (src[pos],)
-            _args = tuple([*src_attr, *args])
-
-        if p is None or np.random.binomial(1, p):
-            if use_self:
-                return func(self, *_args, **kwargs)
-            return func(*_args, **kwargs)
+    def _indices_to_transform(self, *args, _mask=None, **kwargs):
+        """ Return indices of items to transform """
+        _ = args, kwargs
+        return self.indices if _mask is None else self.indices[_mask]
 
-        if len(src_attr) == 1:
-            return src_attr[0]
-        return src_attr
+    def _get_transform_src(self, ix, src=None, dst=None):
+        """ Return a tuple of source items to transform """
+        if src is None:
+            return ()
+        if isinstance(src, str):
+            return (getattr(self, src)[self.get_pos(None, src, ix)],)
+        if isinstance(src, list) and np.all([isinstance(component, str) for component in src]):
+            return tuple(getattr(self, component)[self.get_pos(None, component, ix)] for component in src)
+        return (src[self.get_pos(None, dst, ix)],)
+
+    @inbatch_parallel(init='_indices_to_transform', post='_assemble_transform')
+    def _apply_transform(self, ix, func, *args, src=None, dst=None, use_self=False, _mask=None, **kwargs):
+        """ Apply a function to a batch item """
+        _ = _mask
+        _args = (*self._get_transform_src(ix, src, dst), *args)
+        if use_self:
+            return func(self, *_args, **kwargs)
+        return func(*_args, **kwargs)
+
+    def _assemble_transform(self, all_results, *args, src=None, dst=None, _mask=None, **kwargs):
+        """ Put unchanged source items for skipped items and assemble the batch """
+        if _mask is not None and not any_action_failed(all_results):
+            results = iter(all_results)
+            all_results = []
+            for ix, selected in zip(self.indices, _mask):
+                if selected:
+                    all_results.append(next(results))
+                else:
+                    src_items = self._get_transform_src(ix, src if src is not None else dst, dst)
+                    all_results.append(src_items[0] if len(src_items) == 1 else src_items)
+        return self._assemble(all_results, *args, dst=dst, **kwargs)
 
     @action
     def apply_transform_all(self, func, *args, src=None, dst=None, p=None, use_self=False, **kwargs):
@@ -542,8 +681,8 @@ class Batch:
         p : float or None
             probability of applying transform to an element in the batch
 
-            if not None, indices of relevant batch elements will be passed ``func``
-            as a named arg ``indices``.
+            if not None, indices of relevant batch elements (chosen with :attr:`random`)
+            will be passed ``func`` as a named arg ``indices``.
 
         use_self : bool
             whether to pass ``self`` to ``func``
@@ -588,7 +727,7 @@ class Batch:
             _args = tuple([src_attr, *args])
 
         if p is not None:
-            indices = np.where(np.random.binomial(1, p, len(self)))[0]
+            indices = np.where(self.random.random(len(self)) < p)[0]
             kwargs['indices'] = indices
         if use_self:
             _args = (self, *_args)
@@ -685,7 +824,7 @@ class Batch:
 
         _ = args, kwargs
         try:
-            new_items = np.stack(result)
+            new_items = self._stack_items(result)
         except ValueError as e:
             message = str(e)
             if "must have the same shape" in message:
@@ -1,7 +1,14 @@
 """ Contains Batch classes for images """
 import os
+import io
+import atexit
+import time
+import tarfile
+import threading
+import concurrent.futures as cf
 from numbers import Number
-from functools import wraps
+from functools import wraps, lru_cache, partial
+from collections import OrderedDict
 
 import numpy as np
 from skimage.transform import resize
@@ -14,8 +21,9 @@ import PIL.ImageFilter
 import PIL.ImageEnhance
 
 from .batch import Batch
-from .decorators import action, inbatch_parallel
+from .decorators import action, inbatch_parallel, any_action_failed
 from .dsindex import FilesIndex
+from .rng import get_distribution
 
 
 def get_scipy_transforms():
@@ -34,7 +42,7 @@ def get_scipy_transforms():
     return scipy_transformations
 
 
-def transform_actions(prefix='', suffix='', wrapper=None):
+def transform_actions(prefix='', suffix='', wrapper=None, target='for'):
     """ Transforms classmethods that have names like <prefix><name><suffix> to pipeline's actions executed in parallel.
 
     First, it finds all *class methods* which names have the form <prefix><method_name><suffix>
@@ -49,6 +57,12 @@ def transform_actions(prefix='', suffix='', wrapper=None):
     suffix : str
     wrapper : str
         name of the wrapper inside ``Batch`` class
+    target : str or None
+        default parallelization target passed to ``wrapper``.
+        Should be None for wrappers which are not parallel (e.g. ``apply_transform_all``).
+
+        If a batch class has ``get_transform_target`` method (see :meth:`BaseImagesBatch.get_transform_target`),
+        a target is chosen by it for each transform and batch, while ``target`` is used as a fallback.
 
     Examples
     --------
@@ -79,16 +93,22 @@ def transform_actions(prefix='', suffix='', wrapper=None):
         for method_name, method in cls.__dict__.copy().items():
             if method_name.startswith(prefix) and method_name.endswith(suffix) and\
                not method_name.startswith('__') and not method_name.endswith('__'):
+                name_slice = slice(len(prefix), -len(suffix))
+                wrapped_method_name = method_name[name_slice]
                 def _wrapper():
                     #pylint: disable=cell-var-from-loop
                     wrapped_method = method
+                    transform_name = wrapped_method_name
                     @wraps(wrapped_method)
-                    def _func(self, *args, src='images', dst='images', target='for', **kwargs):
+                    def _func(self, *args, src='images', dst='images', **kwargs):
+                        if target is not None and 'target' not in kwargs:
+                            if hasattr(self, 'get_transform_target'):
+                                kwargs['target'] = self.get_transform_target(transform_name, src, default=target)
+                            else:
+                                kwargs['target'] = target
                         return getattr(cls, wrapper)(self, wrapped_method, src=src, dst=dst,
-                                                     use_self=True, target=target, *args, **kwargs)
+                                                     use_self=True, *args, **kwargs)
                     return _func
-                name_slice = slice(len(prefix), -len(suffix))
-                wrapped_method_name = method_name[name_slice]
                 setattr(cls, wrapped_method_name, action(_wrapper()))
         return cls
     return _decorator
@@ -124,11 +144,247 @@ def add_methods(transformations=None, prefix='_', suffix='_'):
     return _decorator
 
 
+def _patch_starts(size, patch_size, stride, drop_last):
+    """ Return start positions of patches along one axis """
+    if patch_size > size:
+        raise ValueError("Patch size %d exceeds image size %d" % (patch_size, size))
+    starts = np.arange(0, size - patch_size + 1, stride)
+    if not drop_last and starts[-1] != size - patch_size:
+        starts = np.append(starts, size - patch_size)
+    return starts
+
+
+def extract_patches(images, patch_shape, stride=1, drop_last=False, axis=0, flatten=True):
+    """ Extract patches from images without python loops over patches.
+
+    Patches are taken from a strided view of all sliding windows (`np.lib.stride_tricks.as_strided`),
+    so no data is copied until patches are gathered into one compact array.
+
+    Parameters
+    ----------
+    images : np.ndarray
+        An image or images with rows and columns at axes `axis` and `axis + 1`,
+        e.g. an image of shape (rows, columns, channels) with `axis=0` or
+        a batch of images of shape (batch_size, rows, columns, channels) with `axis=1`.
+    patch_shape : int, sequence
+        Patch's shape in the from (rows, columns). If int is given then patches have square shape.
+    stride : int, sequence
+        Step of the moving window from which patches are cropped. If int is given then the window has square shape.
+    drop_last : bool
+        Whether to drop patches whose window covers area out of the image.
+        If False is passed then these patches are cropped from the edge of an image.
+    axis : int
+        An axis with image rows.
+    flatten : bool
+        If True, patches are returned as one compact array of shape (n_patches, patch_rows, patch_columns, ...).
+        If False, patches have shape (..., n_patch_rows, n_patch_columns, patch_rows, patch_columns, ...)
+        and they are a view of `images` (without copying) when there are no patches at image edges.
+
+    Returns
+    -------
+    patches : np.ndarray
+    coordinates : np.ndarray
+        Coordinates of patches' upper-left corners of shape (n_patches, axis + 2), i.e.
+        (row, column) for a single image or (image position, row, column) for a batch.
+    """
+    images = np.asarray(images)
+    stride = (stride, stride) if isinstance(stride, Number) else tuple(stride)
+    patch_shape = (patch_shape, patch_shape) if isinstance(patch_shape, Number) else tuple(patch_shape)
+    image_shape = images.shape[axis:axis + 2]
+    rows, columns = [_patch_starts(size, patch_size, step, drop_last)
+                     for size, patch_size, step in zip(image_shape, patch_shape, stride)]
+
+    lead, tail = images.shape[:axis], images.shape[axis + 2:]
+    strides = images.strides
+    windows = np.lib.stride_tricks.as_strided(
+        images,
+        shape=(*lead, image_shape[0] - patch_shape[0] + 1, image_shape[1] - patch_shape[1] + 1, *patch_shape, *tail),
+        strides=(*strides[:axis], *strides[axis:axis + 2], *strides[axis:axis + 2], *strides[axis + 2:]),
+        writeable=False)
+
+    regular = len(rows) == len(range(0, rows[-1] + 1, stride[0])) and \
+              len(columns) == len(range(0, columns[-1] + 1, stride[1]))
+    if regular and not flatten:
+        patches = windows[(slice(None),) * axis + (slice(None, None, stride[0]), slice(None, None, stride[1]))]
+    else:
+        patches = windows[(slice(None),) * axis + (rows[:, None], columns[None, :])]
+        if flatten:
+            patches = patches.reshape(-1, *patch_shape, *tail)
+
+    grid = np.meshgrid(*[np.arange(size) for size in lead], rows, columns, indexing='ij')
+    coordinates = np.stack([ax.ravel() for ax in grid], axis=1)
+    return patches, coordinates
+
+
+@lru_cache(maxsize=16)
+def _coordinate_grid(shape):
+    """ Return a read-only grid of pixel coordinates of shape (len(shape), *shape) (cached by shape) """
+    grid = np.indices(shape, dtype=np.float32)
+    grid.flags.writeable = False
+    return grid
+
+
+_FIELD_POOLS = OrderedDict()
+_FIELD_POOLS_SIZE = 8
+_FIELD_POOLS_LOCK = threading.Lock()
+
+
+def _displacement_fields(n_fields, shape, sigma, pool_size=None, random=None, **kwargs):
+    """ Return smoothed random displacement fields of shape (n_fields, 2, rows, columns) with values in [-1, 1]
+
+    Fields are generated with one gaussian filter call for all of them. If `pool_size` is given,
+    `pool_size` fields are generated once for a shape and reused: each returned field is a random
+    field from the pool flipped along random axes and multiplied by random signs, which keeps
+    the distribution of fields. Fields are chosen with `random` generator (or `np.random` if it is None).
+    """
+    random = np.random if random is None else random
+    shape = tuple(shape)
+    if pool_size is None:
+        fields = random.uniform(-1, 1, size=(n_fields, 2, *shape)).astype(np.float32)
+        return scipy.ndimage.gaussian_filter(fields, sigma=(0, 0, sigma, sigma), **kwargs)
+
+    key = shape, sigma, pool_size, tuple(sorted(kwargs.items()))
+    with _FIELD_POOLS_LOCK:
+        pool = _FIELD_POOLS.get(key)
+    if pool is None:
+        # a pool does not depend on the batch which creates it, so draws are reproducible in any order of batches
+        pool_random = np.random.default_rng([*shape, pool_size])
+        pool = _displacement_fields(pool_size, shape, sigma, random=pool_random, **kwargs)
+        with _FIELD_POOLS_LOCK:
+            pool = _FIELD_POOLS.setdefault(key, pool)
+            while len(_FIELD_POOLS) > _FIELD_POOLS_SIZE:
+                _FIELD_POOLS.popitem(last=False)
+
+    randint = get_distribution(random, 'randint')
+    fields = pool[randint(pool_size, size=n_fields)]
+    flips = randint(2, size=(2, n_fields)).astype(bool)
+    fields[flips[0]] = fields[flips[0], :, ::-1]
+    fields[flips[1]] = fields[flips[1], :, :, ::-1]
+    fields *= random.choice(np.float32([-1, 1]), size=(n_fields, 2, 1, 1))
+    return fields
+
+
+def _save_image(image, path=None, ext='png', **codec_params):
+    """ Encode an image into `ext` format and write it to `path` or return encoded bytes if `path` is None
+
+    Returns
+    -------
+    int or bytes
+        The size of the written file or the encoded image.
+    """
+    if not isinstance(image, PIL.Image.Image):
+        image = PIL.Image.fromarray(image)
+    fmt = PIL.Image.registered_extensions().get('.' + ext.lower(), ext.upper())
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **codec_params)
+    data = buffer.getvalue()
+    if path is None:
+        return data
+    with open(path, 'wb') as file:
+        file.write(data)
+    return len(data)
+
+
+_EXECUTORS = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def _get_executor(n_workers=None):
+    """ Return a thread pool if `n_workers` is None or a pool of `n_workers` processes
+
+    Executors are created once and shared by all batches, so workers are not started for each batch.
+    They are shut down at exit (or with :func:`_shutdown_executors`).
+    """
+    with _EXECUTORS_LOCK:
+        executor = _EXECUTORS.get(n_workers)
+        if executor is None:
+            if n_workers is None:
+                executor = cf.ThreadPoolExecutor(max_workers=os.cpu_count())
+            else:
+                executor = cf.ProcessPoolExecutor(max_workers=n_workers)
+            _EXECUTORS[n_workers] = executor
+        return executor
+
+
+@atexit.register
+def _shutdown_executors():
+    """ Shut down shared executors and wait for their workers """
+    with _EXECUTORS_LOCK:
+        executors = list(_EXECUTORS.values())
+        _EXECUTORS.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+def _write_shard(path, names, images):
+    """ Write encoded images into a tar archive """
+    with tarfile.open(path, 'w') as shard:
+        mtime = time.time()
+        for name, data in zip(names, images):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = mtime
+            shard.addfile(info, io.BytesIO(data))
+
+
 class BaseImagesBatch(Batch):
-    """ Batch class for 2D images """
+    """ Batch class for 2D images
+
+    Attributes
+    ----------
+    transform_targets : dict
+        Default parallelization targets for transform actions in the form {'transform_name': target}.
+        Transforms which release the GIL (e.g. most `PIL` and `scipy.ndimage` operations) run in threads,
+        while for cheap ones threads overhead exceeds their cost, so they run sequentially.
+    threads_min_pixels : int
+        Images with fewer pixels are transformed sequentially even if a transform target is 'threads'.
+    """
     components = "images", "labels", "masks"
     formats_lower = ['jpg', 'png', 'jpeg']
     formats = set(formats_lower + [x.upper() for x in formats_lower])
+    transform_targets = {}
+    threads_min_pixels = 64 * 64
+
+    def get_transform_target(self, name, src='images', default='for'):
+        """ Choose a parallelization target for a transform action.
+
+        A target is looked up in the following order:
+
+        - ``transform_targets`` pipeline config option, which is either a target for all transforms
+          or a dict {'transform_name': target}, e.g. ``Pipeline(config=dict(transform_targets={'rotate': 'for'}))``
+        - :attr:`transform_targets` class attribute
+        - ``default``
+
+        'threads' target is replaced with 'for' for images smaller than :attr:`threads_min_pixels`.
+
+        Parameters
+        ----------
+        name : str
+            A transform name, e.g. 'rotate'.
+        src : str
+            A component with images.
+        default : str
+            A target for transforms which are not specified anywhere.
+
+        Returns
+        -------
+        str
+        """
+        config = getattr(self.pipeline, 'config', None) or {}
+        targets = config.get('transform_targets')
+        if isinstance(targets, str):
+            return targets
+        if targets is not None and name in targets:
+            return targets[name]
+
+        target = self.transform_targets.get(name, default)
+        images = getattr(self, src, None) if isinstance(src, str) else None
+        if target in ['threads', 't'] and images is not None and len(images) > 0:
+            image = images[0]
+            shape = image.size if isinstance(image, PIL.Image.Image) else np.shape(image)[:2]
+            if np.prod(shape) < self.threads_min_pixels:
+                target = 'for'
+        return target
 
     def _make_path(self, ix, src=None):
         """ Compose path.
@@ -154,7 +410,8 @@ class BaseImagesBatch(Batch):
             path = os.path.join(src, str(ix))
         return path
 
-    def _load_image(self, ix, src=None, fmt=None, dst="images"):
+    def _load_image(self, ix, src=None, fmt=None, dst="images", target_shape=None, mode=None, resample=0,
+                    cache=None):
         """ Loads image.
 
         .. note:: Please note that ``dst`` must be ``str`` only, sequence is not allowed here.
@@ -167,15 +424,59 @@ class BaseImagesBatch(Batch):
             Component to write images to.
         fmt : str
             Format of the an image
+        target_shape : sequence or None
+            Size of loaded images in the form (width, height).
+        mode : str or None
+            PIL mode of loaded images, e.g. 'L' or 'RGB'.
+        resample : int
+            Interpolation order used to resize images to `target_shape`.
+        cache : ImageCache or None
+            A cache of decoded images.
 
         Raises
         ------
         NotImplementedError
             If this method is not defined in a child class
         """
-        _ = self, ix, src, dst, fmt
+        _ = self, ix, src, dst, fmt, target_shape, mode, resample, cache
         raise NotImplementedError("Must be implemented in a child class")
 
+    @staticmethod
+    def _open_image(path, target_shape=None, mode=None, resample=0):
+        """ Open an image and decode it at a given size and mode.
+
+        JPEG images are decoded with `PIL.Image.draft`, which scales images down by a power of 2
+        while decoding (in the DCT domain) to the smallest size which is not less than `target_shape`
+        and converts them to `mode` on the fly. So only the remaining resize is done on decoded pixels.
+        For other formats `draft` has no effect and images are decoded at full resolution.
+        Palette images are converted to RGB unless `mode` is given.
+        """
+        image = PIL.Image.open(path)
+        if mode is None and image.mode == 'P':
+            mode = 'RGB'
+        if target_shape is None and mode is None:
+            return image
+        target_shape = tuple(target_shape) if target_shape is not None else None
+        source = image
+        image.draft(mode, target_shape)
+        if mode is not None and image.mode != mode:
+            image = image.convert(mode)
+        if target_shape is not None and image.size != target_shape:
+            image = image.resize(target_shape, resample=resample)
+        if image is not source:
+            source.close()
+        return image
+
+    def _decode_image(self, path, target_shape=None, mode=None, resample=0, cache=None):
+        """ Decode an image into an array, possibly taking it from a cache of decoded images """
+        def _decode():
+            with self._open_image(path, target_shape, mode, resample) as image:
+                return np.asarray(image)
+
+        if cache is None:
+            return _decode()
+        return cache.get(path, _decode, params=(tuple(target_shape or ()), mode, resample))
+
     @action
     def load(self, *args, src=None, fmt=None, components=None, **kwargs):
         """ Load data.
@@ -191,14 +492,49 @@ class BaseImagesBatch(Batch):
             Format of the file to download.
         components : str, sequence
             components to download.
+        target_shape : sequence
+            Only for `fmt='image'`. Size of loaded images in the form (width, height),
+            or (rows, columns) for :class:`ArrayImagesBatch` (as all its shapes).
+            JPEG images are decoded at a reduced resolution (see `PIL.Image.draft`), which is
+            several times faster than decoding a large image and resizing it afterwards.
+        mode : str
+            Only for `fmt='image'`. PIL mode to decode images to, e.g. 'L' for grayscale images.
+        resample : int
+            Only for `fmt='image'`. Interpolation order used to resize images to `target_shape`.
+        cache : ImageCache
+            Only for `fmt='image'`. A cache of decoded images, which might be shared
+            by several pipelines, threads or processes (see :class:`~batchflow.ImageCache`).
+
+        Examples
+        --------
+        Load large photos as 224x224 images::
+
+            batch.load(fmt='image', components='images', target_shape=(224, 224))
+
+        Decode each image only once across epochs::
+
+            cache = ImageCache(max_bytes=8 * 2**30)
+            batch.load(fmt='image', components='images', cache=cache)
         """
         if fmt == 'image':
-            return self._load_image(src, fmt=fmt, dst=components)
+            return self._load_image(src, fmt=fmt, dst=components, **kwargs)
         return super().load(src=src, fmt=fmt, components=components, *args, **kwargs)
 
 
-    def _dump_image(self, ix, src='images', dst=None, fmt=None):
-        """ Saves image to dst.
+    def _image_to_dump(self, ix, src='images'):
+        """ Return an image to save (a PIL image or an array of shape (rows, columns) or (rows, columns, channels))
+
+        Raises
+        ------
+        NotImplementedError
+            If this method is not defined in a child class
+        """
+        _ = self, ix, src
+        raise NotImplementedError("Must be implemented in a child class")
+
+    def _dump_image(self, src='images', dst=None, ext='png', n_workers=None, shard_size=None, stats=None,
+                    **codec_params):
+        """ Encode images and save them into separate files or tar archives.
 
         .. note:: Please note that ``src`` must be ``str`` only, sequence is not allowed here.
 
@@ -207,15 +543,57 @@ class BaseImagesBatch(Batch):
         src : str
             Component to get images from.
         dst : str
-            Folder where to dump. If dst is None then it is determined from index.
-
-        Raises
-        ------
-        NotImplementedError
-            If this method is not defined in a child class
+            Folder where to dump.
+        ext : str
+            Format of saved images, e.g. 'png', 'jpg' or 'webp'.
+        n_workers : int, concurrent.futures.Executor or None
+            The number of processes to encode images in or an executor to use.
+            If None, images are encoded in threads, and if 1, in the current thread.
+            Thread and process pools are created once, reused across batches and shut down at exit,
+            while a given executor is owned by the caller.
+        shard_size : int or None
+            If given, encoded images are grouped into tar archives of `shard_size` images
+            named after the first item in the archive, e.g. ``dst/<index>.tar``.
+        stats : dict or None
+            A dict to accumulate throughput statistics in, e.g. a pipeline variable.
+        codec_params
+            Encoder parameters passed to `PIL.Image.save`,
+            e.g. `compress_level` for PNG, `quality` for JPEG and WebP or `lossless` for WebP.
         """
-        _ = self, ix, src, dst, fmt
-        raise NotImplementedError("Must be implemented in a child class")
+        if dst is None:
+            raise RuntimeError('You must specify `dst`')
+        start = time.perf_counter()
+        images = [self._image_to_dump(ix, src) for ix in self.indices]
+        names = ['%s.%s' % (ix, ext) for ix in self.indices]
+        if shard_size is None:
+            paths = [os.path.join(dst, name) for name in names]
+        else:
+            paths = [None] * len(images)
+
+        save = partial(_save_image, ext=ext, **codec_params)
+        if n_workers == 1:
+            results = [save(image, path) for image, path in zip(images, paths)]
+        else:
+            chunksize = max(1, len(images) // (4 * n_workers)) if isinstance(n_workers, int) else 1
+            executor = n_workers if isinstance(n_workers, cf.Executor) else _get_executor(n_workers)
+            results = list(executor.map(save, images, paths, chunksize=chunksize))
+
+        n_shards = 0
+        if shard_size is None:
+            n_bytes = sum(results)
+        else:
+            n_bytes = sum(len(data) for data in results)
+            for i in range(0, len(results), shard_size):
+                path = os.path.join(dst, '%s.tar' % self.indices[i])
+                _write_shard(path, names[i:i + shard_size], results[i:i + shard_size])
+                n_shards += 1
+
+        if stats is not None:
+            for key, value in dict(images=len(images), bytes=n_bytes, shards=n_shards,
+                                   seconds=time.perf_counter() - start).items():
+                stats[key] = stats.get(key, 0) + value
+            stats['images_per_second'] = stats['images'] / stats['seconds'] if stats['seconds'] > 0 else 0.
+        return self
 
     @action
     def dump(self, *args, dst=None, fmt=None, components="images", **kwargs):
@@ -234,18 +612,36 @@ class BaseImagesBatch(Batch):
         components : str, sequence
             Components to save.
         ext: str
-            Format to save images to.
+            Only for `fmt='image'`. Format to save images to, e.g. 'png' (default), 'jpg' or 'webp'.
+        n_workers : int or concurrent.futures.Executor
+            Only for `fmt='image'`. The number of processes to encode images in or an executor to use.
+            By default, images are encoded in threads.
+        shard_size : int
+            Only for `fmt='image'`. The number of images to group into one tar archive.
+        stats : dict
+            Only for `fmt='image'`. A dict to accumulate the number of images, bytes, shards,
+            seconds spent and images per second in.
+        kwargs
+            Only for `fmt='image'`. Encoder parameters, e.g. `compress_level` for PNG,
+            `quality` for JPEG and WebP or `lossless` for WebP (see `PIL.Image.save`).
 
         Returns
         -------
         self
+
+        Examples
+        --------
+        Save masks as fast PNG files in 4 processes grouped into archives of 1000 images::
+
+            batch.dump(fmt='image', components='masks', dst='/masks', ext='png', compress_level=1,
+                       n_workers=4, shard_size=1000, stats=stats)
         """
         if fmt == 'image':
-            return self._dump_image(components, dst, fmt=kwargs.pop('ext'))
+            return self._dump_image(components, dst, **kwargs)
         return super().dump(dst=dst, fmt=fmt, components=components, *args, **kwargs)
 
 
-@transform_actions(prefix='_', suffix='_all', wrapper='apply_transform_all')
+@transform_actions(prefix='_', suffix='_all', wrapper='apply_transform_all', target=None)
 @transform_actions(prefix='_', suffix='_', wrapper='apply_transform')
 @add_methods(transformations={**get_scipy_transforms(),
                               'pad': np.pad,
@@ -267,24 +663,81 @@ class ImagesBatch(BaseImagesBatch):
 
     Pixel's position is defined as (x, y)
     """
+    transform_targets = {**{name: 'threads' for name in ['scale', 'rotate', 'resize', 'transform', 'filter', 'shift',
+                                                          'multiply_lightness', 'pil_convert', 'multiply', 'add',
+                                                          'clip', 'additive_noise', 'multiplicative_noise',
+                                                          'elastic_transform']},
+                         **{'sp_' + name: 'threads' for name in [*get_scipy_transforms(), 'pad', 'resize']}}
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name == '_data':
+            self.__dict__.pop('_shapes', None)
+        elif self.components is not None and name in self.components:    # pylint: disable=unsupported-membership-test
+            self.__dict__.get('_shapes', {}).pop(name, None)
+
     @classmethod
     def _get_image_shape(cls, image):
         if isinstance(image, PIL.Image.Image):
             return image.size
         return image.shape[:2]
 
+    @classmethod
+    def _get_full_shape(cls, image):
+        """ Return (width, height, channels) of a PIL image or (rows, columns, channels) of an array """
+        if isinstance(image, PIL.Image.Image):
+            return (*image.size, len(image.getbands()))
+        return (*image.shape[:2], image.shape[2] if image.ndim > 2 else 1)
+
+    def get_shapes(self, src='images'):
+        """ Return shapes of all images in a component.
+
+        Shapes are cached until the component is assigned a new value
+        (so they are not updated when images are changed in-place).
+
+        Parameters
+        ----------
+        src : str
+            Component to get images from.
+
+        Returns
+        -------
+        np.ndarray
+            An array of shape (batch_size, 3) with (width, height, channels) of PIL images
+            or (rows, columns, channels) of array images.
+        """
+        return self._get_shapes(src)[0]
+
+    def _get_shapes(self, src='images'):
+        """ Return cached shapes of images in a component and whether they are all the same """
+        shapes = self.__dict__.setdefault('_shapes', {})
+        if src not in shapes:
+            shapes[src] = self._calc_shapes(getattr(self, src))
+        return shapes[src]
+
+    def _calc_shapes(self, images):
+        """ Return shapes of images and whether they are all the same """
+        if isinstance(images, np.ndarray) and images.dtype != object:
+            shapes = np.empty((len(images), 3), dtype=np.int64)
+            shapes[:] = self._get_full_shape(images[0]) if len(images) > 0 else 0
+            return shapes, True
+        shapes = np.array([self._get_full_shape(image) for image in images], dtype=np.int64).reshape(-1, 3)
+        return shapes, len(shapes) == 0 or bool((shapes == shapes[0]).all())
+
     @property
     def image_shape(self):
         """: tuple - shape of the image"""
-        _, shapes_count = np.unique([image.size for image in self.images], return_counts=True, axis=0)
-        if len(shapes_count) == 1:
-            if isinstance(self.images[0], PIL.Image.Image):
-                return (*self.images[0].size, len(self.images[0].getbands()))
-            return self.images[0].shape
+        shapes, uniform = self._get_shapes('images')
+        if uniform:
+            image = self.images[0]
+            if isinstance(image, PIL.Image.Image):
+                return tuple(shapes[0])
+            return image.shape
         raise RuntimeError('Images have different shapes')
 
     @inbatch_parallel(init='indices', post='_assemble')
-    def _load_image(self, ix, src=None, fmt=None, dst="images"):
+    def _load_image(self, ix, src=None, fmt=None, dst="images", target_shape=None, mode=None, resample=0,
+                    cache=None):
         """ Loads image
 
         .. note:: Please note that ``dst`` must be ``str`` only, sequence is not allowed here.
@@ -297,29 +750,23 @@ class ImagesBatch(BaseImagesBatch):
             Component to write images to.
         fmt : str
             Format of an image.
+        target_shape : sequence or None
+            Size of loaded images in the form (width, height).
+        mode : str or None
+            PIL mode of loaded images.
+        resample : int
+            Interpolation order used to resize images to `target_shape`.
+        cache : ImageCache or None
+            A cache of decoded images.
         """
-        return PIL.Image.open(self._make_path(ix, src))
+        path = self._make_path(ix, src)
+        if cache is None:
+            return self._open_image(path, target_shape, mode, resample)
+        return PIL.Image.fromarray(self._decode_image(path, target_shape, mode, resample, cache))
 
-    @inbatch_parallel(init='indices')
-    def _dump_image(self, ix, src='images', dst=None, fmt=None):
-        """ Saves image to dst.
-
-        .. note:: Please note that ``src`` must be ``str`` only, sequence is not allowed here.
-
-        Parameters
-        ----------
-        src : str
-            Component to get images from.
-        dst : str
-            Folder where to dump.
-        fmt : str
-            Format of saved image.
-        """
-        if dst is None:
-            raise RuntimeError('You must specify `dst`')
-        image = self.get(ix, src)
-        ix = str(ix) + '.' + fmt if fmt is not None else str(ix)
-        image.save(os.path.join(dst, ix))
+    def _image_to_dump(self, ix, src='images'):
+        """ Return an image to save """
+        return self.get(ix, src)
 
     def _assemble_component(self, result, *args, component='images', **kwargs):
         """ Assemble one component after parallel execution.
@@ -334,15 +781,25 @@ class ImagesBatch(BaseImagesBatch):
             If True then all images are cropped from the top left corner to have similar shapes.
             Shape is chosen to be minimal among given images.
         """
-        if isinstance(result[0], PIL.Image.Image):
-            setattr(self, component, np.asarray(result, dtype=object))
+        _ = args, kwargs
+        is_pil = isinstance(result[0], PIL.Image.Image)
+        shapes = None
+        if is_pil or np.ndim(result[0]) > 1:
+            # shapes are calculated once both to choose how to store images and for `get_shapes`
+            shapes = self._calc_shapes(result)
+            same_shapes = shapes[1] and len({np.ndim(item) for item in result}) == 1
+        else:
+            same_shapes = len({np.shape(item) for item in result}) == 1
+
+        if same_shapes and not is_pil:
+            images = np.stack(result)
         else:
-            try:
-                setattr(self, component, np.stack(result))
-            except ValueError:
-                array_result = np.empty(len(result), dtype=object)
-                array_result[:] = result
-                setattr(self, component, array_result)
+            images = np.empty(len(result), dtype=object)
+            for i, item in enumerate(result):
+                images[i] = item
+        setattr(self, component, images)
+        if shapes is not None:
+            self.__dict__.setdefault('_shapes', {})[component] = shapes
 
     def _to_array_(self, image, dtype=None, channels='last'):
         """converts images in Batch to np.ndarray format
@@ -428,8 +885,8 @@ class ImagesBatch(BaseImagesBatch):
             elif origin == 'center':
                 origin = np.maximum(0, np.asarray(background_shape) - image_shape) // 2
             elif origin == 'random':
-                origin = (np.random.randint(background_shape[0]-image_shape[0]+1),
-                          np.random.randint(background_shape[1]-image_shape[1]+1))
+                origin = (self.random.integers(background_shape[0]-image_shape[0]+1),
+                          self.random.integers(background_shape[1]-image_shape[1]+1))
         return np.asarray(origin, dtype=np.int)
 
     def _scale_(self, image, factor, preserve_shape=False, origin='center', resample=0):
@@ -777,7 +1234,7 @@ class ImagesBatch(BaseImagesBatch):
             Probability of applying the transform. Default is 1.
         """
         mask_size = np.asarray(self._get_image_shape(image))
-        mask_salt = np.random.binomial(1, p_noise, size=mask_size).astype(bool)
+        mask_salt = self.random.binomial(1, p_noise, size=mask_size).astype(bool)
         image = np.array(image)
         if isinstance(size, (tuple, int)) and size in [1, (1, 1)] and not callable(color):
             image[mask_salt] = color
@@ -966,23 +1423,30 @@ class ImagesBatch(BaseImagesBatch):
         image.paste(PIL.Image.new('RGB', tuple(shape), tuple(color)), tuple(origin))
         return image
 
-    def _assemble_patches(self, patches, *args, dst, **kwargs):
+    def _assemble_patches(self, all_results, *args, dst=None, src='images', coordinates=None, **kwargs):
         """ Assembles patches after parallel execution.
 
         Parameters
         ----------
-        patches : sequence
-            Patches to gather. pathces.shape must be like (batch.size, patches_i, patch_height, patch_width, n_channels)
+        all_results : sequence
+            Pairs of patches and their coordinates for each image.
         dst : str
             Component to put patches in.
+        coordinates : str or None
+            Component to put patches' coordinates in.
         """
         _ = args, kwargs
-        new_items = np.concatenate(patches)
-        setattr(self, dst, new_items)
+        if any_action_failed(all_results):
+            raise RuntimeError("Could not assemble the batch") from self.get_errors(all_results)[0]
+        patches, patch_coordinates = zip(*all_results)
+        setattr(self, dst or src, np.concatenate(patches))
+        if coordinates is not None:
+            setattr(self, coordinates, np.concatenate(patch_coordinates))
 
     @action
     @inbatch_parallel(init='indices', post='_assemble_patches')
-    def split_to_patches(self, ix, patch_shape, stride=1, drop_last=False, src='images', dst=None):
+    def split_to_patches(self, ix, patch_shape, stride=1, drop_last=False, src='images', dst=None,
+                         coordinates=None, as_array=False):
         """ Splits image to patches.
 
         Small images with the same shape (``patch_shape``) are cropped from the original one with stride ``stride``.
@@ -999,35 +1463,28 @@ class ImagesBatch(BaseImagesBatch):
         src : str
             Component to get images from. Default is 'images'.
         dst : str
-            Component to write images to. Default is 'images'.
-        p : float
-            Probability of applying the transform. Default is 1.
+            Component to write patches to. Default is `src`.
+        coordinates : str or None
+            Component to write patches' coordinates to. Coordinates are stored as an array of shape (n_patches, 3)
+            with an image position in the batch and a row and a column of a patch's upper-left corner.
+        as_array : bool
+            If True, patches are stored as one array of shape (n_patches, patch_rows, patch_columns, channels)
+            instead of an array of `PIL.Image`. It is much faster when there are many patches.
+
+        See also
+        --------
+        :func:`extract_patches`
         """
-        _ = dst
-        image = self.get(ix, src)
-        image_shape = self._get_image_shape(image)
-        image = np.array(image)
-        stride = (stride, stride) if isinstance(stride, Number) else stride
-        patch_shape = (patch_shape, patch_shape) if isinstance(patch_shape, Number) else patch_shape
-        patches = []
-
-        def _iterate_columns(row_from, row_to):
-            column = 0
-            while column < image_shape[1]-patch_shape[1]+1:
-                patches.append(PIL.Image.fromarray(image[row_from:row_to, column:column+patch_shape[1]]))
-                column += stride[1]
-            if not drop_last and column + patch_shape[1] != image_shape[1]:
-                patches.append(PIL.Image.fromarray(image[row_from:row_to,
-                                                         image_shape[1]-patch_shape[1]:image_shape[1]]))
-
-        row = 0
-        while row < image_shape[0]-patch_shape[0]+1:
-            _iterate_columns(row, row+patch_shape[0])
-            row += stride[0]
-        if not drop_last and row + patch_shape[0] != image_shape[0]:
-            _iterate_columns(image_shape[0]-patch_shape[0], image_shape[0])
-
-        return np.array(patches, dtype=object)
+        _ = dst, coordinates
+        pos = self.get_pos(None, src, ix)
+        image = np.asarray(getattr(self, src)[pos])
+        patches, patch_coordinates = extract_patches(image, patch_shape, stride, drop_last)
+        patch_coordinates = np.insert(patch_coordinates, 0, pos, axis=1)
+        if not as_array:
+            pil_patches = np.empty(len(patches), dtype=object)
+            pil_patches[:] = [PIL.Image.fromarray(patch) for patch in patches]
+            patches = pil_patches
+        return patches, patch_coordinates
 
     def _additive_noise_(self, image, noise, clip=False, preserve_type=False):
         """ Add additive noise to an image.
@@ -1073,7 +1530,7 @@ class ImagesBatch(BaseImagesBatch):
         noise = noise(size=(*image.size, len(image.getbands())) if isinstance(image, PIL.Image.Image) else image.shape)
         return self._multiply_(image, noise, clip, preserve_type)
 
-    def _elastic_transform_(self, image, alpha, sigma, **kwargs):
+    def _elastic_transform_(self, image, alpha, sigma, pool_size=None, **kwargs):
         """Elastic deformation of images as described in [Simard2003]_.
         [Simard2003] Simard, Steinkraus and Platt, "Best Practices for
         Convolutional Neural Networks applied to Visual Document Analysis", in
@@ -1088,6 +1545,9 @@ class ImagesBatch(BaseImagesBatch):
             maximum of vectors' norms.
         sigma : number
             Smooth factor.
+        pool_size : int or None
+            If given, displacement fields are taken from a pool of `pool_size` precomputed fields
+            (randomly flipped and negated) instead of filtering new random fields for each image.
         src : str
             Component to get images from. Default is 'images'.
         dst : str
@@ -1096,24 +1556,805 @@ class ImagesBatch(BaseImagesBatch):
             Probability of applying the transform. Default is 1.
         """
         image = np.array(image)
-        # full shape is needed
-        shape = image.shape
-        if len(shape) == 2:
+        if image.ndim == 2:
             image = image[..., None]
-            shape = image.shape
 
         kwargs.setdefault('mode', 'constant')
         kwargs.setdefault('cval', 0)
 
-        column_shift = self._sp_gaussian_filter_(np.random.uniform(-1, 1, size=shape), sigma, **kwargs) * alpha
-        row_shift = self._sp_gaussian_filter_(np.random.uniform(-1, 1, size=shape), sigma, **kwargs) * alpha
+        coordinates = _displacement_fields(1, image.shape[:2], sigma, pool_size, random=self.random, **kwargs)[0]
+        coordinates *= alpha
+        coordinates += _coordinate_grid(image.shape[:2])
+
+        distorted_image = np.empty_like(image, dtype=np.uint8)
+        for channel in range(image.shape[-1]):
+            scipy.ndimage.map_coordinates(image[..., channel], coordinates, output=distorted_image[..., channel],
+                                          order=1, mode='reflect')
+
+        if image.shape[-1] == 1:
+            return PIL.Image.fromarray(distorted_image[..., 0])
+        return PIL.Image.fromarray(distorted_image)
 
-        row, column, channel = np.meshgrid(range(shape[0]), range(shape[1]), range(shape[2]))
+    @action
+    def affine(self, transforms, src='images', dst='images', resample=0, target='threads', **kwargs):
+        """ Apply a chain of geometric transforms with a single resampling of each image.
 
-        indices = (column + column_shift, row + row_shift, channel)
+        Transformation matrices of all transforms are multiplied first, and then each image
+        is resampled once with `PIL.Image.transform`. It is faster than a chain of
+        separate actions and does not blur images with repeated interpolation.
 
-        distored_image = self._sp_map_coordinates_(image, indices, order=1, mode='reflect')
+        Parameters
+        ----------
+        transforms : sequence
+            Transforms to apply in the given order. Each transform is either a name or a tuple (name, params).
+            Parameters could be numbers or arrays with a value for each item in the batch
+            (e.g. ``R('uniform', -30, 30, size=B('size'))``). Each transform can have a probability ``p``.
+            Coordinates, offsets and shapes are given in the form (x, y) as in other `ImagesBatch` actions.
+
+            - ('rotate', dict(angle)) - rotate images around their centers by `angle` degrees counter clockwise
+            - ('scale', dict(factor)) - scale images around their centers preserving their shapes,
+              `factor` is a number or a pair of numbers
+            - ('shift', dict(offset)) - shift images by `offset` pixels
+            - ('flip', dict(mode)) - flip images, `mode` is 'lr' (default) or 'ud'
+            - ('crop', dict(origin, shape)) - crop images with a box of a given shape,
+              origin is 'top_left', 'center', 'random' or coordinates of the upper-left corner
+
+        resample : int
+            Interpolation order passed to `PIL.Image.transform`.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        target : str
+            Parallelization target.
+        kwargs
+            Other parameters passed to `PIL.Image.transform` (e.g. `fillcolor`).
+
+        Examples
+        --------
+        ::
+
+            pipeline
+                .affine([('rotate', dict(angle=R('uniform', -15, 15, size=B('size')), p=.5)),
+                         ('scale', dict(factor=1.2)),
+                         ('flip', dict(mode='lr', p=.5)),
+                         ('crop', dict(origin='random', shape=(224, 224)))])
+        """
+        images = getattr(self, src)
+        n_images = len(images)
+        shapes = self.get_shapes(src)[:, :2].astype(np.float64)
+        matrices = np.tile(np.eye(3), (n_images, 1, 1))
+
+        for transform in transforms:
+            name, params = (transform, {}) if isinstance(transform, str) else transform
+            params = dict(params)
+            p = params.pop('p', None)
+            method = getattr(self, '_affine_' + name, None)
+            if method is None:
+                raise ValueError("Unknown affine transform: %s" % name)
+            transform_matrices, new_shapes = method(shapes, **params)
+            if p is not None:
+                skip = self.random.random(n_images) >= p
+                transform_matrices[skip] = np.eye(3)
+                new_shapes[skip] = shapes[skip]
+            matrices = np.matmul(transform_matrices, matrices)
+            shapes = new_shapes
+
+        inverse = np.linalg.inv(matrices)
+        return self._affine_transform(inverse, np.round(shapes).astype(np.int64), src=src, dst=dst,
+                                      resample=resample, target=target, **kwargs)
+
+    @inbatch_parallel(init='indices', post='_assemble')
+    def _affine_transform(self, ix, inverse, shapes, src='images', dst='images', resample=0, **kwargs):
+        """ Resample an image with an inverse affine matrix """
+        _ = dst
+        pos = self.get_pos(None, src, ix)
+        image = getattr(self, src)[pos]
+        return image.transform(tuple(shapes[pos]), PIL.Image.AFFINE, data=tuple(inverse[pos, :2].ravel()),
+                               resample=resample, **kwargs)
+
+    @staticmethod
+    def _affine_about_center(shapes, linear):
+        """ Return matrices of linear transforms about image centers """
+        centers = shapes / 2
+        matrices = np.tile(np.eye(3), (len(shapes), 1, 1))
+        matrices[:, :2, :2] = linear
+        matrices[:, :2, 2] = centers - np.einsum('nij,nj->ni', linear, centers)
+        return matrices
+
+    @staticmethod
+    def _affine_params(value, n_images, size=None):
+        """ Broadcast a parameter to a value (or a pair of values if `size=2`) for each image """
+        value = np.asarray(value, dtype=np.float64)
+        if size is None:
+            return np.broadcast_to(value, (n_images,))
+        if value.ndim == 1 and len(value) == n_images and value.shape != (size,):
+            value = value[:, None]
+        return np.broadcast_to(value, (n_images, size))
+
+    def _affine_rotate(self, shapes, angle):
+        """ Rotation matrices """
+        angle = np.radians(self._affine_params(angle, len(shapes)))
+        cos, sin = np.cos(angle), np.sin(angle)
+        linear = np.stack([np.stack([cos, sin], axis=-1), np.stack([-sin, cos], axis=-1)], axis=1)
+        return self._affine_about_center(shapes, linear), shapes.copy()
+
+    def _affine_scale(self, shapes, factor):
+        """ Scaling matrices """
+        factor = self._affine_params(factor, len(shapes), size=2)
+        linear = np.zeros((len(shapes), 2, 2))
+        linear[:, 0, 0], linear[:, 1, 1] = factor[:, 0], factor[:, 1]
+        return self._affine_about_center(shapes, linear), shapes.copy()
+
+    def _affine_flip(self, shapes, mode='lr'):
+        """ Flipping matrices """
+        if mode not in ['lr', 'ud']:
+            raise ValueError("mode must be one of ['lr', 'ud']")
+        linear = np.tile(np.eye(2), (len(shapes), 1, 1))
+        axis = 0 if mode == 'lr' else 1
+        linear[:, axis, axis] = -1
+        return self._affine_about_center(shapes, linear), shapes.copy()
+
+    def _affine_shift(self, shapes, offset):
+        """ Translation matrices """
+        matrices = np.tile(np.eye(3), (len(shapes), 1, 1))
+        matrices[:, :2, 2] = self._affine_params(offset, len(shapes), size=2)
+        return matrices, shapes.copy()
+
+    def _affine_crop(self, shapes, origin, shape):
+        """ Cropping matrices and new image shapes """
+        shape = self._affine_params(shape, len(shapes), size=2)
+        if isinstance(origin, str):
+            if origin == 'top_left':
+                origin = np.zeros_like(shapes)
+            elif origin == 'center':
+                origin = np.maximum(0, shapes - shape) // 2
+            elif origin == 'random':
+                origin = np.floor(self.random.random(shapes.shape) * (np.maximum(shapes - shape, 0) + 1))
+            else:
+                raise ValueError("origin should be one of 'top_left', 'center', 'random' or a sequence")
+        matrices = np.tile(np.eye(3), (len(shapes), 1, 1))
+        matrices[:, :2, 2] = -self._affine_params(origin, len(shapes), size=2)
+        return matrices, shape.copy()
+
+
+@transform_actions(prefix='_', suffix='_all', wrapper='apply_transform_all', target=None)
+class ArrayImagesBatch(BaseImagesBatch):
+    """ Batch class for 2D images of the same shape stored in one array.
+
+    Images are stored as a contiguous numpy array of shape `(batch_size, rows, columns, channels)`
+    (e.g. of `np.uint8` or `np.float32` type). All transforms process the whole batch at once
+    with vectorized numpy and scipy operations, so there is no per-image python overhead,
+    which prevails for small images (e.g. MNIST or CIFAR).
+
+    `PIL.Image` is used only to decode images in :meth:`load` and to encode them in :meth:`dump`.
+    If loaded images have different shapes, they are kept in an object array and
+    should be brought to the same shape (e.g. with :class:`ImagesBatch`) before transforms.
+
+    All coordinates and shapes are given in the form of (row, column).
+
+    If ``p`` is passed to a transform, it is applied only to randomly chosen images.
+    Transforms which change image shape do not support ``p``.
+    """
+    @property
+    def image_shape(self):
+        """: tuple - shape of the image in the form (rows, columns, channels) """
+        if self.images.dtype == object:
+            raise RuntimeError('Images have different shapes')
+        return self.images.shape[1:]
+
+    @inbatch_parallel(init='indices', post='_assemble')
+    def _load_image(self, ix, src=None, fmt=None, dst="images", target_shape=None, mode=None, resample=0,
+                    cache=None):
+        """ Loads image into an array of shape (rows, columns, channels)
+
+        .. note:: Please note that ``dst`` must be ``str`` only, sequence is not allowed here.
+
+        Parameters
+        ----------
+        src : str, dataset.FilesIndex, None
+            Path to the folder with an image. If src is None then it is determined from the index.
+        dst : str
+            Component to write images to.
+        fmt : str
+            Format of an image.
+        target_shape : sequence or None
+            Size of loaded images in the form (rows, columns).
+        mode : str or None
+            PIL mode of loaded images.
+        resample : int
+            Interpolation order used to resize images to `target_shape`.
+        cache : ImageCache or None
+            A cache of decoded images.
+        """
+        # PIL takes sizes as (width, height)
+        target_shape = tuple(target_shape[::-1]) if target_shape is not None else None
+        image = self._decode_image(self._make_path(ix, src), target_shape, mode, resample, cache)
+        return image[..., None] if image.ndim == 2 else image
+
+    def _image_to_dump(self, ix, src='images'):
+        """ Return an image to save without a single channel axis """
+        image = self.get(ix, src)
+        if image.ndim == 3 and image.shape[-1] == 1:
+            image = image[..., 0]
+        return image
+
+    @staticmethod
+    def _transform_items(images, indices, func, *args, **kwargs):
+        """ Apply a batch transform to images at given positions only (or to all images if indices is None) """
+        if indices is None:
+            return func(images, *args, **kwargs)
+        if len(indices) == 0:
+            return images
+        transformed = func(images[indices], *args, **kwargs)
+        if transformed.shape[1:] != images.shape[1:]:
+            raise ValueError("Transforms which change image shape cannot be applied with probability `p`")
+        result = images.astype(transformed.dtype)
+        result[indices] = transformed
+        return result
+
+    def _calc_origins(self, n_images, image_shape, shape, origin):
+        """ Calculate upper-left corners of windows of a given shape for each image.
+
+        Returns
+        -------
+        np.ndarray of shape (n_images, 2)
+        """
+        image_shape, shape = np.asarray(image_shape[:2]), np.asarray(shape)
+        if isinstance(origin, str):
+            if origin == 'top_left':
+                origin = np.zeros(2, dtype=np.intp)
+            elif origin == 'center':
+                origin = (image_shape - shape) // 2
+            elif origin == 'random':
+                high = np.maximum(image_shape - shape, 0) + 1
+                return (self.random.random((n_images, 2)) * high).astype(np.intp)
+            else:
+                raise ValueError("origin should be one of 'top_left', 'center', 'random' or a sequence")
+        return np.broadcast_to(np.asarray(origin, dtype=np.intp), (n_images, 2))
+
+    @staticmethod
+    def _window_mask(n_images, image_shape, origins, shape):
+        """ Return a boolean mask of shape (n_images, rows, columns) which is True inside the windows """
+        rows = np.arange(image_shape[0]) - origins[:, :1]
+        columns = np.arange(image_shape[1]) - origins[:, 1:]
+        rows = (rows >= 0) & (rows < shape[0])
+        columns = (columns >= 0) & (columns < shape[1])
+        return (rows[:, :, None] & columns[:, None, :]).reshape(n_images, *image_shape[:2])
+
+    def _crop_all(self, images, origin, shape, indices=None):
+        """ Crop images.
+
+        Parameters
+        ----------
+        origin : sequence, str
+            Upper-left corner of the cropping box. Can be one of:
+
+            - sequence - corner's coordinates in the form of (row, column)
+            - 'top_left' - crop images such that upper-left corners of an image and the cropping box coincide
+            - 'center' - crop images such that centers of an image and the cropping box coincide
+            - 'random' - place the upper-left corner of the cropping box at a random position for each image
+        shape : sequence
+            Crop size in the form of (rows, columns). It should not exceed the image shape.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        """
+        if indices is not None:
+            raise ValueError("Transforms which change image shape cannot be applied with probability `p`")
+        shape = tuple(shape)
+        if shape[0] > images.shape[1] or shape[1] > images.shape[2]:
+            raise ValueError("Crop shape %s exceeds image shape %s" % (shape, images.shape[1:3]))
+        origins = self._calc_origins(len(images), images.shape[1:], shape, origin)
+        if isinstance(origin, str) and origin == 'random':
+            rows = origins[:, :1] + np.arange(shape[0])
+            columns = origins[:, 1:] + np.arange(shape[1])
+            batch = np.arange(len(images))[:, None, None]
+            return images[batch, rows[:, :, None], columns[:, None, :]]
+        row, column = np.clip(origins[0], 0, np.asarray(images.shape[1:3]) - shape)
+        return images[:, row:row + shape[0], column:column + shape[1]].copy()
+
+    def _resize_all(self, images, shape, order=1, indices=None, **kwargs):
+        """ Resize images to a given shape with spline interpolation (see `scipy.ndimage.zoom`).
+
+        Parameters
+        ----------
+        shape : sequence
+            Resulting shape in the form of (rows, columns).
+        order : int
+            Interpolation order (0 - nearest, 1 - bilinear, 3 - bicubic).
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        """
+        if indices is not None:
+            raise ValueError("Transforms which change image shape cannot be applied with probability `p`")
+        if tuple(shape) == images.shape[1:3]:
+            return images
+        factor = np.asarray(shape) / images.shape[1:3]
+        return scipy.ndimage.zoom(images, (1, *factor, 1), order=order, **kwargs)
+
+    def _scale_all(self, images, factor, preserve_shape=False, origin='center', order=0, indices=None):
+        """ Scale the content of images.
+
+        Parameters
+        -----------
+        factor : float, sequence
+            resulting shape is obtained as original_shape * factor
+
+            - float - scale all axes with the given factor
+            - sequence (factor_1, factort_2) - scale each axis with the given factor separately
+        preserve_shape : bool
+            whether to preserve the shape of images after scaling (with cropping or zero padding)
+        origin : {'center', 'top_left'}, sequence
+            Relevant only if `preserve_shape` is True.
+            Position of the scaled images with respect to the original one's shape.
+        order : int
+            Interpolation order.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform (only with `preserve_shape=True`). Default is 1.
+        """
+        def _scale(images):
+            original_shape = images.shape[1:3]
+            rescaled_shape = np.int32(np.ceil(np.asarray(original_shape) * factor))
+            rescaled = self._resize_all(images, rescaled_shape, order=order)
+            if preserve_shape:
+                rescaled = self._fit(rescaled, original_shape, origin)
+            return rescaled
+        return self._transform_items(images, indices, _scale)
+
+    def _fit(self, images, shape, origin='center'):
+        """ Crop or zero pad images to a given shape """
+        shape = np.asarray(shape)
+        image_shape = np.asarray(images.shape[1:3])
+        if np.any(image_shape > shape):
+            images = self._crop_all(images, 'center' if origin == 'center' else 'top_left',
+                                    np.minimum(image_shape, shape))
+            image_shape = np.asarray(images.shape[1:3])
+        if np.any(image_shape < shape):
+            row, column = self._calc_origins(1, shape, image_shape, origin)[0]
+            result = np.zeros((len(images), *shape, images.shape[-1]), dtype=images.dtype)
+            result[:, row:row + image_shape[0], column:column + image_shape[1]] = images
+            images = result
+        return images
+
+    def _pad_all(self, images, offset, mode='constant', indices=None, **kwargs):
+        """ Pad images along rows and columns with `np.pad`.
+
+        Parameters
+        ----------
+        offset : int, sequence
+            Size of the borders in pixels. An int for all borders or a sequence in the order (left, top, right, bottom).
+        mode : str
+            Filling mode (see `np.pad`).
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        """
+        if indices is not None:
+            raise ValueError("Transforms which change image shape cannot be applied with probability `p`")
+        left, top, right, bottom = (offset,) * 4 if isinstance(offset, Number) else offset
+        return np.pad(images, ((0, 0), (top, bottom), (left, right), (0, 0)), mode=mode, **kwargs)
+
+    def _flip_all(self, images, mode='lr', indices=None):
+        """ Flip images.
+
+        Parameters
+        ----------
+        mode : {'lr', 'ud'}
+
+            - 'lr' - apply the left/right flip
+            - 'ud' - apply the upside/down flip
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        if mode not in ['lr', 'ud']:
+            raise ValueError("mode must be one of ['lr', 'ud']")
+        axis = 2 if mode == 'lr' else 1
+        return self._transform_items(images, indices, np.flip, axis=axis)
+
+    def _rotate_all(self, images, angle, order=1, mode='constant', cval=0, indices=None):
+        """ Rotate images around their centers preserving image shape.
+
+        Parameters
+        ----------
+        angle : Number
+            In degrees counter clockwise.
+        order : int
+            Interpolation order.
+        mode : str
+            How to fill points outside the boundaries (see `scipy.ndimage.rotate`).
+        cval : Number
+            Value to fill past edges if mode is 'constant'.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        def _rotate(images):
+            if angle % 180 == 0 or angle % 90 == 0 and images.shape[1] == images.shape[2]:
+                return np.rot90(images, k=int(angle // 90), axes=(1, 2))
+            return scipy.ndimage.rotate(images, angle, axes=(2, 1), reshape=False, order=order, mode=mode, cval=cval)
+        return self._transform_items(images, indices, _rotate)
+
+    def _shift_all(self, images, offset, mode='const', indices=None):
+        """ Shift images.
+
+        Parameters
+        ----------
+        offset : (Number, Number)
+            Shift in the form of (rows, columns).
+        mode : {'const', 'wrap'}
+            How to fill borders.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        def _shift(images):
+            if mode == 'wrap':
+                return np.roll(images, offset, axis=(1, 2))
+            if mode != 'const':
+                raise ValueError("mode must be one of ['const', 'wrap']")
+            result = np.zeros_like(images)
+            src_slices, dst_slices = [slice(None)], [slice(None)]
+            for shift, size in zip(offset, images.shape[1:3]):
+                shift = int(np.clip(shift, -size, size))
+                src_slices.append(slice(max(0, -shift), size - max(0, shift)))
+                dst_slices.append(slice(max(0, shift), size - max(0, -shift)))
+            result[tuple(dst_slices)] = images[tuple(src_slices)]
+            return result
+        return self._transform_items(images, indices, _shift)
+
+    def _invert_all(self, images, channels='all', max_value=255, indices=None):
+        """ Invert given channels.
+
+        Parameters
+        ----------
+        channels : int, sequence
+            Indices of the channels to invert.
+        max_value : Number
+            The maximum pixel value (e.g. 255 for `np.uint8` images or 1 for normalized images).
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        def _invert(images):
+            images = images.copy()
+            selected = slice(None) if channels == 'all' else np.atleast_1d(channels)
+            images[..., selected] = max_value - images[..., selected]
+            return images
+        return self._transform_items(images, indices, _invert)
+
+    def _multiply_all(self, images, multiplier=1., clip=False, preserve_type=False, indices=None):
+        """ Multiply each pixel by the given multiplier.
+
+        Parameters
+        ----------
+        multiplier : float, sequence
+        clip : bool
+            whether to force image's pixels to be in [0, 255] or [0, 1.]
+        preserve_type : bool
+            Whether to preserve ``dtype`` of transformed images.
+            If ``False`` is given then the resulting type will be ``np.float32``.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        return self._transform_items(images, indices, self._arithmetic, np.multiply, multiplier, clip, preserve_type)
+
+    def _add_all(self, images, term=1., clip=False, preserve_type=False, indices=None):
+        """ Add term to each pixel.
+
+        Parameters
+        ----------
+        term : float, sequence
+        clip : bool
+            whether to force image's pixels to be in [0, 255] or [0, 1.]
+        preserve_type : bool
+            Whether to preserve ``dtype`` of transformed images.
+            If ``False`` is given then the resulting type will be ``np.float32``.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        return self._transform_items(images, indices, self._arithmetic, np.add, term, clip, preserve_type)
+
+    @staticmethod
+    def _arithmetic(images, operation, value, clip, preserve_type):
+        dtype = images.dtype if preserve_type else np.float32
+        result = operation(images, np.asarray(value, dtype=np.float32), dtype=np.float32)
+        if clip or dtype == np.uint8:
+            np.clip(result, 0, 255 if images.dtype == np.uint8 else 1., out=result)
+        return result.astype(dtype, copy=False)
+
+    def _clip_all(self, images, low=0, high=255, indices=None):
+        """ Truncate image's pixels.
+
+        Parameters
+        ----------
+        low : int, float, sequence
+            Actual pixel's value is equal max(value, low). If sequence is given, then its length must coincide
+            with the number of channels in an image and each channel is thresholded separately
+        high : int, float, sequence
+            Actual pixel's value is equal min(value, high). If sequence is given, then its length must coincide
+            with the number of channels in an image and each channel is thresholded separately
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        return self._transform_items(images, indices, np.clip, low, high)
+
+    def _posterize_all(self, images, bits=4, indices=None):
+        """ Posterize `np.uint8` images, i.e. quantize pixels' values so that they have ``2^bits`` colors
+
+        Parameters
+        ----------
+        bits : int
+            Number of bits used to store a color's component.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        mask = np.uint8(~(2 ** (8 - bits) - 1) & 0xFF)
+        return self._transform_items(images, indices, np.bitwise_and, mask)
+
+    def _salt_all(self, images, p_noise=.015, color=255, indices=None):
+        """ Set random pixels to a given value.
+
+        Every pixel will be set to ``color`` value with probability ``p_noise``.
+
+        Parameters
+        ----------
+        p_noise : float
+            Probability of salting a pixel.
+        color : Number, sequence
+            Color's value.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        def _salt(images):
+            images = images.copy()
+            images[self.random.random(images.shape[:3]) < p_noise] = color
+            return images
+        return self._transform_items(images, indices, _salt)
+
+    def _cutout_all(self, images, origin, shape, color, indices=None):
+        """ Fill a box in each image with color
+
+        Parameters
+        ----------
+        origin : sequence, str
+            Upper-left corner of a filled box. Can be one of:
+
+            - sequence - corner's coordinates in the form of (row, column).
+            - 'top_left' - upper-left corners of an image and the filled box coincide.
+            - 'center' - centers of an image and the filled box coincide.
+            - 'random' - place the upper-left corner of the filled box at a random position for each image.
+        shape : sequence, int
+            Shape of a filled box in the form of (rows, columns). If int is given, the box is square.
+        color : sequence, number
+            Color of a filled box.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        shape = (shape, shape) if isinstance(shape, Number) else tuple(shape)
+        def _cutout(images):
+            origins = self._calc_origins(len(images), images.shape[1:], shape, origin)
+            mask = self._window_mask(len(images), images.shape[1:], origins, shape)
+            images = images.copy()
+            images[mask] = color
+            return images
+        return self._transform_items(images, indices, _cutout)
+
+    def _additive_noise_all(self, images, noise, clip=False, preserve_type=False, indices=None):
+        """ Add additive noise to images.
+
+        Parameters
+        ----------
+        noise : callable
+            Distribution. Must have ``size`` parameter.
+        clip : bool
+            whether to force image's pixels to be in [0, 255] or [0, 1.]
+        preserve_type : bool
+            Whether to preserve ``dtype`` of transformed images.
+            If ``False`` is given then the resulting type will be ``np.float32``.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        def _noise(images):
+            return self._arithmetic(images, np.add, noise(size=images.shape), clip, preserve_type)
+        return self._transform_items(images, indices, _noise)
+
+    def _multiplicative_noise_all(self, images, noise, clip=False, preserve_type=False, indices=None):
+        """ Add multiplicative noise to images.
+
+        Parameters
+        ----------
+        noise : callable
+            Distribution. Must have ``size`` parameter.
+        clip : bool
+            whether to force image's pixels to be in [0, 255] or [0, 1.]
+        preserve_type : bool
+            Whether to preserve ``dtype`` of transformed images.
+            If ``False`` is given then the resulting type will be ``np.float32``.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        def _noise(images):
+            return self._arithmetic(images, np.multiply, noise(size=images.shape), clip, preserve_type)
+        return self._transform_items(images, indices, _noise)
+
+    def _to_float_all(self, images, scale=1/255, indices=None):
+        """ Convert images to `np.float32` and multiply them by ``scale``
+
+        Parameters
+        ----------
+        scale : Number
+            Multiplier (e.g. to bring `np.uint8` pixels to [0, 1] range).
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        """
+        if indices is not None:
+            raise ValueError("to_float cannot be applied with probability `p`")
+        return np.multiply(images, np.float32(scale), dtype=np.float32)
+
+    @action
+    def split_to_patches(self, patch_shape, stride=1, drop_last=False, src='images', dst=None,
+                         coordinates=None):
+        """ Split all images to patches at once.
+
+        Parameters
+        ----------
+        patch_shape : int, sequence
+            Patch's shape in the from (rows, columns). If int is given then patches have square shape.
+        stride : int, square
+            Step of the moving window from which patches are cropped. If int is given then the window has square shape.
+        drop_last : bool
+            Whether to drop patches whose window covers area out of the image.
+            If False is passed then these patches are cropped from the edge of an image.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write patches to as an array of shape (n_patches, patch_rows, patch_columns, channels).
+            Default is `src`.
+        coordinates : str or None
+            Component to write patches' coordinates to. Coordinates are stored as an array of shape (n_patches, 3)
+            with an image position in the batch and a row and a column of a patch's upper-left corner.
+
+        See also
+        --------
+        :func:`extract_patches`, :meth:`merge_patches`
+        """
+        patches, patch_coordinates = extract_patches(getattr(self, src), patch_shape, stride, drop_last, axis=1)
+        setattr(self, dst or src, patches)
+        if coordinates is not None:
+            setattr(self, coordinates, patch_coordinates)
+        return self
+
+    @action
+    def merge_patches(self, coordinates, image_shape, src='images', dst=None):
+        """ Assemble images from patches, averaging overlapping pixels.
+
+        Parameters
+        ----------
+        coordinates : str, np.ndarray
+            Patches' coordinates (a component name or an array) as created by :meth:`split_to_patches`.
+        image_shape : sequence
+            Shape of the images in the form (rows, columns).
+        src : str
+            Component to get patches from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is `src`.
+        """
+        patches = getattr(self, src)
+        coordinates = getattr(self, coordinates) if isinstance(coordinates, str) else np.asarray(coordinates)
+        n_images = coordinates[:, 0].max() + 1 if len(coordinates) > 0 else 0
+        patch_rows, patch_columns = patches.shape[1:3]
+
+        items, rows, columns = np.broadcast_arrays(coordinates[:, 0, None, None],
+                                                   coordinates[:, 1, None, None] + np.arange(patch_rows)[:, None],
+                                                   coordinates[:, 2, None, None] + np.arange(patch_columns))
+
+        images = np.zeros((n_images, *image_shape, *patches.shape[3:]), dtype=np.float64)
+        counts = np.zeros((n_images, *image_shape), dtype=np.float64)
+        np.add.at(images, (items, rows, columns), patches)
+        np.add.at(counts, (items, rows, columns), 1)
+        counts = counts.reshape(*counts.shape, *(1,) * (images.ndim - counts.ndim))
+        images = images / np.maximum(counts, 1)
+        if np.issubdtype(patches.dtype, np.integer):
+            images = np.round(images)
+        setattr(self, dst or src, images.astype(patches.dtype))
+        return self
+
+    def _elastic_transform_all(self, images, alpha, sigma, pool_size=None, order=1, indices=None, **kwargs):
+        """ Elastic deformation of images as described in [Simard2003]_.
+
+        Displacement fields for all images are generated with one gaussian filter call
+        (or taken from a pool of precomputed fields) and all images are resampled with one
+        `scipy.ndimage.map_coordinates` call per channel.
+
+        Parameters
+        ----------
+        alpha : number
+            maximum of vectors' norms.
+        sigma : number
+            Smooth factor.
+        pool_size : int or None
+            If given, displacement fields are taken from a pool of `pool_size` precomputed fields
+            (randomly flipped and negated) instead of filtering new random fields for each batch.
+        order : int
+            Interpolation order.
+        src : str
+            Component to get images from. Default is 'images'.
+        dst : str
+            Component to write images to. Default is 'images'.
+        p : float
+            Probability of applying the transform. Default is 1.
+        """
+        kwargs.setdefault('mode', 'constant')
+        kwargs.setdefault('cval', 0)
 
-        if shape[-1] == 1:
-            return PIL.Image.fromarray(np.uint8(distored_image.reshape(image.shape))[..., 0])
-        return PIL.Image.fromarray(np.uint8(distored_image.reshape(image.shape)))
+        def _elastic(images):
+            grid = _coordinate_grid(images.shape[1:3])
+            fields = _displacement_fields(len(images), images.shape[1:3], sigma, pool_size, random=self.random,
+                                          **kwargs)
+            fields *= alpha
+            coordinates = np.empty((3, *images.shape[:3]), dtype=np.float32)
+            coordinates[0] = np.arange(len(images)).reshape(-1, 1, 1)
+            np.add(grid[:, None], fields.swapaxes(0, 1), out=coordinates[1:])
+
+            result = np.empty_like(images)
+            for channel in range(images.shape[-1]):
+                scipy.ndimage.map_coordinates(images[..., channel], coordinates, output=result[..., channel],
+                                              order=order, mode='reflect')
+            return result
+        return self._transform_items(images, indices, _elastic)
@@ -0,0 +1,120 @@
+""" Contains a pool of reusable batches """
+import threading
+
+
+class BatchPool:
+    """ A pool of batches which are recycled after a consumer releases them
+
+    A recycled batch is initialized with its constructor again, but it keeps its lock, thread-local storage
+    and classes for dynamically added components, so they are not created for each batch.
+    If `reuse_buffers` is True, component arrays of a released batch also serve as buffers for the next items:
+    batch data loaded from a dataset and components assembled after parallel actions are written
+    into released arrays of the same shape and dtype. So with fixed shapes the steady state allocates nothing.
+
+    A batch is released with :meth:`~batchflow.Batch.release` (or :meth:`release`), or automatically
+    when the next batch is requested if `auto_release` is True. Neither a released batch nor its data
+    should be used afterwards, so copy arrays which are needed later (e.g. saved into pipeline variables)
+    and turn off `reuse_buffers` if component arrays are shared between batches.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of idle batches of each class kept in the pool.
+    reuse_buffers : bool
+        Whether to reuse component arrays of released batches.
+    auto_release : bool
+        Whether :meth:`~batchflow.Pipeline.gen_batch` releases a batch when the next one is requested.
+
+    Attributes
+    ----------
+    created : int
+        The number of batches created.
+    reused : int
+        The number of batches taken from the pool.
+
+    Examples
+    --------
+    ::
+
+        pool = BatchPool()
+        for batch in pipeline.gen_batch(BATCH_SIZE, shuffle=True, n_epochs=10, pool=pool):
+            ...
+            batch.release()
+
+        pipeline.run(BATCH_SIZE, n_epochs=10, pool=BatchPool(auto_release=True))
+    """
+    def __init__(self, max_size=16, reuse_buffers=True, auto_release=False):
+        self.max_size = max_size
+        self.reuse_buffers = reuse_buffers
+        self.auto_release = auto_release
+        self.created = 0
+        self.reused = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(batches) for batches in self._idle.values())
+
+    @property
+    def stats(self):
+        """ dict : pool counters """
+        return dict(created=self.created, reused=self.reused, idle=len(self))
+
+    def acquire(self, batch_class, index, preloaded=None, **kwargs):
+        """ Return a batch of the given class with the given items
+
+        Parameters
+        ----------
+        batch_class : type
+            A batch class.
+        index : DatasetIndex
+            Batch items.
+        preloaded
+            Data to load batch items from.
+        kwargs
+            Other arguments for a batch constructor.
+
+        Returns
+        -------
+        Batch
+        """
+        # pylint: disable=protected-access
+        with self._lock:
+            batches = self._idle.get(batch_class)
+            batch = batches.pop() if batches else None
+            if batch is None:
+                self.created += 1
+            else:
+                self.reused += 1
+
+        if batch is None:
+            batch = batch_class(index, preloaded=preloaded, **kwargs)
+            batch._item_classes = {}
+            if self.reuse_buffers:
+                batch._buffers = {}
+                batch._retired = []
+        else:
+            batch._recycle(index, preloaded, **kwargs)
+        batch._pool = self
+        return batch
+
+    def release(self, batch):
+        """ Put a batch back into the pool
+
+        Batches which are not taken from the pool or are already released are ignored.
+        """
+        # pylint: disable=protected-access
+        with self._lock:
+            if batch.__dict__.get('_pool') is not self:
+                return
+            batch._pool = None
+        batch._clear(reuse_buffers=self.reuse_buffers)
+        with self._lock:
+            batches = self._idle.setdefault(type(batch), [])
+            if len(batches) < self.max_size:
+                batches.append(batch)
+
+    def clear(self):
+        """ Remove all idle batches from the pool """
+        with self._lock:
+            self._idle = {}
@@ -1,4 +1,128 @@
 """ Config class"""
+import itertools
+import threading
+import weakref
+
+
+class _ConfigDict(dict):
+    """ A dict which tracks modifications of itself and its nested config dicts
+
+    Config dicts are often modified in-place (e.g. ``config['body']['filters'] = 32``),
+    so cached indices of configs are validated with a version of the root dict.
+    A modification of a dict gives it a new version and passes it to all dicts which contain it,
+    so changes of one config do not invalidate indices of other configs.
+    Nested plain dicts are converted to config dicts when they are put into a config dict.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.version = 0
+        self._parents = weakref.WeakValueDictionary()
+        self.update(*args, **kwargs)
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+    def _touch(self):
+        """ Give a new version to the dict and all dicts which contain it """
+        with _VERSION_LOCK:
+            version = next(_VERSIONS)
+            pending, seen = [self], set()
+            while pending:
+                item = pending.pop()
+                if id(item) not in seen:
+                    seen.add(id(item))
+                    item.version = version
+                    pending.extend(item._parents.values())     # pylint: disable=protected-access
+
+    def _unlink(self, value):
+        """ Stop passing versions of a removed value unless the dict still contains it """
+        if isinstance(value, _ConfigDict) and not any(item is value for item in self.values()):
+            value._parents.pop(id(self), None)     # pylint: disable=protected-access
+
+    def __setitem__(self, key, value):
+        if type(value) is dict:     # pylint: disable=unidiomatic-typecheck
+            value = _ConfigDict(value)
+        old = self.get(key)
+        super().__setitem__(key, value)
+        if old is not None and old is not value:
+            self._unlink(old)
+        if isinstance(value, _ConfigDict):
+            value._parents[id(self)] = self
+        self._touch()
+
+    def __delitem__(self, key):
+        old = self[key]
+        super().__delitem__(key)
+        self._unlink(old)
+        self._touch()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, key, *args):    # pylint: disable=arguments-differ
+        if key not in self:
+            return super().pop(key, *args)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._unlink(value)
+        self._touch()
+        return key, value
+
+    def clear(self):
+        values = list(self.values())
+        super().clear()
+        for value in values:
+            self._unlink(value)
+        self._touch()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):    # pylint: disable=arguments-differ
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+_VERSIONS = itertools.count(1)
+_VERSION_LOCK = threading.Lock()
+
+
+def _make_index(config, prefix='', paths=None, leaves=None):
+    """ Return flat indices of nested config dicts
+
+    Returns
+    -------
+    paths : dict or None
+        all paths (with slashes) to nested values and dicts
+    leaves : dict or None
+        a flattened config (see :meth:`Config.flatten`)
+
+    Indices are None when some nested dicts are not config dicts or keys are not strings without slashes,
+    as such configs cannot be indexed reliably.
+    """
+    paths = {} if paths is None else paths
+    leaves = {} if leaves is None else leaves
+    if not isinstance(config, _ConfigDict):
+        return None, None
+    for key, value in config.items():
+        if not isinstance(key, str) or '/' in key or isinstance(value, Config):
+            return None, None
+        path = prefix + key
+        paths[path] = value
+        if isinstance(value, dict) and len(value) > 0:
+            if _make_index(value, path + '/', paths, leaves)[0] is None:
+                return None, None
+        else:
+            leaves[path] = value
+    return paths, leaves
+
 
 class Config:
     """ Class for configs that can be represented as nested dicts with easy indexing by slashes """
@@ -16,8 +140,9 @@ class Config:
         kwargs :
             parameters from kwargs also will be parsed and saved into self.config
         """
+        self._index = None
         if config is None:
-            self.config = dict()
+            self.config = _ConfigDict()
         elif isinstance(config, (dict, list)):
             self.config = self.parse(config)
         else:
@@ -25,6 +150,11 @@ class Config:
         for key, value in kwargs.items():
             self.put(key, value)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
     def pop(self, variables, config=None, **kwargs):
         """ Returns variables and remove them from config
 
@@ -61,16 +191,46 @@ class Config:
         -------
         single value or a tuple
         """
+        if config is None and isinstance(variables, str):
+            paths = self._get_index()[3]
+            if paths is not None and variables in paths:
+                return paths[variables]
         if isinstance(config, Config):
             val = config.get(variables, default=default)
         else:
             val = self._get(variables, config, default=default, pop=False)
         return val
 
+    @property
+    def version(self):
+        """ int or None : a number which changes whenever the config is modified
+        (or None if the config contains dicts which are not tracked, e.g. put directly into `self.config`)
+        """
+        index = self._get_index(build=True)
+        return index[1] if index[3] is not None else None
+
+    def _get_index(self, build=False):
+        """ Return a cached (config, version, built, paths, leaves) index of the current config
+
+        The first request after a modification does not build an index (unless `build` is True),
+        so a config which is being modified is not indexed over and over again.
+        """
+        index = getattr(self, '_index', None)
+        version = getattr(self.config, 'version', None)
+        if index is None or index[0] is not self.config or index[1] != version:
+            index = (self.config, version, False, None, None)
+        elif not index[2]:
+            build = True
+        if build and not index[2]:
+            index = (self.config, index[1], True, *_make_index(self.config))
+        self._index = index
+        return index
+
     def _get(self, variables, config=None, **kwargs):
+        pop = kwargs.get('pop', False)
+        paths = self._get_index()[3] if config is None and not pop else None
         if config is None:
             config = self.config
-        pop = kwargs.get('pop', False)
         has_default = 'default' in kwargs
         default = kwargs.get('default')
 
@@ -81,6 +241,10 @@ class Config:
 
         ret_vars = []
         for variable in variables:
+            if paths is not None and isinstance(variable, str) and variable in paths:
+                ret_vars.append(paths[variable])
+                continue
+
             _config = config
             if '/' in variable:
                 var = variable.split('/')
@@ -149,7 +313,7 @@ class Config:
 
         for i, p in enumerate(prefix):
             if p not in config:
-                config[p] = dict()
+                config[p] = _ConfigDict()
             if isinstance(config[p], dict):
                 config = config[p]
             else: # for example, we put value with key 'a/b' into `{a: c}`
@@ -185,7 +349,7 @@ class Config:
             items = config
         else:
             raise ValueError('config must be dict, Config or list but {} was given'.format(type(config)))
-        new_config = dict()
+        new_config = _ConfigDict()
         for key, value in items:
             if isinstance(value, dict):
                 value = self.parse(value)
@@ -205,6 +369,9 @@ class Config:
         new_config : dict
         """
         if config is None:
+            leaves = self._get_index(build=True)[4]
+            if leaves is not None:
+                return dict(leaves)
             config = self.config
         elif isinstance(config, Config):
             config = config.config
@@ -231,6 +398,10 @@ class Config:
         return other.__add__(self)
 
     def __getitem__(self, key):
+        if isinstance(key, str):
+            paths = self._get_index()[3]
+            if paths is not None and key in paths:
+                return paths[key]
         value = self._get(key)
         return value
 
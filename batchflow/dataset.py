@@ -3,7 +3,7 @@
 import numpy as np
 from .base import Baseset
 from .batch import Batch
-from .dsindex import DatasetIndex
+from .dsindex import DatasetIndex, RangeIndex, StreamIndex
 from .pipeline import Pipeline
 
 
@@ -40,6 +40,8 @@ class Dataset(Baseset):
 
     @staticmethod
     def _is_same_index(index1, index2):
+        if isinstance(index1, RangeIndex) and isinstance(index2, RangeIndex):
+            return index1.index == index2.index
         return (isinstance(index1, type(index2)) or isinstance(index2, type(index1))) and \
                index1.indices.shape == index2.indices.shape and \
                np.all(index1.indices == index2.indices)
@@ -48,15 +50,19 @@ class Dataset(Baseset):
         """ Create a dataset based on the given subset of indices """
         return type(self).from_dataset(self, index)
 
-    def create_batch(self, batch_indices, pos=False, *args, **kwargs):
+    def create_batch(self, batch_indices, pos=False, *args, pool=None, **kwargs):
         """ Create a batch from given indices.
 
             if `pos` is `False`, then `batch_indices` should contain the indices
             that should be included in the batch
             otherwise `batch_indices` should contain their positions in the current index
+
+            if `pool` is given, the batch is taken from a :class:`~batchflow.BatchPool`
         """
         if not isinstance(batch_indices, DatasetIndex):
             batch_indices = self.index.create_batch(batch_indices, pos, *args, **kwargs)
+        if pool is not None:
+            return pool.acquire(self.batch_class, batch_indices, preloaded=self.preloaded, **kwargs)
         return self.batch_class(batch_indices, preloaded=self.preloaded, **kwargs)
 
     def pipeline(self, config=None):
@@ -72,3 +78,74 @@ class Dataset(Baseset):
         if not isinstance(other, Pipeline):
             raise TypeError("Pipeline is expected, but got %s. Use as dataset >> pipeline" % type(other))
         return other << self
+
+
+class StreamDataset(Dataset):
+    """ A dataset of items pulled from an iterator or an async iterator (see :class:`~batchflow.StreamIndex`)
+
+    Batch data is made of the items of a stream batch. If a batch class has components,
+    each item should be a tuple (or a dict) of component values, otherwise batch data is an array of items.
+    Items of the same shape are stacked into an array, while items of different shapes are put into an object array.
+
+    Parameters
+    ----------
+    source : iterable, iterator, async iterable, callable or StreamIndex
+        A source of items (see :class:`~batchflow.StreamIndex`).
+
+    batch_class : type
+        A class of batches.
+
+    buffer_size : int
+        The maximum number of items in a shuffle buffer.
+
+    max_bytes : int or None
+        The maximum size of a shuffle buffer in bytes.
+
+    Examples
+    --------
+    ::
+
+        dataset = StreamDataset(lambda: open('app.log'), buffer_size=50000, max_bytes=2**28)
+        pipeline = dataset.p.some_action().another_action()
+        for batch in pipeline.gen_batch(256, shuffle=True, n_epochs=None, prefetch=4):
+            ...
+    """
+    def __init__(self, source, batch_class=Batch, buffer_size=10000, max_bytes=None):
+        if not isinstance(source, StreamIndex):
+            source = StreamIndex(source, buffer_size, max_bytes)
+        super().__init__(source, batch_class=batch_class)
+
+    def create_batch(self, batch_indices, pos=False, *args, pool=None, **kwargs):
+        """ Create a batch from a batch of the stream index (taken from a :class:`~batchflow.BatchPool` if given) """
+        _ = pos, args
+        if not isinstance(batch_indices, StreamIndex) or batch_indices.items is None:
+            raise TypeError("Stream batches can be created only from batches of a stream index")
+        if pool is not None:
+            batch = pool.acquire(self.batch_class, batch_indices, **kwargs)
+        else:
+            batch = self.batch_class(batch_indices, **kwargs)
+        batch._data = self._make_data(batch, batch_indices.items)    # pylint: disable=protected-access
+        return batch
+
+    @staticmethod
+    def _make_data(batch, items):
+        """ Put items into an array or a tuple of component arrays """
+        components = batch.components
+        if components is None:
+            return _stack(batch, items)
+        if isinstance(items[0], dict):
+            return tuple(_stack(batch, [item[comp] for item in items]) for comp in components)
+        if len(components) == 1 and not isinstance(items[0], tuple):
+            return (_stack(batch, items),)
+        return tuple(_stack(batch, values) for values in zip(*items))
+
+
+def _stack(batch, values):
+    """ Stack values into an array or an object array if they have different shapes """
+    try:
+        return batch._stack_items(values)     # pylint: disable=protected-access
+    except ValueError:
+        data = np.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            data[i] = value
+        return data
@@ -156,6 +156,8 @@ def inbatch_parallel(init, post=None, target='threads', _use_self=None, **dec_kw
 
         def _prepare_args(self, args, kwargs):
             params = list()
+            # a boolean mask of items a method is run for (see `Batch.apply_transform`)
+            mask = kwargs.get('_mask')
 
             def _get_value(value, pos=None, name=None):
                 if isinstance(value, P):
@@ -164,6 +166,8 @@ def inbatch_parallel(init, post=None, target='threads', _use_self=None, **dec_kw
                     elif name is not None:
                         params.append(name)
                     v = value.get(batch=self, parallel=True)
+                    if mask is not None:
+                        v = [item for item, selected in zip(v, mask) if selected]
                     return v
                 return value
 
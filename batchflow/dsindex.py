@@ -3,10 +3,120 @@ import os
 import sys
 import math
 import glob
+import fnmatch
+import asyncio
+import zipfile
+import concurrent.futures as cf
 from collections.abc import Iterable
 import numpy as np
 import tqdm
 from .base import Baseset
+from .rng import make_rng
+
+
+def _as_keys(keys):
+    """ Convert a sequence of index items into a 1-d numpy array """
+    if not isinstance(keys, np.ndarray):
+        keys = list(keys)
+    return np.asarray(keys).reshape(-1)
+
+
+class DictPositions:
+    """ Item positions stored in a dict (used for items which cannot be ordered) """
+    def __init__(self, positions):
+        self.positions = positions
+
+    def __getitem__(self, key):
+        return self.positions[key]
+
+    def get_many(self, keys):
+        """ Return positions of several items as a numpy array """
+        return np.asarray([self.positions[key] for key in keys])
+
+
+class RangePositions:
+    """ Item positions of an integer index with a constant step, e.g. ``np.arange(n)``
+
+    Positions are calculated arithmetically, so no memory is spent on a lookup table.
+    """
+    def __init__(self, start, step, length):
+        self.start = int(start)
+        self.step = int(step)
+        self.length = length
+
+    @staticmethod
+    def fits(indices):
+        """ Check whether an index is an integer sequence with a constant non-zero step """
+        if indices.dtype.kind not in 'iu':
+            return False
+        if len(indices) == 1:
+            return True
+        step = int(indices[1]) - int(indices[0])
+        if step == 0 or int(indices[-1]) != int(indices[0]) + step * (len(indices) - 1):
+            return False
+        # unsigned differences would wrap around for descending indices
+        diffs = np.diff(indices.astype(np.int64) if indices.dtype.kind == 'u' else indices)
+        return bool(np.all(diffs == step))
+
+    def __getitem__(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """ Return positions of several items as a numpy array """
+        keys = _as_keys(keys)
+        if keys.size == 0:
+            return np.asarray([], dtype=np.intp)
+        if keys.dtype.kind == 'u':
+            keys = keys.astype(np.int64)
+        try:
+            pos, rem = np.divmod(keys - self.start, self.step)
+        except TypeError as e:
+            raise KeyError(keys[0]) from e
+        found = (rem == 0) & (pos >= 0) & (pos < self.length)
+        if not np.all(found):
+            raise KeyError(keys[~found][0])
+        return pos.astype(np.intp)
+
+
+class SortedPositions:
+    """ Item positions found with a binary search over the index
+
+    Only an ``argsort`` order is stored (and not even that if the index is already sorted).
+    As in a dict, the last position is returned for repeated items.
+
+    Raises
+    ------
+    TypeError
+        If index items cannot be ordered.
+    """
+    def __init__(self, indices):
+        self.indices = indices
+        if len(indices) < 2 or np.all(indices[:-1] <= indices[1:]):
+            self.sorter = None
+        else:
+            self.sorter = np.argsort(indices, kind='mergesort')
+
+    def get_many(self, keys):
+        """ Return positions of several items as a numpy array """
+        keys = _as_keys(keys)
+        if keys.size == 0:
+            return np.asarray([], dtype=np.intp)
+        try:
+            pos = np.searchsorted(self.indices, keys, side='right', sorter=self.sorter) - 1
+        except (TypeError, ValueError) as e:
+            raise KeyError(keys[0]) from e
+        pos = np.maximum(pos, 0)
+        if self.sorter is not None:
+            pos = self.sorter[pos]
+        found = np.asarray(self.indices[pos] == keys)
+        if found.shape != keys.shape:
+            raise KeyError(keys[0])
+        if not np.all(found):
+            raise KeyError(keys[~found][0])
+        return pos
+
+    def __getitem__(self, key):
+        return self.get_many([key])[0]
 
 
 class DatasetIndex(Baseset):
@@ -109,10 +219,29 @@ class DatasetIndex(Baseset):
         return _index
 
     def build_pos(self):
-        """ Create a dictionary with positions in the index. """
+        """ Create a lookup table for item positions in the index.
+
+        The cheapest lookup available for the index content is chosen:
+
+        - an integer index with a constant step (e.g. ``np.arange(n)``) maps items to positions arithmetically,
+        - any other index with orderable items is searched with :func:`numpy.searchsorted`
+          (with an ``argsort`` order if the index is not sorted),
+        - a dict is used only when items cannot be ordered (e.g. a mix of numbers and strings).
+
+        Returns
+        -------
+        RangePositions, SortedPositions or DictPositions
+        """
         if self.indices is None:
-            return dict()
-        return dict(zip(self.indices, np.arange(len(self))))
+            return DictPositions(dict())
+        indices = np.asarray(self.indices)
+        if RangePositions.fits(indices):
+            step = int(indices[1]) - int(indices[0]) if len(indices) > 1 else 1
+            return RangePositions(indices[0], step, len(indices))
+        try:
+            return SortedPositions(indices)
+        except TypeError:
+            return DictPositions(dict(zip(indices, np.arange(len(indices)))))
 
     def get_pos(self, index):
         """ Return position of an item in the index.
@@ -147,7 +276,7 @@ class DatasetIndex(Baseset):
         elif isinstance(index, str):
             pos = self._pos[index]
         elif isinstance(index, Iterable):
-            pos = np.asarray([self._pos[ix] for ix in index])
+            pos = self._pos.get_many(index)
         else:
             pos = self._pos[index]
         return pos
@@ -184,7 +313,7 @@ class DatasetIndex(Baseset):
             Train, test and validation shares.
             If tuple of 3 floats is passed, then validation subset is always present.
 
-        shuffle : bool, int or callable
+        shuffle : bool, int, 'block' or callable
             Whether to shuffle the index before split.
 
         Examples
@@ -212,7 +341,7 @@ class DatasetIndex(Baseset):
         if shuffle:
             order = self._shuffle(shuffle)
         else:
-            order = np.arange(len(self))
+            order = self._initial_order()
 
         if valid_share > 0:
             validation_pos = order[:valid_share]
@@ -225,12 +354,16 @@ class DatasetIndex(Baseset):
             self.train = self.create_subset(self.subset_by_pos(train_pos))
 
 
+    def _initial_order(self):
+        """ Return positions of all items in the order they appear in the index """
+        return np.arange(len(self))
+
     def _shuffle(self, shuffle, iter_params=None):
         if iter_params is None:
             iter_params = self._iter_params
 
         if iter_params['_order'] is None:
-            order = np.arange(len(self))
+            order = self._initial_order()
         else:
             order = iter_params['_order']
 
@@ -245,22 +378,33 @@ class DatasetIndex(Baseset):
             if iter_params['_random_state'] != shuffle:
                 iter_params['_random_state'] = shuffle
             order = iter_params['_random_state'].permutation(order)
+        elif isinstance(shuffle, (str, BlockShuffle)):
+            order = self._block_shuffle(shuffle)
         elif callable(shuffle):
             order = shuffle(self.indices)
         else:
-            raise ValueError("shuffle could be bool, int, numpy.random.RandomState or callable")
+            raise ValueError("shuffle could be bool, int, 'block', numpy.random.RandomState or callable")
         return order
 
+    def _block_shuffle(self, shuffle):
+        """ Return a block order of positions for ``shuffle='block'`` or a :class:`BlockShuffle` instance """
+        if isinstance(shuffle, str):
+            if shuffle != 'block':
+                raise ValueError("Unknown shuffle strategy: %s" % shuffle)
+            shuffle = BlockShuffle()
+        return shuffle.permutation(len(self))
+
 
     def next_batch(self, batch_size, shuffle=False, n_epochs=1, drop_last=False, iter_params=None):
         """ Return the next batch
 
         Parameters
         ----------
-        batch_size : int
+        batch_size : int or :class:`Buckets`
             Desired number of items in the batch (the actual batch could contain fewer items)
+            If :class:`Buckets`, batches contain items of similar size.
 
-        shuffle : bool, int, class:`numpy.random.RandomState` or callable
+        shuffle : bool, int, 'block', class:`numpy.random.RandomState` or callable
             Specifies the order of items, could be:
 
             - bool
@@ -273,6 +417,9 @@ class DatasetIndex(Baseset):
             - :class:`numpy.random.RandomState` instance
                 Class for a reproducible random shuffle.
 
+            - 'block' or :class:`BlockShuffle` instance
+                A locality-aware shuffle of contiguous blocks of items (see :class:`BlockShuffle`).
+
             - callable
                 A function which takes an array of item indices in the initial order
                 (as they appear in the index) and returns the order of items.
@@ -309,6 +456,9 @@ class DatasetIndex(Baseset):
                 index_batch = index.next_batch(BATCH_SIZE, shuffle=True, n_epochs=2, drop_last=True):
                 # do whatever you want
         """
+        if isinstance(batch_size, Buckets):
+            return self._next_bucket_batch(batch_size, shuffle, n_epochs, drop_last, iter_params)
+
         if iter_params is None:
             iter_params = self._iter_params
 
@@ -354,16 +504,48 @@ class DatasetIndex(Baseset):
             iter_params['_start_index'] += rest_of_batch
             return self.create_batch(batch_items, pos=True)
 
+    def _next_bucket_batch(self, buckets, shuffle, n_epochs, drop_last, iter_params=None):
+        """ Return the next batch of items of similar size (see :class:`Buckets`) """
+        if iter_params is None:
+            iter_params = self._iter_params
+
+        batches = iter_params.get('_batches')
+        if batches is not None and iter_params['_start_index'] >= len(batches):
+            iter_params['_n_epochs'] += 1
+            batches = None
+        if iter_params['_stop_iter'] or n_epochs is not None and iter_params['_n_epochs'] >= n_epochs:
+            iter_params['_stop_iter'] = True
+            if 'bar' in iter_params:
+                iter_params['bar'].close()
+            raise StopIteration("Dataset is over. No more batches left.")
+
+        if batches is None:
+            if shuffle:
+                order = self._shuffle(shuffle, iter_params)
+                batches = buckets.split(self, order, drop_last)
+                random_state = iter_params['_random_state'] or np.random
+                batches = [batches[i] for i in random_state.permutation(len(batches))]
+            else:
+                batches = buckets.split(self, self._initial_order(), drop_last)
+            if len(batches) == 0:
+                raise ValueError("There are no batches in the dataset. Check batch_size or drop_last")
+            iter_params['_batches'] = batches
+            iter_params['_start_index'] = 0
+
+        batch_items = batches[iter_params['_start_index']]
+        iter_params['_start_index'] += 1
+        return self.create_batch(batch_items, pos=True)
 
     def gen_batch(self, batch_size, shuffle=False, n_epochs=1, drop_last=False, bar=False):
         """ Generate batches
 
         Parameters
         ----------
-        batch_size : int
+        batch_size : int or :class:`Buckets`
             Desired number of items in the batch (the actual batch could contain fewer items).
+            If :class:`Buckets`, batches contain items of similar size.
 
-        shuffle : bool, int, class:`numpy.random.RandomState` or callable
+        shuffle : bool, int, 'block', class:`numpy.random.RandomState` or callable
             Specifies the order of items, could be:
 
             - bool
@@ -376,6 +558,9 @@ class DatasetIndex(Baseset):
             - :class:`numpy.random.RandomState` instance
                 Class for a reproducible random shuffle.
 
+            - 'block' or :class:`BlockShuffle` instance
+                A locality-aware shuffle of contiguous blocks of items (see :class:`BlockShuffle`).
+
             - callable
                 A function which takes an array of item indices in the initial order
                 (as they appear in the index) and returns the order of items.
@@ -419,6 +604,8 @@ class DatasetIndex(Baseset):
         if bar:
             if n_epochs is None:
                 total = sys.maxsize
+            elif isinstance(batch_size, Buckets):
+                total = None
             elif drop_last:
                 total = len(self) // batch_size * n_epochs
             else:
@@ -487,9 +674,1048 @@ class DatasetIndex(Baseset):
         return batch
 
 
+class RangeIndex(DatasetIndex):
+    """ A lazy index of integers defined by ``start``, ``stop`` and ``step`` like Python's :class:`range`.
+
+    Index items are never materialized: positions, subsets and batches are calculated arithmetically,
+    while shuffled orders are pseudo-random permutations (see :class:`FeistelPermutation`)
+    which are evaluated only for the items of the current batch.
+    So even an index of billions of items takes constant memory.
+
+    Contiguous subsets (e.g. a split without shuffling or a batch from a non-shuffled iteration)
+    are instances of `RangeIndex` too, while other subsets are ordinary :class:`DatasetIndex`.
+
+    Parameters
+    ----------
+    start, stop, step : int
+        Same as in :class:`range`. ``RangeIndex(stop)`` and ``RangeIndex(range_object)`` are also allowed.
+
+    Examples
+    --------
+    >>> index = RangeIndex(10**9)
+
+    >>> index = RangeIndex(100, 1000, 5)
+
+    >>> for batch in index.gen_batch(256, shuffle=True, n_epochs=1):
+    ...     # do whatever you want
+    """
+    @staticmethod
+    def build_index(*args):     # pylint: disable=arguments-differ
+        """ Create a range object from the arguments given. """
+        if len(args) == 1 and isinstance(args[0], range):
+            _index = args[0]
+        elif len(args) == 1 and isinstance(args[0], RangeIndex):
+            _index = args[0].index
+        else:
+            _index = range(*args)
+
+        if len(_index) == 0:
+            raise ValueError("Index cannot be empty")
+        return _index
+
+    def build_pos(self):
+        """ Create an arithmetic lookup table for item positions. """
+        return RangePositions(self.start, self.step, len(self))
+
+    @property
+    def start(self):
+        """ int : the first item of the index """
+        return self.index.start
+
+    @property
+    def stop(self):
+        """ int : the upper bound of the index (not included) """
+        return self.index.stop
+
+    @property
+    def step(self):
+        """ int : the difference between neighbouring items """
+        return self.index.step
+
+    @property
+    def indices(self):
+        """ numpy.ndarray : an array with the indices
+
+        Note that the array is created anew each time the property is accessed.
+        """
+        return np.arange(self.start, self.stop, self.step)
+
+    def __len__(self):
+        return len(self.index)
+
+    def subset_by_pos(self, pos):
+        """ Return subset of index by given positions in the index.
+
+        Parameters
+        ----------
+        pos : int, slice, range, list or numpy.array
+            Positions of items to include in subset.
+
+        Returns
+        -------
+        range or numpy.array
+            A range for slices and ranges, an array of items otherwise.
+        """
+        if isinstance(pos, range):
+            pos = slice(pos.start, pos.stop, pos.step)
+        if isinstance(pos, slice):
+            return self.index[pos]
+
+        pos = np.asarray(pos)
+        pos = np.where(pos < 0, pos + len(self), pos)
+        if np.any((pos < 0) | (pos >= len(self))):
+            raise IndexError("Positions are out of range of the index")
+        return self.start + pos * self.step
+
+    def create_subset(self, index):
+        """ Return a new `RangeIndex` for a range or a :class:`DatasetIndex` for other subsets. """
+        if isinstance(index, range):
+            return type(self)(index)
+        return DatasetIndex(index)
+
+    def _initial_order(self):
+        return range(len(self))
+
+    def _shuffle(self, shuffle, iter_params=None):
+        """ Return a lazy order of positions (without materializing a full permutation). """
+        if iter_params is None:
+            iter_params = self._iter_params
+
+        if isinstance(shuffle, bool):
+            if not shuffle:
+                return iter_params['_order'] if iter_params['_order'] is not None else self._initial_order()
+            seed = np.random.randint(np.iinfo(np.int32).max)
+        elif isinstance(shuffle, int):
+            if iter_params['_random_state'] is None:
+                iter_params['_random_state'] = np.random.RandomState(shuffle)
+            seed = iter_params['_random_state'].randint(np.iinfo(np.int32).max)
+        elif isinstance(shuffle, np.random.RandomState):
+            iter_params['_random_state'] = shuffle
+            seed = shuffle.randint(np.iinfo(np.int32).max)
+        elif isinstance(shuffle, (str, BlockShuffle)):
+            return self._block_shuffle(shuffle)
+        elif callable(shuffle):
+            return shuffle(self.indices)
+        else:
+            raise ValueError("shuffle could be bool, int, 'block', numpy.random.RandomState or callable")
+        return FeistelPermutation(len(self), seed)
+
+
+class StreamIndex(DatasetIndex):
+    """ An index of items pulled from an iterator, so neither items nor their ids are materialized in advance.
+
+    Items are taken from `source` only when batches are requested. Batches of a stream are `StreamIndex` instances too:
+    their ids are consecutive integers assigned to items in the order they are pulled from the source,
+    while the items themselves are stored in :attr:`items` (see :class:`~batchflow.StreamDataset`).
+
+    A shuffled stream is drawn through a reservoir buffer: the buffer is filled with items from the source,
+    batch items are taken from random slots and the buffer is refilled before the next batch.
+    The buffer holds no more than `buffer_size` items and, if `max_bytes` is given,
+    it stops growing as soon as its items take `max_bytes` (so it might exceed the limit by one item only).
+    A stream without shuffling keeps no buffer at all.
+
+    Parameters
+    ----------
+    source : iterable, iterator, async iterable or callable
+        Where items come from:
+
+        - an iterable (e.g. a list) or an async iterable is iterated anew in each epoch
+        - an iterator (e.g. a generator or an open file) or an async iterator can be read only once,
+          so it makes a single epoch
+        - a callable should return a new iterable or async iterable for each epoch,
+          e.g. ``lambda: open('app.log')``.
+
+        Async iterables are driven by a dedicated event loop in the thread which generates batches.
+
+    buffer_size : int
+        The maximum number of items in a shuffle buffer.
+
+    max_bytes : int or None
+        The maximum size of a shuffle buffer in bytes.
+        Sizes of arrays are taken from their `nbytes`, sizes of other items are estimated with :func:`sys.getsizeof`
+        (including elements of tuples, lists and dicts).
+
+    index : array-like or None
+        Item ids (only for batches of a stream).
+
+    items : list or None
+        Items (only for batches of a stream).
+
+    Notes
+    -----
+    The length of a stream is unknown, so ``len(index)`` is 0 for a stream and the number of items for its batch.
+
+    Streams cannot be split, and batches can only be generated with `gen_batch` or `next_batch`.
+
+    Batches may contain items from two neighbouring epochs, and only the very last batch might be incomplete
+    (it is dropped if `drop_last` is True).
+
+    Examples
+    --------
+    >>> index = StreamIndex(lambda: open('app.log'), buffer_size=50000, max_bytes=2**28)
+
+    >>> for batch in index.gen_batch(256, shuffle=True, n_epochs=None):
+    ...     lines = batch.items
+    """
+    def __init__(self, source=None, buffer_size=10000, max_bytes=None, index=None, items=None):
+        self.source = source
+        self.buffer_size = buffer_size
+        self.max_bytes = max_bytes
+        self.items = items
+        super().__init__(index)
+
+    @staticmethod
+    def build_index(index):
+        """ Return an array of item ids (empty for a stream). """
+        if index is None:
+            return np.array([], dtype=np.int64)
+        return np.asarray(index)
+
+    def build_pos(self):
+        """ Create a lookup table for item positions. """
+        if len(self.indices) == 0:
+            return DictPositions(dict())
+        return super().build_pos()
+
+    def create_subset(self, index):
+        """ Return a batch of the stream with the given ids and their items. """
+        if self.items is None:
+            raise TypeError("Subsets can be created only from batches of a stream")
+        return type(self)(index=index, items=[self.items[pos] for pos in self.get_pos(index)])
+
+    def split(self, shares=0.8, shuffle=False):
+        """ Streams cannot be split. """
+        raise ValueError("A stream cannot be split")
+
+    def get_default_iter_params(self):
+        """ Return iteration params with default values to start iteration from scratch """
+        iter_params = super().get_default_iter_params()
+        iter_params['_stream'] = None
+        return iter_params
+
+    @property
+    def is_restartable(self):
+        """ bool : whether the source can be iterated more than once """
+        if callable(self.source):
+            return True
+        if hasattr(self.source, '__aiter__'):
+            return not hasattr(self.source, '__anext__')
+        return iter(self.source) is not self.source
+
+    def _open_stream(self, stream):
+        """ Start a new pass over the source """
+        source = self.source() if callable(self.source) else self.source
+        if hasattr(source, '__aiter__'):
+            if stream['loop'] is None:
+                stream['loop'] = asyncio.new_event_loop()
+            stream['iterator'] = source.__aiter__()
+        else:
+            stream['iterator'] = iter(source)
+        stream['epoch_items'] = 0
+
+    def _close_stream(self, iter_params):
+        """ Release the source iterator and the event loop of an iteration """
+        stream = iter_params.get('_stream')
+        if stream is None:
+            return
+        loop, iterator = stream['loop'], stream['iterator']
+        stream['iterator'] = None
+        stream['loop'] = None
+        if loop is not None:
+            if iterator is not None and hasattr(iterator, 'aclose'):
+                loop.run_until_complete(iterator.aclose())
+            loop.close()
+
+    def _start_stream(self, shuffle):
+        stream = dict(iterator=None, loop=None, epoch=0, epoch_items=0, next_id=0,
+                      buffer=[], sizes=[], nbytes=0, random=None)
+        if shuffle is not False:
+            stream['random'] = make_rng(None if shuffle is True else shuffle)
+        self._open_stream(stream)
+        return stream
+
+    def _pull(self, stream, n, n_epochs, max_bytes=None):
+        """ Pull up to `n` items (which take up to `max_bytes`) from the source, starting new epochs if needed """
+        items, sizes = [], []
+        nbytes = 0
+        while len(items) < n and stream['iterator'] is not None:
+            budget = None if max_bytes is None else max_bytes - nbytes
+            if stream['loop'] is not None:
+                new_items, new_sizes, exhausted = \
+                    stream['loop'].run_until_complete(_take_async(stream['iterator'], n - len(items), budget))
+            else:
+                new_items, new_sizes, exhausted = _take(stream['iterator'], n - len(items), budget)
+            items.extend(new_items)
+            sizes.extend(new_sizes)
+            nbytes += sum(new_sizes)
+            stream['epoch_items'] += len(new_items)
+
+            if exhausted:
+                stream['epoch'] += 1
+                if stream['epoch_items'] > 0 and (n_epochs is None or stream['epoch'] < n_epochs) \
+                   and self.is_restartable:
+                    self._open_stream(stream)
+                else:
+                    stream['iterator'] = None
+            elif max_bytes is not None and nbytes >= max_bytes:
+                break
+        return items, sizes
+
+    def _fill_buffer(self, stream, n_epochs):
+        """ Refill a shuffle buffer up to its limits """
+        n = self.buffer_size - len(stream['buffer'])
+        budget = None if self.max_bytes is None else self.max_bytes - stream['nbytes']
+        if n > 0 and (budget is None or budget > 0):
+            items, sizes = self._pull(stream, n, n_epochs, budget)
+            stream['buffer'].extend(items)
+            stream['sizes'].extend(sizes)
+            stream['nbytes'] += sum(sizes)
+
+    def _draw_from_buffer(self, stream, n):
+        """ Take up to `n` items from random slots of a shuffle buffer """
+        buffer, sizes = stream['buffer'], stream['sizes']
+        items = []
+        for draw in stream['random'].random(n):
+            if not buffer:
+                break
+            pos = int(draw * len(buffer))
+            items.append(buffer[pos])
+            buffer[pos] = buffer[-1]
+            buffer.pop()
+            if sizes:
+                stream['nbytes'] -= sizes[pos]
+                sizes[pos] = sizes[-1]
+                sizes.pop()
+        return items
+
+    def next_batch(self, batch_size, shuffle=False, n_epochs=1, drop_last=False, iter_params=None):
+        """ Return the next batch of the stream
+
+        Parameters
+        ----------
+        batch_size : int
+            Desired number of items in the batch.
+
+        shuffle : bool, int, numpy.random.Generator or numpy.random.RandomState
+            Whether to draw items through a shuffle buffer. An int is a seed for a random shuffle.
+
+        n_epochs : int or None
+            The number of passes over the source. If None, a restartable source is read endlessly.
+
+        drop_last : bool
+            Whether to drop the last batch if it contains fewer than `batch_size` items.
+
+        Raises
+        ------
+        StopIteration
+            When the stream is over.
+        """
+        if isinstance(batch_size, Buckets):
+            raise ValueError("Buckets are not supported for streams")
+        if iter_params is None:
+            iter_params = self._iter_params
+
+        if not iter_params['_stop_iter']:
+            stream = iter_params['_stream']
+            if stream is None:
+                stream = iter_params['_stream'] = self._start_stream(shuffle)
+
+            if stream['random'] is None:
+                items, _ = self._pull(stream, batch_size, n_epochs)
+            else:
+                items = []
+                while len(items) < batch_size:
+                    self._fill_buffer(stream, n_epochs)
+                    if not stream['buffer']:
+                        break
+                    items.extend(self._draw_from_buffer(stream, batch_size - len(items)))
+
+            if len(items) < batch_size:
+                iter_params['_stop_iter'] = True
+            if len(items) == batch_size or len(items) > 0 and not drop_last:
+                ids = np.arange(stream['next_id'], stream['next_id'] + len(items))
+                stream['next_id'] += len(items)
+                return type(self)(index=ids, items=items)
+
+        iter_params['_stop_iter'] = True
+        self._close_stream(iter_params)
+        if 'bar' in iter_params:
+            iter_params['bar'].close()
+        raise StopIteration("Stream is over. No more batches left.")
+
+    def gen_batch(self, batch_size, shuffle=False, n_epochs=1, drop_last=False, bar=False):
+        """ Generate batches of the stream
+
+        Parameters
+        ----------
+        batch_size : int
+            Desired number of items in the batch.
+
+        shuffle : bool, int, numpy.random.Generator or numpy.random.RandomState
+            Whether to draw items through a shuffle buffer. An int is a seed for a random shuffle.
+
+        n_epochs : int or None
+            The number of passes over the source. If None, a restartable source is read endlessly.
+
+        drop_last : bool
+            Whether to drop the last batch if it contains fewer than `batch_size` items.
+
+        bar : bool or 'n'
+            Whether to show a `tqdm` progress bar (without a total as the stream length is unknown).
+            If 'n', then uses `tqdm_notebook`.
+
+        Yields
+        ------
+        StreamIndex
+            Batches with item ids and items.
+        """
+        iter_params = self.get_default_iter_params()
+        if bar:
+            iter_params['bar'] = tqdm.tqdm_notebook() if bar == 'n' else tqdm.tqdm()
+
+        try:
+            while True:
+                try:
+                    batch = self.next_batch(batch_size, shuffle, n_epochs, drop_last, iter_params)
+                except StopIteration:
+                    return
+                if 'bar' in iter_params:
+                    iter_params['bar'].update(1)
+                yield batch
+        finally:
+            self._close_stream(iter_params)
+
+
+_EXHAUSTED = object()
+
+
+def _item_nbytes(item):
+    """ Estimate the size of an item in bytes """
+    if isinstance(item, dict):
+        return sys.getsizeof(item) + sum(_item_nbytes(value) for value in item.values())
+    if isinstance(item, (tuple, list)):
+        return sys.getsizeof(item) + sum(_item_nbytes(value) for value in item)
+    nbytes = getattr(item, 'nbytes', None)
+    return nbytes if isinstance(nbytes, int) else sys.getsizeof(item)
+
+
+def _take(iterator, n, max_bytes=None):
+    """ Return up to `n` items from an iterator, their sizes (if `max_bytes` is given) and whether it is exhausted """
+    items, sizes = [], []
+    nbytes = 0
+    while len(items) < n:
+        item = next(iterator, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            return items, sizes, True
+        items.append(item)
+        if max_bytes is not None:
+            sizes.append(_item_nbytes(item))
+            nbytes += sizes[-1]
+            if nbytes >= max_bytes:
+                break
+    return items, sizes, False
+
+
+async def _take_async(iterator, n, max_bytes=None):
+    """ Same as :func:`_take` for async iterators """
+    items, sizes = [], []
+    nbytes = 0
+    while len(items) < n:
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            return items, sizes, True
+        items.append(item)
+        if max_bytes is not None:
+            sizes.append(_item_nbytes(item))
+            nbytes += sizes[-1]
+            if nbytes >= max_bytes:
+                break
+    return items, sizes, False
+
+
+class FeistelPermutation:
+    """ A pseudo-random permutation of ``range(length)`` evaluated on demand
+
+    A balanced Feistel network over the smallest bit domain which covers ``length``
+    is a bijection, and cycle-walking (repeating the network while a value is out of range)
+    restricts it to ``range(length)``. Thus any slice of the permutation is calculated
+    without generating the whole permutation.
+
+    Parameters
+    ----------
+    length : int
+        The number of items to permute.
+    seed : int
+        A seed for round keys. Permutations with the same length and seed are identical.
+    rounds : int
+        The number of Feistel rounds.
+
+    Examples
+    --------
+    >>> order = FeistelPermutation(10**9, seed=42)
+    >>> order[:5]
+    """
+    _MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, length, seed=None, rounds=4):
+        self.length = length
+        self.half_bits = max(1, ((length - 1).bit_length() + 1) // 2)
+        self.mask = np.uint64((1 << self.half_bits) - 1)
+        self.keys = np.random.RandomState(seed).randint(0, 2**32, size=rounds, dtype=np.uint64)
+
+    def __len__(self):
+        return self.length
+
+    def _network(self, values):
+        shift = np.uint64(self.half_bits)
+        left, right = values >> shift, values & self.mask
+        with np.errstate(over='ignore'):
+            for key in self.keys:
+                mixed = (right ^ key) * self._MULTIPLIER
+                mixed ^= mixed >> np.uint64(29)
+                left, right = right, left ^ (mixed & self.mask)
+        return (left << shift) | right
+
+    def permute(self, positions):
+        """ Return permuted values for given positions
+
+        Parameters
+        ----------
+        positions : array-like of int
+            Positions within ``range(length)``.
+
+        Returns
+        -------
+        numpy.array
+        """
+        values = self._network(np.asarray(positions, dtype=np.uint64))
+        out = values >= self.length
+        while np.any(out):
+            values[out] = self._network(values[out])
+            out = values >= self.length
+        return values.astype(np.int64)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.permute(np.arange(*item.indices(self.length)))
+        if np.ndim(item) == 0:
+            if item < 0:
+                item += self.length
+            if not 0 <= item < self.length:
+                raise IndexError("Position is out of range")
+            return self.permute(np.atleast_1d(item))[0]
+        return self.permute(item)
+
+
+class BlockPermutation:
+    """ A block permutation of ``range(length)`` evaluated window by window (see :class:`BlockShuffle`)
+
+    Only the order of blocks, a seed for each window and items of the last requested window are kept,
+    so the memory needed is proportional to the number of blocks and the window size rather than to `length`.
+
+    Parameters
+    ----------
+    length : int
+        The number of items to permute.
+    block_size : int
+        The number of contiguous items in a block.
+    window : int
+        The number of consecutive blocks which items are shuffled within (0 means no shuffle within blocks).
+    random_state : numpy.random.RandomState or numpy.random
+        A random state to permute blocks and to draw seeds for windows.
+    """
+    def __init__(self, length, block_size, window, random_state):
+        self.length = length
+        self.block_size = block_size
+        self.window_size = max(window, 1) * block_size
+        self.blocks = random_state.permutation(-(-length // block_size))
+
+        sizes = np.minimum((self.blocks + 1) * block_size, length) - self.blocks * block_size
+        self.block_starts = np.cumsum(sizes) - sizes
+        n_windows = -(-length // self.window_size)
+        self.seeds = random_state.randint(np.iinfo(np.int32).max, size=n_windows) if window > 0 else None
+        self._cache = None, None
+
+    def __len__(self):
+        return self.length
+
+    def _get_block_items(self, start, stop):
+        """ Return items at positions from `start` to `stop` of the order of blocks (not shuffled within windows) """
+        first, last = np.searchsorted(self.block_starts, [start, stop - 1], side='right') - 1
+        parts = []
+        for i in range(first, last + 1):
+            first_item = self.blocks[i] * self.block_size
+            block_stop = self.block_starts[i] + min(self.block_size, self.length - first_item)
+            shift = first_item - self.block_starts[i]
+            parts.append(np.arange(max(start, self.block_starts[i]) + shift, min(stop, block_stop) + shift))
+        return np.concatenate(parts)
+
+    def get_window(self, window_id):
+        """ Return items of a window in their shuffled order """
+        cached_id, items = self._cache
+        if cached_id != window_id:
+            start = window_id * self.window_size
+            items = self._get_block_items(start, min(start + self.window_size, self.length))
+            if self.seeds is not None:
+                items = np.random.RandomState(self.seeds[window_id]).permutation(items)
+            self._cache = window_id, items
+        return items
+
+    def _get_slice(self, start, stop):
+        if start >= stop:
+            return np.asarray([], dtype=np.int64)
+        parts = []
+        for window_id in range(start // self.window_size, (stop - 1) // self.window_size + 1):
+            offset = window_id * self.window_size
+            parts.append(self.get_window(window_id)[max(start - offset, 0) : stop - offset])
+        return np.concatenate(parts)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.length)
+            if step == 1:
+                return self._get_slice(start, stop)
+            item = np.arange(start, stop, step)
+        if np.ndim(item) == 0:
+            if item < 0:
+                item += self.length
+            if not 0 <= item < self.length:
+                raise IndexError("Position is out of range")
+            return self._get_slice(item, item + 1)[0]
+
+        positions = np.asarray(item)
+        window_ids = positions // self.window_size
+        result = np.empty(len(positions), dtype=np.int64)
+        for window_id in np.unique(window_ids):
+            mask = window_ids == window_id
+            result[mask] = self.get_window(window_id)[positions[mask] - window_id * self.window_size]
+        return result
+
+
+class BlockShuffle:
+    """ A locality-aware shuffle which permutes contiguous blocks of items
+
+    Items are split into contiguous blocks of `block_size` items, the order of blocks is shuffled,
+    and then items are shuffled within windows of `window` consecutive (already shuffled) blocks.
+    So each batch reads items from at most a few contiguous runs of a dataset instead of
+    scattered positions, which keeps readahead and page cache of disks and network filesystems
+    useful, while the order is still random enough for stochastic optimization.
+
+    The order is evaluated lazily, one window at a time (see :class:`BlockPermutation`),
+    so even for a huge :class:`RangeIndex` only the order of blocks is kept in memory.
+
+    An instance could be passed as a `shuffle` argument to `gen_batch` and `next_batch`,
+    while ``shuffle='block'`` stands for ``BlockShuffle()``.
+
+    Parameters
+    ----------
+    block_size : int
+        The number of contiguous items in a block.
+    window : int
+        The number of blocks in a window within which items are shuffled.
+        If 1, the order of items within each block is shuffled.
+        If 0, items within blocks are not shuffled at all.
+    seed : int or numpy.random.RandomState
+        A seed or a random state for a reproducible shuffle.
+        If None, the global numpy random state is used.
+
+    Examples
+    --------
+    >>> for batch in dataset.gen_batch(64, shuffle=BlockShuffle(block_size=512, window=4, seed=42)):
+    ...     pass
+    """
+    def __init__(self, block_size=1024, window=4, seed=None):
+        if block_size < 1:
+            raise ValueError("block_size should be a positive integer")
+        if window < 0:
+            raise ValueError("window should be a non-negative integer")
+        self.block_size = block_size
+        self.window = window
+        if isinstance(seed, np.random.RandomState) or seed is None:
+            self.random_state = seed
+        else:
+            self.random_state = np.random.RandomState(seed)
+
+    def __call__(self, indices):
+        """ Return a shuffled order of positions for the given items """
+        return self.permutation(len(indices))
+
+    def permutation(self, length):
+        """ Return a block permutation of ``range(length)``
+
+        Parameters
+        ----------
+        length : int
+            The number of items.
+
+        Returns
+        -------
+        BlockPermutation
+            An order which is sliced like an array.
+        """
+        return BlockPermutation(length, self.block_size, self.window, self.random_state or np.random)
+
+    def __repr__(self):
+        return 'BlockShuffle(block_size=%d, window=%d)' % (self.block_size, self.window)
+
+
+class Buckets:
+    """ Batches of items of similar size for variable-size data (sequences, point clouds, images, etc)
+
+    Items are grouped into buckets by their sizes and each batch is formed from a single bucket,
+    so padding items to the largest one in a batch wastes little memory and compute.
+
+    An instance should be passed instead of `batch_size` to `gen_batch`, `next_batch` or `run`
+    of an index, a dataset or a pipeline.
+
+    Parameters
+    ----------
+    sizes : array-like or callable
+        Item sizes (e.g. a sequence length or a number of pixels).
+        An array should be aligned with the index, i.e. contain a size for each item position.
+        A callable takes an item index and returns its size. It is called once for each item
+        and the sizes are cached for an index.
+    batch_size : int
+        A number of items in a batch.
+    budget : int
+        A maximum total size of a padded batch, i.e. `max item size * number of items`
+        (e.g. a number of tokens or pixels). A batch always contains at least one item.
+        Either `batch_size` or `budget` should be specified.
+    boundaries : sequence of int
+        Upper bounds of bucket sizes. Items larger than the last bound get into an extra bucket.
+        If None, all items are sorted by size, so each batch contains items of the closest sizes.
+
+    Notes
+    -----
+    With shuffling items are shuffled before being put into buckets (items of the same size
+    get into different batches each epoch) and the order of batches is shuffled as well.
+    Otherwise batches go from smaller items to larger ones.
+
+    `drop_last` drops incomplete batches of each bucket. It has no effect when `budget` is set.
+
+    Examples
+    --------
+    >>> buckets = Buckets(lambda ix: len(texts[ix]), budget=4096, boundaries=[16, 32, 64, 128])
+    >>> for batch in dataset.gen_batch(buckets, shuffle=True, n_epochs=1):
+    ...     pass
+    """
+    def __init__(self, sizes, batch_size=None, budget=None, boundaries=None):
+        if (batch_size is None) == (budget is None):
+            raise ValueError("Either batch_size or budget should be specified")
+        self.sizes = sizes
+        self.batch_size = batch_size
+        self.budget = budget
+        self.boundaries = np.sort(boundaries) if boundaries is not None else None
+        self._cache = None, None
+
+    def get_sizes(self, index):
+        """ Return an array of item sizes for a given index """
+        if not callable(self.sizes):
+            sizes = np.asarray(self.sizes).reshape(-1)
+            if len(sizes) != len(index):
+                raise ValueError("Sizes should contain %d items, but %d given" % (len(index), len(sizes)))
+            return sizes
+
+        cached_index, sizes = self._cache
+        if cached_index is not index:
+            sizes = np.array([self.sizes(item) for item in index.indices])
+            self._cache = index, sizes
+        return sizes
+
+    def split(self, index, order, drop_last=False):
+        """ Split item positions into batches
+
+        Parameters
+        ----------
+        index : DatasetIndex
+            An index to split.
+        order : array-like of int
+            Item positions in the order they should be put into buckets.
+        drop_last : bool
+            Whether to drop incomplete batches (when `batch_size` is set).
+
+        Returns
+        -------
+        list of numpy.array
+            Item positions for each batch, sorted by bucket and size.
+        """
+        order = np.asarray(order[:])
+        sizes = self.get_sizes(index)[order]
+        if self.boundaries is None:
+            buckets = np.zeros(len(order), dtype=np.intp)
+        else:
+            buckets = np.searchsorted(self.boundaries, sizes, side='left')
+        # a stable sort keeps the initial (e.g. shuffled) order of items of the same size
+        sorter = np.lexsort((sizes, buckets))
+        order, sizes, buckets = order[sorter], sizes[sorter], buckets[sorter]
+
+        batches = []
+        bucket_bounds = np.flatnonzero(np.diff(buckets)) + 1
+        for start, stop in zip(np.r_[0, bucket_bounds], np.r_[bucket_bounds, len(order)]):
+            if self.budget is None:
+                bounds = np.arange(start, stop, self.batch_size)
+                stops = np.minimum(bounds + self.batch_size, stop)
+                if drop_last:
+                    full = stops - bounds == self.batch_size
+                    bounds, stops = bounds[full], stops[full]
+            else:
+                bounds, stops = self._split_by_budget(sizes, start, stop)
+            batches.extend(order[i:j] for i, j in zip(bounds, stops))
+        return batches
+
+    def _split_by_budget(self, sizes, start, stop):
+        """ Split a bucket of items sorted by size into batches within the budget """
+        bounds, stops = [], []
+        while start < stop:
+            # items are sorted by size, so a batch cannot have more items than the budget for its first item
+            max_items = max(1, self.budget // max(sizes[start], 1))
+            end = min(start + max_items, stop)
+            costs = np.maximum(sizes[start:end], 1) * np.arange(1, end - start + 1)
+            end = start + max(1, np.searchsorted(costs, self.budget, side='right'))
+            bounds.append(start)
+            stops.append(end)
+            start = end
+        return bounds, stops
+
+    def __repr__(self):
+        return 'Buckets(batch_size=%s, budget=%s, boundaries=%s)' % (self.batch_size, self.budget,
+                                                                     self.boundaries)
+
+
+def _list_dir(path):
+    """ List a directory with a single `os.scandir` call.
+
+    Returns
+    -------
+    tuple
+        a list of subdirectory names and a list of file names
+    """
+    subdirs, files = [], []
+    try:
+        with os.scandir(path or os.curdir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    pass
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        pass
+    return subdirs, files
+
+
+def _filter_names(names, pattern):
+    """ Select names matching a glob pattern (hidden names are matched only by patterns starting with a dot) """
+    if pattern[0] != '.':
+        names = [name for name in names if name[0] != '.']
+    return fnmatch.filter(names, pattern)
+
+
+def scan_path(path, dirs=False, executor=None):
+    """ Find files or directories matching a glob pattern.
+
+    The result is the same as of ``glob.glob(path, recursive=True)`` filtered by type,
+    but each directory is read only once with :func:`os.scandir` (without a `stat` call per entry)
+    and directories of the same level are read in parallel if ``executor`` is given.
+
+    Parameters
+    ----------
+    path : str
+        A path pattern.
+    dirs : bool
+        Whether to find directories (otherwise files).
+    executor : concurrent.futures.Executor or None
+        An executor to list directories with.
+
+    Returns
+    -------
+    matches : list of tuples
+        (directory path, name) for each item found
+    listed : list of str
+        all the directories which were read or looked into for literal names
+        (their mtimes define whether the result is still valid)
+    """
+    _map = map if executor is None else executor.map
+    listings = dict()
+    checked = []
+
+    def _listed():
+        return list(dict.fromkeys([*listings, *checked]))
+
+    def _list(paths):
+        new_paths = [d for d in paths if d not in listings]
+        listings.update(zip(new_paths, _map(_list_dir, new_paths)))
+        return listings
+
+    parts = path.split(os.sep)
+    root = []
+    while len(parts) > 1 and not glob.has_magic(parts[0]):
+        root.append(parts.pop(0))
+    root = os.sep.join(root) if root != [''] else os.sep
+    frontier = [root] if root == '' or os.path.isdir(root) else []
+
+    for i, part in enumerate(parts):
+        is_last = i == len(parts) - 1
+        if part == '**':
+            # any number of nested directories, including none
+            level, frontier = frontier, []
+            while level:
+                frontier += level
+                listings = _list(level)
+                level = [os.path.join(d, name) for d in level for name in _filter_names(listings[d][0], '*')]
+            if is_last:
+                part = '*'
+            else:
+                continue
+        if not glob.has_magic(part):
+            candidates = [os.path.join(d, part) for d in frontier]
+            # adding or removing a literal name modifies its parent directory
+            checked.extend(frontier)
+            if is_last:
+                check_fn = os.path.isdir if dirs else os.path.isfile
+                return [(d, part) for d, c in zip(frontier, candidates) if check_fn(c)], _listed()
+            frontier = [c for c in candidates if os.path.isdir(c)]
+        else:
+            listings = _list(frontier)
+            if is_last:
+                kind = 0 if dirs else 1
+                return [(d, name) for d in frontier for name in _filter_names(listings[d][kind], part)], _listed()
+            frontier = [os.path.join(d, name) for d in frontier for name in _filter_names(listings[d][0], part)]
+    return [], _listed()
+
+
+class FilePaths:
+    """ A compact storage of full paths for :class:`FilesIndex` items
+
+    Instead of a string per item it keeps a shared table of directories and
+    a shared table of name suffixes (e.g. file extensions stripped from index keys),
+    while each item holds just two integer ids. So a full path is ``dirs[dir_id] + key + suffixes[suffix_id]``.
+
+    Items which names cannot be composed of the key and a suffix keep their names in ``names``.
+
+    Parameters
+    ----------
+    dirs : numpy.array of str
+        a table of directories
+    dir_ids : numpy.array of int
+        a directory id for each item
+    suffixes : numpy.array of str
+        a table of suffixes
+    suffix_ids : numpy.array of int
+        a suffix id for each item
+    names : numpy.array of str or None
+        names of items (if they are not made of keys and suffixes)
+    """
+    def __init__(self, dirs, dir_ids, suffixes, suffix_ids, names=None):
+        self.dirs = dirs
+        self.dir_ids = dir_ids
+        self.suffixes = suffixes
+        self.suffix_ids = suffix_ids
+        self.names = names
+
+    @classmethod
+    def from_paths(cls, keys, dir_paths, names):
+        """ Create a storage from item keys, their directories and names """
+        suffixes = [name[len(key):] for key, name in zip(keys, names)]
+        if all(isinstance(key, str) and name.startswith(key) for key, name in zip(keys, names)):
+            names = None
+        else:
+            suffixes = [''] * len(keys)
+            names = np.asarray(names, dtype=str)
+        dirs, dir_ids = np.unique(np.asarray(dir_paths, dtype=str), return_inverse=True)
+        suffixes, suffix_ids = np.unique(np.asarray(suffixes, dtype=str), return_inverse=True)
+        return cls(dirs, dir_ids.astype(np.int32), suffixes, suffix_ids.astype(np.int32), names)
+
+    @classmethod
+    def from_fullpaths(cls, keys, fullpaths):
+        """ Create a storage from item keys and their full paths """
+        fullpaths = [os.path.split(fullpath) for fullpath in fullpaths]
+        return cls.from_paths(keys, [d for d, _ in fullpaths], [name for _, name in fullpaths])
+
+    @classmethod
+    def concat(cls, storages, keys):
+        """ Join several storages (with corresponding item keys) into one with common tables """
+        pairs = [(s, k) for s, k in zip(storages, keys) if len(s) > 0]
+        if len(pairs) == 0:
+            return cls.empty()
+        storages, keys = zip(*pairs)
+        if len(storages) == 1:
+            return storages[0]
+
+        def _merge(tables, ids):
+            table, inverse = np.unique(np.concatenate(tables), return_inverse=True)
+            offsets = np.cumsum([0] + [len(t) for t in tables[:-1]])
+            return table, np.concatenate([inverse[offset + i] for offset, i in zip(offsets, ids)]).astype(np.int32)
+
+        dirs, dir_ids = _merge([s.dirs for s in storages], [s.dir_ids for s in storages])
+        if all(s.names is None for s in storages):
+            suffixes, suffix_ids = _merge([s.suffixes for s in storages], [s.suffix_ids for s in storages])
+            names = None
+        else:
+            names = np.concatenate([s.get_names(k) for s, k in zip(storages, keys)])
+            suffixes, suffix_ids = np.asarray([''], dtype=str), np.zeros(len(names), dtype=np.int32)
+        return cls(dirs, dir_ids, suffixes, suffix_ids, names)
+
+    @classmethod
+    def empty(cls):
+        """ Create an empty storage """
+        ids = np.zeros(0, dtype=np.int32)
+        return cls(np.asarray([], dtype=str), ids, np.asarray([''], dtype=str), ids)
+
+    def __len__(self):
+        return len(self.dir_ids)
+
+    def get_names(self, keys=None):
+        """ Return item names (the keys are needed if names are not stored) """
+        if self.names is not None:
+            return self.names
+        return np.char.add(np.asarray(keys, dtype=str), self.suffixes[self.suffix_ids])
+
+    def get(self, pos, key):
+        """ Return a full path for an item at a given position """
+        name = self.names[pos] if self.names is not None else key + self.suffixes[self.suffix_ids[pos]]
+        return os.path.join(self.dirs[self.dir_ids[pos]], name)
+
+    def subset(self, pos):
+        """ Return a storage for items at given positions (tables are shared, not copied) """
+        names = self.names[pos] if self.names is not None else None
+        return type(self)(self.dirs, self.dir_ids[pos], self.suffixes, self.suffix_ids[pos], names)
+
+    def save(self, file_name, keys, replace=True, **kwargs):
+        """ Save the storage with item keys and additional arrays into a `.npz` file
+
+        If `replace` is True, the file is written into a temporary file which then replaces `file_name`,
+        otherwise the file is overwritten in place (which does not modify its directory).
+        """
+        arrays = dict(keys=np.asarray(keys, dtype=str), dirs=self.dirs, dir_ids=self.dir_ids,
+                      suffixes=self.suffixes, suffix_ids=self.suffix_ids)
+        if self.names is not None:
+            arrays['names'] = self.names
+        tmp_name = file_name + '.tmp' if replace else file_name
+        with open(tmp_name, 'wb') as f:
+            np.savez(f, **arrays, **kwargs)
+        if replace:
+            os.replace(tmp_name, file_name)
+
+    @classmethod
+    def load(cls, file_name):
+        """ Load item keys, a storage and all other arrays saved with :meth:`.save` """
+        with np.load(file_name, allow_pickle=False) as data:
+            arrays = dict(data.items())
+        storage = cls(arrays.pop('dirs'), arrays.pop('dir_ids'), arrays.pop('suffixes'), arrays.pop('suffix_ids'),
+                      arrays.pop('names', None))
+        return arrays.pop('keys'), storage, arrays
+
+
 class FilesIndex(DatasetIndex):
     """ Index with the list of files or directories with the given path pattern
 
+    Full paths are kept compactly (see :class:`FilePaths`), and directories are scanned
+    with :func:`os.scandir` in parallel threads.
+
     Examples
     --------
 
@@ -505,6 +1731,10 @@ class FilesIndex(DatasetIndex):
 
     >>> fi = FilesIndex(path=['/path/to/archive/2016/*','/path/to/current/file/*'], no_ext=True)
 
+    Save the scan of a huge directory tree and reuse it until any of scanned directories is modified:
+
+    >>> fi = FilesIndex(path='/path/to/data/**/*.png', index_file='/path/to/data_index.npz')
+
     To get a path to the file call `get_fullpath(index_id)`:
 
     >>> path = fi.get_fullpath(some_id)
@@ -530,50 +1760,126 @@ class FilesIndex(DatasetIndex):
         return self.build_from_path(path, *args, **kwargs)
 
     def build_from_index(self, index, paths, dirs):
-        """ Build index from another index for indices given. """
-        if isinstance(paths, dict):
-            self._paths = dict((file, paths[file]) for file in index)
+        """ Build index from another index for indices given.
+
+        Parameters
+        ----------
+        index : array-like
+            index items
+        paths : FilePaths, dict or array-like
+            full paths of items: a storage or a dict aligned with ``index`` or a mapping from items to paths
+        dirs : bool
+            whether items are directories
+        """
+        index = np.atleast_1d(np.asarray(index))
+        if isinstance(paths, FilePaths):
+            self._paths = paths
+        elif isinstance(paths, dict):
+            self._paths = FilePaths.from_fullpaths(index, [paths[file] for file in index])
         else:
-            self._paths = dict((file, paths[pos]) for pos, file in np.ndenumerate(index))
+            self._paths = FilePaths.from_fullpaths(index, paths)
         self.dirs = dirs
         return index
 
-    def build_from_path(self, path, dirs=False, no_ext=False, sort=False):
-        """ Build index from a path/glob or a sequence of paths/globs. """
+    def build_from_path(self, path, dirs=False, no_ext=False, sort=False, index_file=None, n_workers=None):
+        """ Build index from a path/glob or a sequence of paths/globs.
+
+        Parameters
+        ----------
+        path : str or sequence of str
+            path patterns (see :func:`glob.glob`)
+        dirs : bool
+            whether to index directories instead of files
+        no_ext : bool
+            whether to strip extensions from index items
+        sort : bool
+            whether to sort index items
+        index_file : str or None
+            a file to save the scan results to. If the file exists and none of the scanned directories
+            has been modified since it was saved, the index is loaded from the file instead of scanning.
+        n_workers : int or None
+            the number of threads to scan directories with (default is defined by
+            :class:`concurrent.futures.ThreadPoolExecutor`).
+        """
         if isinstance(path, str):
             paths = [path]
         else:
-            paths = path
-
-        _all_index = None
-        _all_paths = dict()
-        for one_path in paths:
-            _index, _paths = self.build_from_one_path(one_path, dirs, no_ext)
-            if _all_index is None:
-                _all_index = _index
-            else:
-                _all_index = np.concatenate((_all_index, _index))
-            _all_paths.update(_paths)
+            paths = list(path)
+        scan_params = np.asarray(repr((paths, bool(dirs), bool(no_ext))))
+
+        scan = self._load_scan(index_file, scan_params) if index_file is not None else None
+        if scan is None:
+            with cf.ThreadPoolExecutor(max_workers=n_workers) as executor:
+                scans = [self.build_from_one_path(one_path, dirs, no_ext, executor) for one_path in paths]
+            _all_index = np.concatenate([np.asarray(_index, dtype=str) for _index, _, _ in scans])
+            _all_paths = FilePaths.concat([_paths for _, _paths, _ in scans], [_index for _index, _, _ in scans])
+            if index_file is not None:
+                self._save_scan(index_file, scan_params, scans, _all_index, _all_paths)
+        else:
+            _all_index, _all_paths = scan
 
         if sort:
-            _all_index.sort()
+            order = np.argsort(_all_index, kind='mergesort')
+            _all_index = _all_index[order]
+            _all_paths = _all_paths.subset(order)
         self._paths = _all_paths
         self.dirs = dirs
 
         return _all_index
 
-    def build_from_one_path(self, path, dirs=False, no_ext=False):
-        """ Build index from a path/glob. """
-        check_fn = os.path.isdir if dirs else os.path.isfile
-        pathlist = glob.iglob(path, recursive=True)
-        _full_index = np.asarray([self.build_key(fname, no_ext) for fname in pathlist if check_fn(fname)])
-        if len(_full_index):
-            _index = _full_index[:, 0]
-            _paths = _full_index[:, 1]
-        else:
-            _index, _paths = [], []
-        _paths = dict(zip(_index, _paths))
-        return _index, _paths
+    @staticmethod
+    def _get_mtime(path):
+        try:
+            return os.stat(path or os.curdir).st_mtime_ns
+        except OSError:
+            return -1
+
+    def _save_scan(self, index_file, scan_params, scans, keys, paths):
+        """ Save index items, paths and mtimes of scanned directories into an index file """
+        listed = list(dict.fromkeys(d for _, _, _listed in scans for d in _listed))
+        mtimes = np.asarray([self._get_mtime(d) for d in listed], dtype=np.int64)
+        params = dict(params=scan_params, scanned_dirs=np.asarray(listed, dtype=str))
+        paths.save(index_file, keys, scanned_mtimes=mtimes, **params)
+
+        # saving the file modifies its directory, so if it is scanned too, its new mtime is written in place
+        index_dir = os.path.dirname(os.path.abspath(index_file))
+        own = [i for i, d in enumerate(listed) if os.path.abspath(d or os.curdir) == index_dir]
+        if own:
+            mtimes[own] = self._get_mtime(index_dir)
+            paths.save(index_file, keys, replace=False, scanned_mtimes=mtimes, **params)
+
+    def _load_scan(self, index_file, scan_params):
+        """ Load index items and paths from an index file if it is still valid """
+        if not os.path.isfile(index_file):
+            return None
+        try:
+            keys, paths, arrays = FilePaths.load(index_file)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        if arrays.get('params') != scan_params:
+            return None
+        for path, mtime in zip(arrays['scanned_dirs'], arrays['scanned_mtimes']):
+            if self._get_mtime(path) != mtime:
+                return None
+        return keys, paths
+
+    def build_from_one_path(self, path, dirs=False, no_ext=False, executor=None):
+        """ Build index from a path/glob.
+
+        Returns
+        -------
+        index : list
+            index items
+        paths : FilePaths
+            full paths of items
+        listed : list of str
+            scanned directories
+        """
+        matches, listed = scan_path(path, dirs, executor)
+        dir_paths = [d for d, _ in matches]
+        names = [name for _, name in matches]
+        _index = [self.build_key(os.path.join(d, name), no_ext)[0] for d, name in matches]
+        return _index, FilePaths.from_paths(_index, dir_paths, names), listed
 
     @staticmethod
     def build_key(fullpathname, no_ext=False):
@@ -588,8 +1894,10 @@ class FilesIndex(DatasetIndex):
 
     def get_fullpath(self, key):
         """ Return the full path name for an item in the index. """
-        return self._paths[key]
+        return self._paths.get(self.get_pos(key), key)
 
     def create_subset(self, index):
         """ Return a new FilesIndex based on the subset of indices given. """
-        return type(self).from_index(index=index, paths=self._paths, dirs=self.dirs)
+        index = np.atleast_1d(index)
+        paths = self._paths.subset(self.get_pos(index))
+        return type(self).from_index(index=index, paths=paths, dirs=self.dirs)
@@ -0,0 +1,259 @@
+""" Contains a cache for decoded images """
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+
+class ImageCache:
+    """ A cache of decoded images with LRU eviction by a byte budget
+
+    Images are cached by a file path, file modification time and decoding parameters,
+    so a changed file is decoded again.
+
+    The cache is shared by all threads which use it (e.g. prefetching or parallel loading).
+    With ``shared=True`` decoded pixels are stored in named `multiprocessing.shared_memory` segments
+    (one per image), so processes on the same host (process pool workers, research workers, etc)
+    which use caches with the same `name` reuse images decoded by each other without decoding them again.
+    Each process keeps no more than `max_bytes` of images mapped and removes segments created by itself
+    when they are evicted.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of cached images in bytes.
+    shared : bool
+        Whether to store images in shared memory (requires python 3.8+).
+    name : str
+        A prefix for shared memory segment names. Caches with the same name share images.
+        A segment name is the prefix followed by 17 characters, while macOS limits names to 30 characters,
+        so the prefix should not be longer than 13 characters there.
+
+    Attributes
+    ----------
+    hits : int
+        The number of images found in the cache.
+    misses : int
+        The number of images decoded.
+    evictions : int
+        The number of images evicted from the cache.
+
+    Examples
+    --------
+    ::
+
+        cache = ImageCache(max_bytes=4 * 2**30, shared=True)
+        pipeline.load(fmt='image', components='images', cache=cache)
+        ...
+        print(cache.stats)
+    """
+    _HEADER_SIZE = 64
+    _MAX_DIMS = 6
+
+    def __init__(self, max_bytes=2**30, shared=False, name='batchflow'):
+        if shared and shared_memory is None:
+            raise ImportError("Shared image cache requires multiprocessing.shared_memory (python 3.8+)")
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(hits=0, misses=0, evictions=0)
+        state['_items'] = OrderedDict()
+        state['_sizes'] = {}
+        state['_nbytes'] = 0
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def nbytes(self):
+        """ int : the total size of cached images in bytes """
+        return self._nbytes
+
+    @property
+    def stats(self):
+        """ dict : cache counters """
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    items=len(self._items), nbytes=self._nbytes)
+
+    def make_key(self, path, params=None):
+        """ Return a cache key for a file and decoding parameters """
+        stat = os.stat(path)
+        key = '%s:%d:%d:%r' % (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, params)
+        return self.name + '_' + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def get(self, path, loader, params=None):
+        """ Return a decoded image from the cache or decode and cache it
+
+        Parameters
+        ----------
+        path : str
+            A path to an image file.
+        loader : callable
+            A function without arguments which decodes the image and returns a numpy array.
+        params
+            Decoding parameters which affect the result (e.g. target shape or mode).
+
+        Returns
+        -------
+        np.ndarray
+            A read-only array for a process-local cache or a copy for a shared cache.
+        """
+        key = self.make_key(path, params)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                image = self._read(item)
+                if image is not None:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return image
+                self._release(self._items.pop(key))
+                self._nbytes -= self._sizes.pop(key)
+
+        ready = True
+        if self.shared:
+            segment = self._attach(key)
+            if segment is not None:
+                image = self._read(segment)
+                if image is not None:
+                    with self._lock:
+                        self.hits += 1
+                        self._put(key, segment, segment.size)
+                    return image
+                # another process is still writing the image
+                segment.close()
+                ready = False
+
+        image = np.asarray(loader())
+        with self._lock:
+            self.misses += 1
+        if image.nbytes > self.max_bytes or not ready:
+            return image
+
+        if self.shared:
+            item = self._create(key, image)
+            if item is None:
+                return image
+            size = item.size
+        else:
+            item = image.copy() if image.flags.writeable else image
+            item.flags.writeable = False
+            size = item.nbytes
+        with self._lock:
+            self._put(key, item, size)
+        return image if self.shared else item
+
+    def clear(self):
+        """ Remove all images from the cache """
+        with self._lock:
+            while self._items:
+                self._evict()
+
+    def _put(self, key, item, size):
+        if key in self._items:
+            self._release(self._items.pop(key))
+            self._nbytes -= self._sizes.pop(key)
+        self._items[key] = item
+        self._sizes[key] = size
+        self._nbytes += size
+        while self._nbytes > self.max_bytes and len(self._items) > 1:
+            self._evict()
+            self.evictions += 1
+
+    def _evict(self):
+        key, item = self._items.popitem(last=False)
+        self._nbytes -= self._sizes.pop(key)
+        self._release(item)
+
+    def _read(self, item):
+        """ Return an image from a cache item or None if a shared segment is not filled yet """
+        if not self.shared:
+            return item
+        dtype = bytes(item.buf[:8]).rstrip(b'\0')
+        if not dtype:
+            return None
+        dtype = np.dtype(dtype.decode())
+        header = np.frombuffer(item.buf, dtype=np.int64, count=self._MAX_DIMS + 1, offset=8)
+        shape = tuple(header[1:header[0] + 1])
+        data = np.frombuffer(item.buf, dtype=dtype, count=int(np.prod(shape)), offset=self._HEADER_SIZE)
+        image = data.reshape(shape).copy()
+        del data, header
+        return image
+
+    def _create(self, key, image):
+        """ Return a new segment with the image, a ready segment created by another process or None """
+        if image.ndim > self._MAX_DIMS:
+            raise ValueError("Images with more than %d dimensions cannot be cached" % self._MAX_DIMS)
+        try:
+            segment = shared_memory.SharedMemory(key, create=True, size=self._HEADER_SIZE + image.nbytes)
+        except FileExistsError:
+            segment = self._attach(key)
+            if segment is None:
+                return self._create(key, image)
+            if self._read(segment) is None:
+                # another process is still writing the image
+                segment.close()
+                return None
+            return segment
+        segment.owner = True
+        header = np.frombuffer(segment.buf, dtype=np.int64, count=self._MAX_DIMS + 1, offset=8)
+        header[:] = 0
+        header[0] = image.ndim
+        header[1:image.ndim + 1] = image.shape
+        data = np.frombuffer(segment.buf, dtype=image.dtype, count=image.size, offset=self._HEADER_SIZE)
+        data[:] = image.ravel()
+        del data, header
+        # dtype is written last as it marks the segment as ready to read
+        segment.buf[:8] = image.dtype.str.encode().ljust(8, b'\0')
+        return segment
+
+    @staticmethod
+    def _attach(key):
+        try:
+            segment = shared_memory.SharedMemory(key)
+        except FileNotFoundError:
+            return None
+        # the segment is removed by the process which created it, so the resource tracker
+        # of this process should not remove it at exit
+        if os.name == 'posix':
+            resource_tracker.unregister(segment._name, 'shared_memory')     # pylint: disable=protected-access
+        segment.owner = False
+        return segment
+
+    def _release(self, item):
+        if self.shared:
+            item.close()
+            if item.owner:
+                try:
+                    item.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def __del__(self):
+        if self.shared and self.__dict__.get('_items'):
+            try:
+                self.clear()
+            except Exception:   # pylint: disable=broad-except
+                pass
@@ -176,6 +176,7 @@ class TorchModel(BaseModel):
         self._inputs = dict()
         self.predictions = None
         self.loss = None
+        self._built_config = None
 
         super().__init__(*args, **kwargs)
 
@@ -465,6 +466,17 @@ class TorchModel(BaseModel):
 
         return config
 
+    def _get_built_config(self):
+        """ Return a config from :meth:`.build_config` which is built again only when any config changes """
+        version = self.config.version
+        if version is not None and self._built_config is not None and self._built_config[0] == version:
+            return self._built_config[1]
+
+        config = self.build_config()
+        version = self.config.version
+        self._built_config = (version, config) if config.version is not None and version is not None else None
+        return config
+
     def _add_block(self, blocks, name, config, inputs):
         if isinstance(config[name], nn.Module):
             block = config[name]
@@ -724,7 +736,7 @@ class TorchModel(BaseModel):
         if use_lock:
             self._train_lock.release()
 
-        config = self.build_config()
+        config = self._get_built_config()
         self.output(inputs=self.predictions, predictions=config['predictions'],
                     ops=config['output'], **config['common'])
         output = self._fill_output(fetches)
@@ -744,7 +756,7 @@ class TorchModel(BaseModel):
             else:
                 self.loss = self.loss_fn(self.predictions, targets)
 
-        config = self.build_config()
+        config = self._get_built_config()
         self.output(inputs=self.predictions, predictions=config['predictions'],
                     ops=config['output'], **config['common'])
         output = self._fill_output(fetches)
@@ -1,6 +1,11 @@
 """ Contains named expression classes"""
+from numbers import Number
+
 import numpy as np
 
+from .sampler import BufferedSampler
+from .rng import make_rng, get_distribution
+
 
 class _DummyBatch:
     """ A fake batch for static models """
@@ -74,6 +79,13 @@ class NamedExpression:
         else:
             self.assign(value, *args, **kwargs)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # compiled evaluators are closures, so they are compiled again after unpickling
+        if '_params' in state:
+            state['_params'] = None
+        return state
+
     def __repr__(self):
         return type(self).__name__ + '(' + str(self.name) + ')'
 
@@ -127,6 +139,79 @@ def eval_expr(expr, batch=None, pipeline=None, model=None):
     return expr
 
 
+def compile_expr(expr):
+    """ Analyse an expression once and return a function which evaluates it
+
+    Subtrees without named expressions are not copied or traversed on evaluation,
+    but returned as is, so only named expressions and containers holding them are evaluated.
+
+    Parameters
+    ----------
+    expr
+        an expression, i.e. a named expression or a (nested) list, tuple or dict with named expressions
+
+    Returns
+    -------
+    callable
+        a function with `batch`, `pipeline` and `model` arguments which returns the same value
+        as :func:`eval_expr`. Note that constant subtrees are returned without copying,
+        so they should not be modified in-place.
+    """
+    evaluate = _compile_expr(expr)
+    if evaluate is None:
+        def _evaluate(batch=None, pipeline=None, model=None):
+            _ = batch, pipeline, model
+            return expr
+    else:
+        def _evaluate(batch=None, pipeline=None, model=None):
+            if batch is None:
+                batch = _DummyBatch(pipeline)
+            return evaluate(batch, pipeline, model)
+    return _evaluate
+
+
+def _compile_expr(expr):
+    """ Return a function which evaluates an expression or None if the expression is constant """
+    if isinstance(expr, NamedExpression):
+        return lambda batch, pipeline, model: eval_expr(expr, batch=batch, pipeline=pipeline, model=model)
+
+    if isinstance(expr, (list, tuple)):
+        items = [(_compile_expr(val), val) for val in expr]
+        if all(evaluate is None for evaluate, _ in items):
+            return None
+        container = type(expr)
+        def _evaluate_sequence(batch, pipeline, model):
+            return container([val if evaluate is None else evaluate(batch, pipeline, model)
+                              for evaluate, val in items])
+        return _evaluate_sequence
+
+    if isinstance(expr, dict):
+        items = [(_compile_expr(key), key, _compile_expr(val), val) for key, val in expr.items()]
+        if all(eval_key is None and eval_val is None for eval_key, _, eval_val, _ in items):
+            return None
+        container = type(expr)
+        def _evaluate_dict(batch, pipeline, model):
+            result = container()
+            for eval_key, key, eval_val, val in items:
+                key = key if eval_key is None else eval_key(batch, pipeline, model)
+                result[key] = val if eval_val is None else eval_val(batch, pipeline, model)
+            return result
+        return _evaluate_dict
+
+    return None
+
+
+def _has_named_expr(expr):
+    """ Check whether an expression contains named expressions """
+    if isinstance(expr, NamedExpression):
+        return True
+    if isinstance(expr, (list, tuple)):
+        return any(_has_named_expr(val) for val in expr)
+    if isinstance(expr, dict):
+        return any(_has_named_expr(key) or _has_named_expr(val) for key, val in expr.items())
+    return False
+
+
 class B(NamedExpression):
     """ Batch component or attribute name
 
@@ -172,16 +257,24 @@ class C(NamedExpression):
 
         C('model_class')
         C('GPU')
+        C('model/optimizer/name')
     """
+    def __init__(self, name, copy=False):
+        super().__init__(name, copy)
+        # a path is split once as most config options are static
+        self._keys = name.split('/') if isinstance(name, str) else None
+
     def get(self, batch=None, pipeline=None, model=None):
         """ Return a value of a pipeline config """
-        name = super().get(batch=batch, pipeline=pipeline, model=model)
+        if self._keys is not None:
+            keys = self._keys
+        else:
+            keys = super().get(batch=batch, pipeline=pipeline, model=model).split('/')
         pipeline = batch.pipeline if batch is not None else pipeline
         config = pipeline.config or {}
 
-        recursive_names = name.split('/')
-        for n in recursive_names:
-            config = config.get(n)
+        for key in keys:
+            config = config.get(key)
         return config
 
     def assign(self, value, batch=None, pipeline=None, model=None):
@@ -207,6 +300,7 @@ class F(NamedExpression):
         self.args = args
         self.kwargs = kwargs
         self._pass = _pass
+        self._params = None
 
     def get(self, batch=None, pipeline=None, model=None):
         """ Return a value from a callable """
@@ -220,8 +314,9 @@ class F(NamedExpression):
                 args += [batch]
             if model is not None:
                 args += [model]
-        fargs = eval_expr(self.args, batch=batch, pipeline=pipeline, model=model)
-        fkwargs = eval_expr(self.kwargs, batch=batch, pipeline=pipeline, model=model)
+        if self._params is None:
+            self._params = compile_expr((self.args, self.kwargs))
+        fargs, fkwargs = self._params(batch=batch, pipeline=pipeline, model=model)
         return name(*args, *fargs, **fkwargs)
 
     def assign(self, *args, **kwargs):
@@ -252,6 +347,21 @@ class V(NamedExpression):
         value = pipeline.get_variable(name)
         return value
 
+    def set(self, value, batch=None, pipeline=None, model=None, mode='w'):
+        """ Set a value to a pipeline variable
+
+        Accumulator variables (see :class:`~batchflow.variables.Accumulator`) are updated without locks
+        in all modes except 'w'.
+        """
+        if mode in ['a', 'append', 'e', 'extend', 'u', 'update']:
+            name = super().get(batch=batch, pipeline=pipeline, model=model)
+            _pipeline = batch.pipeline if batch is not None else pipeline
+            if _pipeline.variables.is_accumulator(name):
+                value = eval_expr(value, batch=batch, pipeline=pipeline, model=model)
+                _pipeline.variables.accumulate(name, value, mode)
+                return
+        super().set(value, batch=batch, pipeline=pipeline, model=model, mode=mode)
+
     def assign(self, value, batch=None, pipeline=None, model=None):
         """ Assign a value to a pipeline variable """
         name = super().get(batch=batch, pipeline=pipeline, model=model)
@@ -266,6 +376,15 @@ class R(NamedExpression):
     -----
     If `size` is needed, it should be specified as a named, not a positional argument.
 
+    Unless `state` or `seed` is given, values are drawn with a batch random generator
+    (see :attr:`Batch.random <batchflow.Batch.random>`), so expressions evaluated for different batches
+    (e.g. in prefetching threads) use independent and reproducible random streams.
+    Otherwise, the expression uses its own generator seeded with `seed` (see :mod:`~batchflow.rng`).
+
+    If `buffer` is given, values are drawn from the expression's own random state in blocks
+    of `buffer` values (see :class:`~batchflow.sampler.BufferedSampler`), which is much faster
+    for small samples. The buffer is drawn anew when distribution parameters change.
+
     Examples
     --------
     ::
@@ -273,36 +392,62 @@ class R(NamedExpression):
         R('normal', 0, 1)
         R('poisson', lam=5.5, seed=42, size=3)
         R(['metro', 'taxi', 'bike'], p=[.6, .1, .3], size=10)
+        R('uniform', 0, 360, size=B('size'), buffer=100000)
     """
-    def __init__(self, name=None, *args, state=None, seed=None, size=None, **kwargs):
+    def __init__(self, name=None, *args, state=None, seed=None, size=None, buffer=None, **kwargs):
         if not (callable(name) or isinstance(name, (str, NamedExpression))):
             args = (name,) + args
             name = 'choice'
         super().__init__(name)
-        if isinstance(state, np.random.RandomState):
-            self.random_state = state
-        else:
-            self.random_state = np.random.RandomState(seed)
+        self._own_state = state is not None or seed is not None or buffer is not None
+        self.buffer = buffer
+        self._buffered = None
+        self._variable_params = _has_named_expr((args, kwargs))
+        self.random_state = make_rng(state if state is not None else seed)
         self.args = args
         self.kwargs = kwargs
         self.size = size
+        self._params = None
 
     def get(self, batch=None, pipeline=None, model=None):
         """ Return a value of a random variable """
         name = super().get(batch=batch, pipeline=pipeline, model=model)
+        random = getattr(batch, 'random', None) if not self._own_state else None
+        random = random if random is not None else self.random_state
         if callable(name):
             pass
-        elif isinstance(name, str) and hasattr(self.random_state, name):
-            name = getattr(self.random_state, name)
+        elif isinstance(name, str):
+            try:
+                name = get_distribution(random, name)
+            except AttributeError as e:
+                raise TypeError('Random distribution should be a callable or a numpy distribution') from e
         else:
             raise TypeError('Random distribution should be a callable or a numpy distribution')
-        args = eval_expr(self.args, batch=batch, pipeline=pipeline, model=model)
+        if self._params is None:
+            self._params = compile_expr((self.args, self.kwargs))
+        args, kwargs = self._params(batch=batch, pipeline=pipeline, model=model)
         if self.size is not None:
-            self.kwargs['size'] = self.size
-        kwargs = eval_expr(self.kwargs, batch=batch, pipeline=pipeline, model=model)
+            kwargs = {**kwargs, 'size': eval_expr(self.size, batch=batch, pipeline=pipeline, model=model)}
 
+        if self.buffer is not None:
+            return self._sample_buffered(name, args, kwargs)
         return name(*args, **kwargs)
 
+    def _sample_buffered(self, func, args, kwargs):
+        """ Return values from a buffer of pre-drawn values """
+        size = kwargs.pop('size', None)
+        params = repr((args, sorted(kwargs.items()))) if self._variable_params else None
+        if self._buffered is None or self._buffered[0] != params:
+            sampler = BufferedSampler(lambda n: func(*args, size=n, **kwargs), block_size=self.buffer)
+            self._buffered = params, sampler
+        sampler = self._buffered[1]
+        if size is None:
+            return sampler.sample(1)[0]
+        if isinstance(size, Number):
+            return sampler.sample(size)
+        sample = sampler.sample(int(np.prod(size)))
+        return sample.reshape(*size, *sample.shape[1:])
+
     def assign(self, *args, **kwargs):
         """ Assign a value """
         _ = args, kwargs
@@ -5,12 +5,15 @@ import asyncio
 import logging
 import warnings
 import queue as q
+from numbers import Number
 import numpy as np
 
 from .base import Baseset
+from .batch_pool import BatchPool
 from .exceptions import SkipBatchException
-from .named_expr import NamedExpression, V, eval_expr
+from .named_expr import NamedExpression, V, eval_expr, compile_expr
 from .model_dir import ModelDirectory
+from .rng import make_seed_sequence, make_rng
 from .variables import VariableDirectory
 from .models.metrics import ClassificationMetrics, SegmentationMetricsByPixels, SegmentationMetricsByInstances
 
@@ -53,6 +56,94 @@ def mult_option(a, b):
     return a * b if a is not None and b is not None else a if a is not None else b
 
 
+class ExecutionPlan:
+    """ Pre-drawn random numbers which decide whether probabilistic actions are executed
+
+    Numbers for all probabilistic actions are drawn for a block of upcoming batches in one call
+    from a dedicated generator. Each batch gets a row of numbers in the order batches are generated
+    and consumes them one by one as probabilistic actions are checked. If a batch needs more numbers
+    (e.g. when a nested pipeline is repeated), they are drawn from the batch random generator.
+
+    If `record` is True, all numbers used by batches and repeat counts given by named expressions
+    (e.g. ``pipeline * R('integers', 1, 4)``) are recorded, so a run could be replayed exactly
+    by passing the plan to :meth:`~.Pipeline.gen_batch` or :meth:`~.Pipeline.run` as `exec_plan`.
+    Recorded rows take memory for each batch of a run, so recording is off by default.
+
+    Parameters
+    ----------
+    n_actions : int
+        the number of probabilistic actions in a pipeline
+    seed : int, np.random.SeedSequence or None
+        a seed for the generator (see :mod:`~batchflow.rng`)
+    block_size : int
+        the number of batches to draw numbers for at once
+    replay : ExecutionPlan or None
+        a recorded plan of a previous run to replay
+    record : bool
+        whether to record numbers used by batches
+
+    Attributes
+    ----------
+    rows : list of _PlanRow
+        numbers and repeat counts used by each batch in the order batches are generated (if recorded)
+    """
+    def __init__(self, n_actions, seed=None, block_size=64, replay=None, record=False):
+        if replay is not None and not replay.record:
+            raise ValueError("Only a recorded execution plan can be replayed (see `record_plan` in `gen_batch`)")
+        self.n_actions = n_actions
+        self.block_size = block_size
+        self.record = record
+        self.random = make_rng(seed)
+        self.rows = []
+        self._n_rows = 0
+        self._replay = list(replay.rows) if replay is not None else None
+        self._block = np.empty((0, n_actions))
+
+    def next_row(self):
+        """ Return numbers for the next batch """
+        if self._replay is not None:
+            if self._n_rows >= len(self._replay):
+                raise RuntimeError("The replayed execution plan has fewer batches than the run")
+            replayed = self._replay[self._n_rows]
+            row = _PlanRow(replayed.values, replayed.extra, replayed.repeats)
+        else:
+            if len(self._block) == 0:
+                self._block = self.random.random((self.block_size, self.n_actions))
+            row = _PlanRow(self._block[0])
+            self._block = self._block[1:]
+        self._n_rows += 1
+        if self.record:
+            self.rows.append(row)
+        return row
+
+
+class _PlanRow:
+    """ Numbers and repeat counts of an execution plan for one batch """
+    def __init__(self, values, extra=None, repeats=None):
+        self.values = values
+        self.extra = list(extra) if extra is not None else []
+        self.repeats = list(repeats) if repeats is not None else []
+        self._position = 0
+        self._repeat_position = 0
+
+    def next(self, random):
+        """ Return the next number, draw it from `random` if there are no numbers left """
+        position, self._position = self._position, self._position + 1
+        if position < len(self.values):
+            return self.values[position]
+        position -= len(self.values)
+        if position == len(self.extra):
+            self.extra.append(random.random())
+        return self.extra[position]
+
+    def repeat(self, value):
+        """ Return the next recorded repeat count, record `value` if there are no counts left """
+        position, self._repeat_position = self._repeat_position, self._repeat_position + 1
+        if position == len(self.repeats):
+            self.repeats.append(value)
+        return self.repeats[position]
+
+
 def hashable(x):
     """ Check if x is hashable """
     try:
@@ -92,6 +183,9 @@ class Pipeline:
             self._lazy_run = pipeline._lazy_run          # pylint: disable=protected-access
             self.models = pipeline.models.copy()
 
+        self.random_seed = None if pipeline is None else getattr(pipeline, 'random_seed', None)
+        self.exec_plan = None
+        self._compiled_exprs = {}
         self._stop_flag = False
         self._executor = None
         self._service_executor = None
@@ -302,6 +396,10 @@ class Pipeline:
             an initial value for the variable to set before each run
         lock : bool
             whether to lock a variable before each update (default: True)
+        accumulate : str
+            if given, the variable accumulates values appended, extended or updated in actions,
+            `update_variable`, `inc_variable` and model outputs without locks.
+            One of 'count', 'sum', 'list', 'concat' or 'metrics' (see :class:`~.variables.Accumulator`).
 
         Returns
         -------
@@ -313,6 +411,7 @@ class Pipeline:
                     .init_variable("iterations", default=0)
                     .init_variable("accuracy", init_on_each_run=0)
                     .init_variable("loss_history", init_on_each_run=list)
+                    .init_variable("predictions", accumulate='concat', init_on_each_run=None)
                     .load('/some/path', fmt='blosc')
                     .train_resnet()
         """
@@ -423,9 +522,11 @@ class Pipeline:
         return self.append_action()
 
     def _exec_inc_variable(self, _, action):
-        if self.has_variable(action['var_name']):
+        if self.variables.is_accumulator(action['var_name']):
+            self.variables.accumulate(action['var_name'], 1)
+        elif self.has_variable(action['var_name']):
             self.variables.lock(action['var_name'])
-            self.set_variable(action['var_name'], self.get_variable(action['var_name']) + 1)
+            self.variables.set(action['var_name'], self.get_variable(action['var_name']) + 1)
             self.variables.unlock(action['var_name'])
         else:
             raise KeyError("No such variable %s exists" % action['var_name'])
@@ -472,8 +573,8 @@ class Pipeline:
         return self.append_action(*args, **kwargs)
 
     def _exec_print(self, batch, action):
-        args_value = self._eval_expr(action['args'], batch=batch)
-        kwargs_value = self._eval_expr(action['kwargs'], batch=batch)
+        args_value = self._eval_action_expr(action['args'], batch=batch)
+        kwargs_value = self._eval_action_expr(action['kwargs'], batch=batch)
 
         args = []
         if len(args_value) == 0:
@@ -522,7 +623,7 @@ class Pipeline:
 
     def _exec_one_action(self, batch, action, args, kwargs):
         if self._needs_exec(batch, action):
-            repeat = self._eval_expr(action['repeat'], batch=batch) or 1
+            repeat = self._get_repeat(batch, action)
             for _ in range(repeat):
                 batch.pipeline = self
                 action_method, _ = self._get_action_method(batch, action['name'])
@@ -532,7 +633,7 @@ class Pipeline:
 
     def _exec_nested_pipeline(self, batch, action):
         if self._needs_exec(batch, action):
-            repeat = self._eval_expr(action['repeat'], batch=batch) or 1
+            repeat = self._get_repeat(batch, action)
             for _ in range(repeat):
                 batch = self._exec_all_actions(batch, action['pipeline']._action_list)  # pylint: disable=protected-access
         return batch
@@ -543,9 +644,9 @@ class Pipeline:
         for action in action_list:
             _action = action.copy()
             if 'args' in action:
-                _action['args'] = self._eval_expr(action['args'], batch=batch)
+                _action['args'] = self._eval_action_expr(action['args'], batch=batch)
             if 'kwargs' in action:
-                _action['kwargs'] = self._eval_expr(action['kwargs'], batch=batch)
+                _action['kwargs'] = self._eval_action_expr(action['kwargs'], batch=batch)
 
             if _action.get('#dont_run', False):
                 pass
@@ -586,8 +687,28 @@ class Pipeline:
     def _needs_exec(self, batch, action):
         if action['proba'] is None:
             return True
-        proba = self._eval_expr(action['proba'], batch=batch)
-        return np.random.binomial(1, proba) == 1
+        proba = self._eval_action_expr(action['proba'], batch=batch)
+        random = getattr(batch, 'random', np.random)
+        plan = getattr(batch, '_exec_plan', None)
+        value = plan.next(random) if plan is not None else random.random()
+        return value < proba
+
+    def _get_repeat(self, batch, action):
+        """ Return a repeat count of an action, which is recorded or replayed if it is a named expression """
+        repeat = self._eval_action_expr(action['repeat'], batch=batch) or 1
+        plan = getattr(batch, '_exec_plan', None)
+        if plan is not None and isinstance(action['repeat'], NamedExpression):
+            repeat = plan.repeat(repeat)
+        return repeat
+
+    def _count_probabilistic_actions(self, action_list=None):
+        """ Return the number of probabilistic actions including actions of nested pipelines """
+        count = 0
+        for action in action_list if action_list is not None else self._action_list:
+            count += action.get('proba') is not None
+            if action['name'] == PIPELINE_ID:
+                count += self._count_probabilistic_actions(action['pipeline']._action_list)  # pylint: disable=protected-access
+        return count
 
     def execute_for(self, batch, new_loop=False):
         """ Run a pipeline for one batch
@@ -613,6 +734,20 @@ class Pipeline:
     def _eval_expr(self, expr, batch=None, model=None):
         return eval_expr(expr, batch=batch, pipeline=self, model=model)
 
+    def _eval_action_expr(self, expr, batch=None, model=None):
+        """ Evaluate an expression stored in an action
+
+        Expressions are compiled once per run (see :func:`~batchflow.named_expr.compile_expr`),
+        so constant parts of action arguments are not traversed for every batch.
+        """
+        if expr is None or isinstance(expr, (str, Number)):
+            return expr
+        compiled = self._compiled_exprs.get(id(expr))
+        if compiled is None or compiled[0] is not expr:
+            compiled = expr, compile_expr(expr)
+            self._compiled_exprs[id(expr)] = compiled
+        return compiled[1](batch=batch, pipeline=self, model=model)
+
     def call(self, fn, save_to=None, mode='w', *args, **kwargs):
         """ Call any function during pipeline execution
 
@@ -630,7 +765,7 @@ class Pipeline:
         return self.append_action(*args, **kwargs)
 
     def _exec_call(self, batch, action):
-        fn = self._eval_expr(action['fn'], batch)
+        fn = self._eval_action_expr(action['fn'], batch)
         if callable(fn):
             output = fn(batch, *action['args'], **action['kwargs'])
         else:
@@ -691,9 +826,9 @@ class Pipeline:
         return self.append_action()
 
     def _exec_import_model(self, batch, action):
-        model_name = self._eval_expr(action['model_name'], batch=batch)
-        source = self._eval_expr(action['source'], batch=batch)
-        pipeline = self._eval_expr(action['pipeline'], batch=batch)
+        model_name = self._eval_action_expr(action['model_name'], batch=batch)
+        source = self._eval_action_expr(action['source'], batch=batch)
+        pipeline = self._eval_action_expr(action['pipeline'], batch=batch)
         self.models.import_model(source, pipeline, model_name)
 
     def train_model(self, name, *args, make_data=None, save_to=None, mode='w', **kwargs):
@@ -960,7 +1095,7 @@ class Pipeline:
         return self.append_action(*args, **kwargs)
 
     def _exec_gather_metrics(self, batch, action):
-        metrics_class = self._eval_expr(action['metrics_class'], batch)
+        metrics_class = self._eval_action_expr(action['metrics_class'], batch)
         if isinstance(metrics_class, str):
             available_metrics = [m for m in METRICS if metrics_class in m]
             if len(available_metrics) > 1:
@@ -1105,10 +1240,11 @@ class Pipeline:
 
         Parameters
         ----------
-        batch_size : int
+        batch_size : int or :class:`~batchflow.Buckets`
             desired number of items in the batch (the actual batch could contain fewer items)
+            or a specification of batches of similar-size items.
 
-        shuffle : bool, int, class:`numpy.random.RandomState` or callable
+        shuffle : bool, int, 'block', class:`numpy.random.RandomState` or callable
             specifies the order of items, could be:
 
             - bool - if `False`, items go sequentionally, one after another as they appear in the index.
@@ -1118,6 +1254,9 @@ class Pipeline:
 
             - :class:`numpy.random.RandomState` instance.
 
+            - 'block' or :class:`~batchflow.BlockShuffle` instance - a locality-aware shuffle
+                of contiguous blocks of items.
+
             - callable - a function which takes an array of item indices in the initial order
                 (as they appear in the index) and returns the order of items.
 
@@ -1143,6 +1282,26 @@ class Pipeline:
             batch parallization engine used for prefetching (default='threads').
             'mpc' rarely works well due to complicated and slow python's inter-process communications.
 
+        random_seed : int or np.random.SeedSequence
+            a root seed of the run (default is :attr:`random_seed` of the pipeline).
+            Each batch gets its own random stream spawned from the root seed in the order batches are generated,
+            so random draws do not depend on prefetching (see :mod:`~batchflow.rng`).
+
+        exec_plan : ExecutionPlan
+            a recorded plan of a previous run (:attr:`exec_plan` of the pipeline) to execute
+            probabilistic and repeated actions exactly as they were executed in that run.
+            Random numbers which decide whether probabilistic actions are executed are drawn
+            for blocks of batches at once (see :class:`.ExecutionPlan`).
+
+        record_plan : bool
+            whether to record numbers and repeat counts used by all batches into :attr:`exec_plan`
+            to replay the run later (default=False).
+
+        pool : bool or BatchPool
+            whether to take batches from a pool and recycle them after they are released
+            (see :class:`~batchflow.BatchPool`). If True, a new pool is created for the run
+            with `auto_release=True`, so each batch is released when the next one is requested.
+
         Yields
         ------
         an instance of the batch class returned by the last action
@@ -1171,12 +1330,30 @@ class Pipeline:
         target = kwargs.pop('target', 'threads')
         prefetch = kwargs.pop('prefetch', 0)
         on_iter = kwargs.pop('on_iter', None)
+        random_seed = kwargs.pop('random_seed', self.random_seed)
+        exec_plan = kwargs.pop('exec_plan', None)
+        record_plan = kwargs.pop('record_plan', False)
+        pool = kwargs.pop('pool', None)
+        if pool is True:
+            pool = BatchPool(auto_release=True)
+        elif pool is False:
+            pool = None
+        self._compiled_exprs = {}
 
         if len(self._action_list) > 0 and self._action_list[0]['name'] == REBATCH_ID:
             batch_generator = self.gen_rebatch(*args, **kwargs, prefetch=prefetch)
             prefetch = 0
+        elif pool is not None:
+            batch_generator = self.dataset.gen_batch(*args, **kwargs, pool=pool)
         else:
             batch_generator = self.dataset.gen_batch(*args, **kwargs)
+        batches_seed, plan_seed = make_seed_sequence(random_seed).spawn(2)
+        n_actions = self._count_probabilistic_actions()
+        if n_actions > 0 or record_plan or exec_plan is not None:
+            self.exec_plan = ExecutionPlan(n_actions, plan_seed, replay=exec_plan, record=record_plan)
+        else:
+            self.exec_plan = None
+        batch_generator = self._seed_batches(batch_generator, batches_seed, self.exec_plan)
 
         if prefetch > 0:
             # pool cannot have more than 63 workers
@@ -1206,6 +1383,8 @@ class Pipeline:
                     self._prefetch_count.task_done()
                     if callable(on_iter):
                         on_iter(batch_res)
+                    if pool is not None and pool.auto_release:
+                        batch_res.release()
                 else:
                     self._stop_flag = True
         else:
@@ -1218,6 +1397,17 @@ class Pipeline:
                     yield batch_res
                     if callable(on_iter):
                         on_iter(batch_res)
+                    if pool is not None and pool.auto_release:
+                        batch_res.release()
+
+    @staticmethod
+    def _seed_batches(batch_generator, seed, exec_plan=None):
+        """ Give each batch a random stream spawned from a run seed and a row of an execution plan """
+        for batch in batch_generator:
+            batch.random_seed = seed.spawn(1)[0]
+            if exec_plan is not None:
+                batch._exec_plan = exec_plan.next_row()      # pylint: disable=protected-access
+            yield batch
 
     def create_batch(self, batch_index, *args, **kwargs):
         """ Create a new batch by given indices and execute all lazy actions """
@@ -3,15 +3,18 @@
 from collections import OrderedDict
 
 from .. import inbatch_parallel
+from ..rng import spawn
 
 class Job:
     """ Contains one job. """
-    def __init__(self, executable_units, n_iters, repetition, configs, branches, name):
+    def __init__(self, executable_units, n_iters, repetition, configs, branches, name, random_seed=None):
         """
         Parameters
         ----------
         config : dict or Config
             config of experiment
+        random_seed : int or np.random.SeedSequence
+            a seed to spawn random streams of experiments' pipelines from
         """
         self.experiments = []
 
@@ -21,6 +24,7 @@ class Job:
         self.repetition = repetition
         self.branches = branches
         self.name = name
+        self.random_seed = random_seed
         self.worker_config = {}
 
         self.exceptions = []
@@ -29,6 +33,7 @@ class Job:
     def init(self, worker_config, gpu_configs):
         """ Create experiments. """
         self.worker_config = worker_config
+        experiment_seeds = spawn(self.random_seed, len(self.configs))
 
         for index, config in enumerate(self.configs):
             if isinstance(self.branches, list):
@@ -47,6 +52,9 @@ class Job:
                 unit.repetition = self.repetition[index]
                 unit.index = index
                 unit.create_folder(self.name)
+                for pipeline, seed in zip([unit.root_pipeline, unit.pipeline], experiment_seeds[index].spawn(2)):
+                    if pipeline is not None:
+                        pipeline.random_seed = seed
                 units[name] = unit
 
             self.experiments.append(units)
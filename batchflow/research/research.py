@@ -11,6 +11,7 @@ import dill
 import pandas as pd
 
 from .. import Config, Pipeline
+from ..rng import make_seed_sequence
 from .distributor import Distributor
 from .workers import PipelineWorker
 from .grid import Grid
@@ -35,6 +36,7 @@ class Research:
         self.grid_config = None
         self.n_iters = None
         self.timeout = 5
+        self.seed = None
 
     def pipeline(self, root, branch=None, variables=None, name=None,
                  execute='%1', dump=-1, run=False, logging=False, **kwargs):
@@ -206,14 +208,14 @@ class Research:
                                     for configs in self.grid_config.gen_configs()]
 
         configs_chunks = self._chunks(configs_with_repetitions, n_models)
+        n_jobs = ceil(len(configs_with_repetitions) / n_models)
+        job_seeds = make_seed_sequence(self.seed).spawn(n_jobs)
 
         jobs = (Job(self.executables, n_iters,
-                    list(zip(*chunk))[0], list(zip(*chunk))[1], branches, name)
-                for chunk in configs_chunks
+                    list(zip(*chunk))[0], list(zip(*chunk))[1], branches, name, random_seed=job_seed)
+                for chunk, job_seed in zip(configs_chunks, job_seeds)
                )
 
-        n_jobs = ceil(len(configs_with_repetitions) / n_models)
-
         return jobs, n_jobs
 
     def _chunks(self, array, size):
@@ -230,7 +232,7 @@ class Research:
             yield array[i:i + size]
 
     def run(self, n_reps=1, n_iters=None, workers=1, branches=1, name=None,
-            progress_bar=False, gpu=None, worker_class=None, timeout=5, trails=2):
+            progress_bar=False, gpu=None, worker_class=None, timeout=5, trails=2, seed=None):
         """ Run research.
 
         Parameters
@@ -273,6 +275,10 @@ class Research:
             each job will be killed if it doesn't answer more then that time in minutes
         trails : int
             trails to execute job
+        seed : int or None
+            a root seed of the research. Each job gets a random stream spawned from it, and pipelines
+            of each experiment get streams spawned from a job stream (see :mod:`~batchflow.rng`).
+            If None, the seed is drawn from `np.random`.
 
 
         **How does it work**
@@ -291,6 +297,7 @@ class Research:
             self.trails = trails
             self.initial_name = name
             self.name = name
+            self.seed = seed
 
         n_workers = self.workers if isinstance(self.workers, int) else len(self.workers)
         n_branches = self.branches if isinstance(self.branches, int) else len(self.branches)
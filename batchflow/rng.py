@@ -0,0 +1,88 @@
+""" Contains helpers for random number generation with independent streams
+
+All random numbers in batchflow are drawn from `numpy.random.Generator` instances whose seeds are spawned
+from a root `numpy.random.SeedSequence`:
+
+- a pipeline run has one root seed (see ``random_seed`` in :meth:`~batchflow.Pipeline.gen_batch`)
+- each batch gets a child stream in the order batches are generated (see :attr:`~batchflow.Batch.random`),
+  so draws do not depend on prefetching or on which thread processes a batch
+- research jobs get child streams of a research seed, and their pipelines get child streams of a job seed
+- samplers and ``R`` expressions get their own streams
+
+Streams never share a generator, so there is no contention on a global random state.
+If a seed is not given, it is drawn from `np.random`, so ``np.random.seed`` makes everything reproducible.
+"""
+import numpy as np
+
+
+# legacy `np.random` names which are named differently in `np.random.Generator`
+LEGACY_NAMES = {
+    'randint': 'integers',
+    'random_sample': 'random',
+    'ranf': 'random',
+    'sample': 'random',
+}
+
+
+def make_seed_sequence(seed=None):
+    """ Return a seed sequence
+
+    Parameters
+    ----------
+    seed : None, int, sequence of ints, np.random.SeedSequence
+        If None, a seed is drawn from `np.random`.
+
+    Returns
+    -------
+    np.random.SeedSequence
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int64).max, dtype=np.int64)
+    return np.random.SeedSequence(seed)
+
+
+def make_rng(seed=None):
+    """ Return a random number generator
+
+    Parameters
+    ----------
+    seed : None, int, sequence of ints, np.random.SeedSequence, np.random.Generator or np.random.RandomState
+        A generator or a random state is returned as is, otherwise a new generator is seeded with `seed`
+        (see :func:`make_seed_sequence`).
+
+    Returns
+    -------
+    np.random.Generator or np.random.RandomState
+    """
+    if isinstance(seed, (np.random.Generator, np.random.RandomState)):
+        return seed
+    return np.random.default_rng(make_seed_sequence(seed))
+
+
+def spawn(seed, n_children):
+    """ Return `n_children` independent seed sequences spawned from `seed`
+
+    Parameters
+    ----------
+    seed : None, int, sequence of ints, np.random.SeedSequence
+        A parent seed. Note that spawning from the same `SeedSequence` object twice gives different children.
+    n_children : int
+        The number of seed sequences to spawn.
+
+    Returns
+    -------
+    list of np.random.SeedSequence
+    """
+    return make_seed_sequence(seed).spawn(n_children)
+
+
+def get_distribution(rng, name):
+    """ Return a method of a generator or a random state which draws from a distribution `name`
+
+    Legacy `np.random` names (e.g. 'randint' or 'random_sample') are also accepted for generators.
+    """
+    if isinstance(rng, np.random.Generator) and not hasattr(rng, name):
+        name = LEGACY_NAMES.get(name, name)
+    return getattr(rng, name)
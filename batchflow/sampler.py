@@ -2,9 +2,13 @@
 """ Contains Sampler-classes. """
 
 from copy import copy
+import threading
+import concurrent.futures as cf
 import numpy as np
 import scipy.stats as ss
 
+from .rng import make_rng, get_distribution
+
 # if empirical probability of truncation region is less than
 # this number, truncation throws a ValueError
 SMALL_SHARE = 1e-2
@@ -106,10 +110,18 @@ class Sampler():
     ----------
     weight : float
         weight of Sampler self in mixtures.
+    state : np.random.Generator or None
+        random generator of a sampler (if it draws random numbers itself).
     """
     def __init__(self, *args, **kwargs):
         self.__array_priority__ = 100
         self.weight = 1.0
+        self.state = None
+
+        # components of a mixture, factors of a product and a base sampler with its transforms
+        self._mixture = None
+        self._factors = None
+        self._transforms = None
 
         # if dim is supplied, redefine sampling method
         if 'dim' in kwargs:
@@ -153,26 +165,32 @@ class Sampler():
         Sampler
             resulting mixture of two samplers.
         """
-        # init new Sampler
-        result = Sampler()
+        # flatten nested mixtures into one list of components
+        components = self._mixture_components() + other._mixture_components()
+        samplers = [sampler for sampler, _ in components]
+        _ws = np.array([weight for _, weight in components], dtype=np.float64)
 
-        # calculate probs of samplers in mixture
-        _ws = np.array([self.weight, other.weight])
+        result = Sampler()
         result.weight = np.sum(_ws)
+        result._mixture = components
+        result.state = make_rng()
         _normed = _ws / np.sum(_ws)
 
         # redefine the sampling procedure of a sampler
         def concat_sample(size):
-            """ Sampling procedure of a mixture of two samplers.
-            """
-            _up_size = np.random.binomial(size, _normed[0])
-            _low_size = size - _up_size
-
-            _up = self.sample(size=_up_size)
-            _low = other.sample(size=_low_size)
-            _sample = np.concatenate([_up, _low])
-            sample = _sample[np.random.permutation(size)]
+            """ Sampling procedure of a mixture of samplers.
 
+            Sizes of components are drawn with one multinomial draw and their samples
+            are scattered into randomly permuted positions of the output.
+            """
+            sizes = result.state.multinomial(size, _normed)
+            samples = [sampler.sample(size=n) for sampler, n in zip(samplers, sizes)]
+            sample = np.empty((size, *samples[0].shape[1:]), dtype=np.result_type(*samples))
+            positions = result.state.permutation(size)
+            start = 0
+            for n, part in zip(sizes, samples):
+                sample[positions[start:start + n]] = part
+                start += n
             return sample
 
         result.sample = concat_sample
@@ -202,15 +220,24 @@ class Sampler():
         if isinstance(other, (float, int)):
             result.sample = self.sample
             result.weight *= other
+            result._mixture, result._factors, result._transforms = self._mixture, self._factors, self._transforms
 
         # when other is a Sampler
         elif isinstance(other, Sampler):
+            # flatten nested products into one list of factors
+            factors = self._product_factors() + other._product_factors()
+            result._factors = factors
+
             def concat_sample(size):
-                """ Sampling procedure of a product of two samplers.
+                """ Sampling procedure of a product of samplers.
                 """
-                _left = self.sample(size)
-                _right = other.sample(size)
-                return np.concatenate([_left, _right], axis=1)
+                parts = [factor.sample(size) for factor in factors]
+                sample = np.empty((size, sum(part.shape[1] for part in parts)), dtype=np.result_type(*parts))
+                start = 0
+                for part in parts:
+                    sample[:, start:start + part.shape[1]] = part
+                    start += part.shape[1]
+                return sample
 
             result.sample = concat_sample
 
@@ -239,10 +266,40 @@ class Sampler():
         Sampler
             instance of class Sampler with redefined method `sample`.
         """
+        # chain transforms of a transformed sampler instead of nesting them
+        base, transforms = self._transforms or (self, ())
+        transforms = transforms + (transform,)
+
         result = Sampler()
-        result.sample = lambda size: transform(self.sample(size))
+        result._transforms = base, transforms     # pylint: disable=protected-access
+
+        def transformed(size):
+            sample = base.sample(size)
+            for func in transforms:
+                sample = func(sample)
+            return sample
+
+        result.sample = transformed
         return result
 
+    def _mixture_components(self):
+        """ Return a list of (sampler, weight) of a mixture or the sampler itself with its weight """
+        if self._mixture is None:
+            return [(self, self.weight)]
+        scale = self.weight / sum(weight for _, weight in self._mixture)
+        return [(component, weight * scale) for component, weight in self._mixture]
+
+    def _product_factors(self):
+        """ Return a list of factors of a product of samplers or the sampler itself """
+        return list(self._factors or [self])
+
+    def buffered(self, block_size=10000, background=False):
+        """ Return a sampler which draws points from self in blocks of `block_size` points.
+
+        See :class:`BufferedSampler` for details.
+        """
+        return BufferedSampler(self, block_size=block_size, background=background)
+
     def truncate(self, high=None, low=None, expr=None, prob=0.5):
         """ Truncate a sampler. Resulting sampler poduces points satisfying ``low <= pts <= high``.
         If ``expr`` is suplied, the condition is ``low <= expr(pts) <= high``.
@@ -277,33 +334,33 @@ class Sampler():
             if size == 0:
                 return self.sample(size=0)
 
-            # set batch-size
-            expectation = size / prob
-            sigma = np.sqrt(size * (1 - prob) / (prob**2))
-            batch_size = int(expectation + 2 * sigma)
-
-            # sample, filter out, concat
+            # sample, filter out and put accepted points into the preallocated output
             ctr = 0
             cumulated = 0
-            samples = []
+            share = prob
+            sample = None
             while cumulated < size:
+                # set batch-size from the remaining size and the acceptance share
+                left = size - cumulated
+                batch_size = int(left / share + 2 * np.sqrt(left * (1 - share)) / share) + 1
+
                 # sample points and compute condition-vector
-                sample = self.sample(size=batch_size)
-                cond = np.ones(shape=batch_size).astype(np.bool)
+                points = self.sample(size=batch_size)
+                cond = np.ones(shape=batch_size, dtype=bool)
                 if low is not None:
                     if expr is not None:
-                        cond &= np.greater_equal(expr(sample).reshape(batch_size, -1), low).all(axis=1)
+                        cond &= np.greater_equal(expr(points).reshape(batch_size, -1), low).all(axis=1)
                     else:
-                        cond &= np.greater_equal(sample, low).all(axis=1)
+                        cond &= np.greater_equal(points, low).all(axis=1)
 
                 if high is not None:
                     if expr is not None:
-                        cond &= np.less_equal(expr(sample).reshape(batch_size, -1), high).all(axis=1)
+                        cond &= np.less_equal(expr(points).reshape(batch_size, -1), high).all(axis=1)
                     else:
-                        cond &= np.less_equal(sample, high).all(axis=1)
+                        cond &= np.less_equal(points, high).all(axis=1)
 
                 if high is None and low is None:
-                    cond &= expr(sample).all(axis=1)
+                    cond &= expr(points).all(axis=1)
 
                 # check that truncation-prob is not to small
                 _share = np.sum(cond) / batch_size
@@ -311,11 +368,15 @@ class Sampler():
                     raise ValueError('Probability of region of interest is too small. Try other truncation bounds')
 
                 # get points from region of interest
-                samples.append(sample[cond])
-                cumulated += np.sum(cond)
+                accepted = points[cond][:left]
+                if sample is None:
+                    sample = np.empty((size, *points.shape[1:]), dtype=points.dtype)
+                sample[cumulated:cumulated + len(accepted)] = accepted
+                cumulated += len(accepted)
+                share = max(_share, SMALL_SHARE)
                 ctr += 1
 
-            return np.concatenate(samples)[:size]
+            return sample
 
         # init new Sampler, define its sampling-method
         result = Sampler()
@@ -367,8 +428,8 @@ class NumpySampler(Sampler):
     ----------
     name : str
         name of a distribution (method from np.random) or its alias.
-    seed : int
-        random seed for setting up sampler's state.
+    seed : int, np.random.SeedSequence or np.random.Generator
+        random seed for setting up sampler's state (see :func:`~batchflow.rng.make_rng`).
     **kwargs
         additional keyword-arguments defining properties of specific
         distribution. E.g., ``loc`` for name='normal'.
@@ -385,7 +446,7 @@ class NumpySampler(Sampler):
         name = _get_method_by_alias(name, 'np')
         self.name = name
         self._params = copy(kwargs)
-        self.state = np.random.RandomState(seed=seed)
+        self.state = make_rng(seed)
 
     def sample(self, size):
         """ Sampling method of ``NumpySampler``.
@@ -402,7 +463,7 @@ class NumpySampler(Sampler):
         np.ndarray
             array of shape (size, Sampler's dimension).
         """
-        sampler = getattr(self.state, self.name)
+        sampler = get_distribution(self.state, self.name)
         sample = sampler(size=size, **self._params)
         if len(sample.shape) == 1:
             sample = sample.reshape(-1, 1)
@@ -415,8 +476,8 @@ class ScipySampler(Sampler):
     ----------
     name : str
         name of a distribution, class from `scipy.stats`, or its alias.
-    seed : int
-        random seed for setting up sampler's state.
+    seed : int, np.random.SeedSequence or np.random.Generator
+        random seed for setting up sampler's state (see :func:`~batchflow.rng.make_rng`).
     **kwargs
         additional parameters for specification of the distribution.
         For instance, `scale` for name='gamma'.
@@ -432,7 +493,7 @@ class ScipySampler(Sampler):
         super().__init__(name, seed, **kwargs)
         name = _get_method_by_alias(name, 'ss')
         self.name = name
-        self.state = np.random.RandomState(seed=seed)
+        self.state = make_rng(seed)
         self.distr = getattr(ss, self.name)(**kwargs)
 
     def sample(self, size):
@@ -466,8 +527,8 @@ class HistoSampler(Sampler):
         Make sure that it is unnormalized (`normed=False` in `np.histogramdd`).
     edges : list
         list of len=histo_dimension, contains edges of bins along axes.
-    seed : int
-        random seed for setting up sampler's state.
+    seed : int, np.random.SeedSequence or np.random.Generator
+        random seed for setting up sampler's state (see :func:`~batchflow.rng.make_rng`).
 
     Attributes
     ----------
@@ -481,6 +542,10 @@ class HistoSampler(Sampler):
         The sampler should be based on unnormalized histogram.
         if `histo`-arg is supplied, it is used for histo-initilization.
         Otherwise, edges should be supplied. In this case all bins are empty.
+
+        Cumulative sums of bins are computed once and updated by `update`, so sampling
+        takes a binary search per point. If bins are changed in-place, assign them
+        to `bins` again to recompute the sums.
     """
     def __init__(self, histo=None, edges=None, seed=None, **kwargs):
         super().__init__(histo, edges, seed, **kwargs)
@@ -494,7 +559,17 @@ class HistoSampler(Sampler):
         else:
             raise ValueError('Either `histo` or `edges` should be specified.')
 
-        self.state = np.random.RandomState(seed=seed)
+        self.state = make_rng(seed)
+
+    @property
+    def bins(self):
+        """ np.ndarray : bins of base-histogram """
+        return self._bins
+
+    @bins.setter
+    def bins(self, value):
+        self._bins = value
+        self._cumulative = np.cumsum(value, dtype=np.float64).reshape(-1)
 
     def sample(self, size):
         """ Sampling method of ``HistoSampler``.
@@ -512,7 +587,7 @@ class HistoSampler(Sampler):
         np.ndarray
             array of shape (size, histo dimension).
         """
-        return sample_histodd((self.bins, self.edges), size, self.state)
+        return _sample_bins(self._cumulative, self.bins.shape, self.edges, size, self.state)
 
     def update(self, points):
         """ Update bins of sampler's histogram by throwing in additional points.
@@ -523,7 +598,114 @@ class HistoSampler(Sampler):
             Array of points of shape (n_points, histo_dimension).
         """
         histo_update = np.histogramdd(sample=points, bins=self.edges)
-        self.bins += histo_update[0]
+        self._bins += histo_update[0]
+        self._cumulative += np.cumsum(histo_update[0], dtype=np.float64).reshape(-1)
+
+class BufferedSampler(Sampler):
+    """ Sampler which draws points from another sampler in large blocks and serves them by slices.
+
+    Small samples (e.g. a batch size or a single point) are taken from a pre-drawn block,
+    so numpy call overhead is paid once per block. When a block is exhausted, the next one is drawn,
+    either on demand or, with ``background=True``, in a background thread while the current block is served.
+
+    Blocks are drawn one after another in the same order, so if sampler's points do not depend on
+    the sample size (e.g. numpy distributions, but not mixtures), a buffered sampler produces
+    exactly the same points as the sampler itself for a given seed.
+
+    Parameters
+    ----------
+    sampler : Sampler or callable
+        a sampler or a function which takes `size` and returns an array of `size` points.
+    block_size : int
+        the number of points to draw at once.
+    background : bool
+        whether to draw the next block in a background thread.
+
+    Examples
+    --------
+    ::
+
+        sampler = NumpySampler('n', seed=42).buffered(block_size=100000, background=True)
+        sampler.sample(16)
+    """
+    def __init__(self, sampler, block_size=10000, background=False):
+        super().__init__()
+        self.sampler = sampler
+        self.weight = getattr(sampler, 'weight', 1.0)
+        self.block_size = block_size
+        self.background = background
+        self._block = None
+        self._pos = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._next_block = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._next_block is not None:
+            state['_next_block'] = self._next_block.result()
+        state['_lock'] = None
+        state['_executor'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        if self._next_block is not None:
+            block, self._next_block = self._next_block, cf.Future()
+            self._next_block.set_result(block)
+
+    def _draw(self):
+        if isinstance(self.sampler, Sampler):
+            return self.sampler.sample(self.block_size)
+        return self.sampler(self.block_size)
+
+    def _get_block(self):
+        if not self.background:
+            return self._draw()
+        if self._next_block is None:
+            self._executor = self._executor or cf.ThreadPoolExecutor(max_workers=1)
+            self._next_block = self._executor.submit(self._draw)
+        block = self._next_block.result()
+        self._executor = self._executor or cf.ThreadPoolExecutor(max_workers=1)
+        self._next_block = self._executor.submit(self._draw)
+        return block
+
+    def sample(self, size):
+        """ Return `size` points from the buffer refilling it when needed.
+
+        Parameters
+        ----------
+        size : int
+            the size of sample to be generated.
+
+        Returns
+        -------
+        np.ndarray
+            array of shape (size, sampler's dimension).
+        """
+        with self._lock:
+            block, pos = self._block, self._pos
+            if block is not None and pos + size <= len(block):
+                self._pos = pos + size
+                return block[pos:pos + size]
+
+            parts = []
+            left = size
+            while left > 0 or self._block is None:
+                if self._block is None or self._pos == len(self._block):
+                    self._block = self._get_block()
+                    self._pos = 0
+                part = self._block[self._pos:self._pos + left]
+                self._pos += len(part)
+                left -= len(part)
+                parts.append(part)
+            if len(parts) == 0:
+                return self._block[:0]
+            if len(parts) == 1:
+                return parts[0]
+            return np.concatenate(parts)
+
 
 def cart_prod(*arrs):
     """ Get array of cartesian tuples from arbitrary number of arrays.
@@ -554,7 +736,7 @@ def sample_histodd(histo, size, state=None):
         `edges` is a list of histo_dim arrays of len = (nbins_in_dimension + 1), represents bounds of bins' boxes.
     size : int
         length of sample to be generated.
-    state : np.random.RandomState
+    state : np.random.Generator or np.random.RandomState
         random state used for sampling. If None, samples from np.random.
 
     Returns
@@ -562,15 +744,17 @@ def sample_histodd(histo, size, state=None):
     ndarray
         2d-array of shape = (size, histo_dim), containing samples.
     """
-    # infer probabilities of bins, sample number of bins according to these probs
-    probs = (histo[0] / np.sum(histo[0])).reshape(-1)
-    bin_nums = np.random.choice(np.arange(histo[0].size), p=probs, size=size)
-
-    # lower and upper bounds of boxes
-    l_all = cart_prod(*(range_dim[:-1] for range_dim in histo[1]))
-    h_all = cart_prod(*(range_dim[1:] for range_dim in histo[1]))
-
-    # uniformly generate samples from selected boxes
-    low, high = l_all[bin_nums], h_all[bin_nums]
-    sampler = np.random.uniform if state is None else state.uniform
-    return sampler(low=low, high=high)
+    cumulative = np.cumsum(histo[0], dtype=np.float64).reshape(-1)
+    return _sample_bins(cumulative, histo[0].shape, histo[1], size, state)
+
+def _sample_bins(cumulative, shape, edges, size, state=None):
+    """ Sample points uniformly from histogram bins chosen according to cumulative sums of bins """
+    state = np.random if state is None else state
+    bin_nums = np.searchsorted(cumulative, state.random(size) * cumulative[-1], side='right')
+
+    # lower and upper bounds of boxes of chosen bins only
+    bin_coords = np.unravel_index(bin_nums, shape)
+    edges = [np.asarray(edge) for edge in edges]
+    low = np.stack([edge[coord] for edge, coord in zip(edges, bin_coords)], axis=-1)
+    high = np.stack([edge[coord + 1] for edge, coord in zip(edges, bin_coords)], axis=-1)
+    return state.uniform(low=low, high=high)
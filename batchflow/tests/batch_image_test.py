@@ -0,0 +1,292 @@
+""" Tests for ArrayImagesBatch transforms.
+Each transform is applied to a small fixed batch of `np.uint8` images and compared
+with the same transform of ImagesBatch (or with plain numpy where ImagesBatch has no exact equivalent).
+Note that ImagesBatch takes coordinates in PIL (x, y) order, while ArrayImagesBatch uses (row, column).
+"""
+# pylint: disable=missing-docstring, redefined-outer-name, protected-access
+import pytest
+import numpy as np
+import PIL.Image
+import PIL.JpegImagePlugin
+
+from batchflow import ImagesBatch, ArrayImagesBatch, DatasetIndex, FilesIndex, ImageCache, Pipeline
+from batchflow import batch_image
+from batchflow.rng import make_rng
+
+
+@pytest.fixture
+def images():
+    return np.random.RandomState(13).randint(0, 256, size=(4, 6, 8, 3)).astype(np.uint8)
+
+
+def array_batch(images):
+    batch = ArrayImagesBatch(DatasetIndex(len(images)))
+    batch.images = images.copy()
+    return batch
+
+
+def pil_batch(images):
+    batch = ImagesBatch(DatasetIndex(len(images)))
+    batch.images = np.empty(len(images), dtype=object)
+    batch.images[:] = [PIL.Image.fromarray(image) for image in images]
+    return batch
+
+
+def pil_to_array(batch):
+    return np.stack([np.asarray(image) for image in batch.images])
+
+
+@pytest.mark.parametrize('name, array_kwargs, pil_kwargs', [
+    ('flip', dict(mode='lr'), dict(mode='lr')),
+    ('flip', dict(mode='ud'), dict(mode='ud')),
+    ('pad', dict(offset=(1, 2, 3, 4)), dict(border=(1, 2, 3, 4))),
+    ('shift', dict(offset=(1, 2)), dict(offset=(2, 1))),
+    ('shift', dict(offset=(1, -2), mode='wrap'), dict(offset=(-2, 1), mode='wrap')),
+    ('invert', dict(), dict()),
+    ('invert', dict(channels=[0, 2]), dict(channels=[0, 2])),
+    ('clip', dict(low=30, high=200), dict(low=30, high=200)),
+    ('posterize', dict(bits=3), dict(bits=3)),
+    ('multiply', dict(multiplier=1.5, preserve_type=True), dict(multiplier=1.5)),
+    ('add', dict(term=40, preserve_type=True), dict(term=40)),
+    ('rotate', dict(angle=180), dict(angle=180)),
+    ('scale', dict(factor=2), dict(factor=2)),
+    ('resize', dict(shape=(12, 16), order=0), dict(size=(16, 12), resample=0)),
+])
+def test_same_as_images_batch(images, name, array_kwargs, pil_kwargs):
+    result = getattr(array_batch(images), name)(**array_kwargs).images
+    expected = pil_to_array(getattr(pil_batch(images), name)(**pil_kwargs))
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize('origin, expected_origin', [((1, 2), (1, 2)), ('top_left', (0, 0)), ('center', (1, 2))])
+def test_crop(images, origin, expected_origin):
+    row, column = expected_origin
+    result = array_batch(images).crop(origin=origin, shape=(4, 4)).images
+    assert np.array_equal(result, images[:, row:row + 4, column:column + 4])
+
+
+def test_crop_random(images):
+    batch = array_batch(images)
+    result = batch.crop(origin='random', shape=(4, 4)).images
+    assert result.shape == (4, 4, 4, 3)
+    for image, crop in zip(images, result):
+        assert any(np.array_equal(crop, image[row:row + 4, column:column + 4])
+                   for row in range(3) for column in range(5))
+
+
+def test_cutout(images):
+    result = array_batch(images).cutout(origin=(1, 2), shape=(2, 3), color=(10, 20, 30)).images
+    expected = images.copy()
+    expected[:, 1:3, 2:5] = (10, 20, 30)
+    assert np.array_equal(result, expected)
+
+
+def test_scale_preserve_shape(images):
+    result = array_batch(images).scale(factor=2, preserve_shape=True).images
+    upscaled = images.repeat(2, axis=1).repeat(2, axis=2)
+    assert np.array_equal(result, upscaled[:, 3:9, 4:12])
+
+
+@pytest.mark.parametrize('noise', ['additive_noise', 'multiplicative_noise'])
+def test_noise(images, noise):
+    value = 0 if noise == 'additive_noise' else 1
+    result = getattr(array_batch(images), noise)(noise=lambda size: np.full(size, value), preserve_type=True).images
+    assert np.array_equal(result, images)
+
+
+def test_salt(images):
+    result = array_batch(images).salt(p_noise=1., color=255).images
+    assert (result == 255).all()
+
+
+def test_elastic_transform_identity(images):
+    result = array_batch(images).elastic_transform(alpha=0, sigma=1).images
+    assert np.array_equal(result, images)
+
+
+def test_to_float(images):
+    result = array_batch(images).to_float().images
+    assert result.dtype == np.float32
+    assert np.allclose(result, images / 255)
+
+
+def test_probability(images):
+    batch = array_batch(images)
+    batch.random_seed = 13
+    result = batch.flip(mode='lr', p=.5).images
+    flipped = [np.array_equal(image, original[:, ::-1]) for image, original in zip(result, images)]
+    kept = [np.array_equal(image, original) for image, original in zip(result, images)]
+    assert all(f or k for f, k in zip(flipped, kept))
+
+
+def test_probability_shape_change(images):
+    with pytest.raises(ValueError):
+        array_batch(images).crop(origin='center', shape=(4, 4), p=.5)
+
+
+@pytest.mark.parametrize('stride', [2, 3])
+def test_patches_roundtrip(images, stride):
+    batch = array_batch(images)
+    batch.split_to_patches(patch_shape=4, stride=stride, dst='patches', coordinates='coordinates')
+    batch.merge_patches(coordinates='coordinates', image_shape=(6, 8), src='patches', dst='merged')
+    assert np.array_equal(batch.merged, images)
+
+
+def test_merge_patches_rounding():
+    batch = array_batch(np.zeros((1, 2, 2, 1), dtype=np.uint8))
+    batch.patches = np.stack([np.full((2, 2, 1), 1, dtype=np.uint8), np.full((2, 2, 1), 2, dtype=np.uint8)])
+    batch.coordinates = np.zeros((2, 3), dtype=np.int64)
+    batch.merge_patches(coordinates='coordinates', image_shape=(2, 2), src='patches', dst='merged')
+    assert batch.merged.dtype == np.uint8
+    assert (batch.merged == 2).all()
+
+
+def test_split_to_patches_error(images):
+    with pytest.raises(RuntimeError) as info:
+        pil_batch(images).split_to_patches(patch_shape='4')
+    assert isinstance(info.value.__cause__, TypeError)
+
+
+def test_elastic_transform_grid_cache(images):
+    batch_image._coordinate_grid.cache_clear()
+    for size in [1, 2, 4]:
+        result = array_batch(images[:size]).elastic_transform(alpha=2, sigma=1, pool_size=4).images
+        assert result.shape == images[:size].shape
+    assert batch_image._coordinate_grid.cache_info().currsize == 1
+
+
+@pytest.mark.parametrize('n_workers', [None, 1, 2])
+def test_dump(images, tmp_path, n_workers):
+    stats = {}
+    for _ in range(2):
+        array_batch(images).dump(fmt='image', dst=str(tmp_path), n_workers=n_workers, stats=stats)
+    assert stats['images'] == 2 * len(images)
+    for i, image in enumerate(images):
+        assert np.array_equal(np.asarray(PIL.Image.open(tmp_path / ('%d.png' % i))), image)
+    if n_workers is not None and n_workers > 1:
+        executor = batch_image._get_executor(n_workers)
+        assert batch_image._get_executor(n_workers) is executor
+        batch_image._shutdown_executors()
+        with pytest.raises(RuntimeError):
+            executor.submit(print)
+        assert batch_image._get_executor(n_workers) is not executor
+
+
+def test_image_shapes(images, monkeypatch):
+    batch = pil_batch(images)
+    batch.images[1] = batch.images[1].resize((4, 6))
+    with pytest.raises(RuntimeError):
+        _ = batch.image_shape
+
+    calls = []
+    calc_shapes = batch._calc_shapes
+    monkeypatch.setattr(batch, '_calc_shapes', lambda images: calls.append(1) or calc_shapes(images))
+    batch.resize(size=(5, 7))
+    for _ in range(2):
+        assert batch.image_shape == (5, 7, 3)
+    assert np.array_equal(batch.get_shapes(), [(5, 7, 3)] * len(images))
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('batch_class', [ImagesBatch, ArrayImagesBatch])
+def test_load_palette(tmp_path, batch_class):
+    image = PIL.Image.fromarray(np.arange(48, dtype=np.uint8).reshape(6, 8)).convert('P', palette=PIL.Image.ADAPTIVE)
+    image.save(str(tmp_path / '0.png'))
+    index = FilesIndex(path=str(tmp_path / '*.png'), no_ext=True)
+    results = []
+    for cache in [None, ImageCache()]:
+        batch = batch_class(index).load(fmt='image', components='images', cache=cache)
+        results.append(np.stack([np.asarray(image) for image in batch.images]))
+    assert results[0].shape == (1, 6, 8, 3)
+    assert np.array_equal(results[0], results[1])
+    assert np.array_equal(results[0][0], np.asarray(image.convert('RGB')))
+
+
+@pytest.mark.parametrize('batch_class, target_shape', [(ImagesBatch, (15, 10)), (ArrayImagesBatch, (10, 15))])
+def test_load_target_shape(tmp_path, monkeypatch, images, batch_class, target_shape):
+    for i in range(2):
+        PIL.Image.fromarray(images[i].repeat(8, axis=0).repeat(8, axis=1)).save(str(tmp_path / ('%d.jpg' % i)))
+    index = FilesIndex(path=str(tmp_path / '*.jpg'), no_ext=True)
+
+    drafts, closed = [], []
+    draft = PIL.JpegImagePlugin.JpegImageFile.draft
+    def _draft(image, mode, size):
+        result = draft(image, mode, size)
+        drafts.append(image.size)
+        return result
+    monkeypatch.setattr(PIL.JpegImagePlugin.JpegImageFile, 'draft', _draft)
+    open_image = PIL.Image.open
+    def _open(*args, **kwargs):
+        image = open_image(*args, **kwargs)
+        close = image.close
+        image.close = lambda: closed.append(1) or close()
+        return image
+    monkeypatch.setattr(PIL.Image, 'open', _open)
+
+    batch = batch_class(index).load(fmt='image', components='images', target_shape=target_shape, mode='RGB')
+    assert [np.asarray(image).shape for image in batch.images] == [(10, 15, 3)] * 2
+    # images of 48x64 pixels are decoded at a quarter of their size and then resized
+    assert drafts == [(16, 12)] * 2
+    assert len(closed) == 2
+
+
+@pytest.mark.parametrize('size, expected', [(8, 'for'), (80, 'threads')])
+def test_transform_target(images, size, expected):
+    batch = pil_batch(np.zeros((2, size, size, 3), dtype=np.uint8))
+    assert batch.get_transform_target('rotate') == expected
+    assert batch.get_transform_target('flip') == 'for'
+    assert batch.get_transform_target('flip', default='threads') == expected
+    assert array_batch(images).get_transform_target('rotate') == 'for'
+
+
+def test_transform_target_config(monkeypatch):
+    batch = pil_batch(np.zeros((2, 80, 80, 3), dtype=np.uint8))
+    batch.pipeline = Pipeline(config=dict(transform_targets={'rotate': 'f'}))
+    assert batch.get_transform_target('rotate') == 'f'
+    assert batch.get_transform_target('scale') == 'threads'
+    batch.pipeline = Pipeline(config=dict(transform_targets='f'))
+    assert batch.get_transform_target('scale') == 'f'
+
+    targets = []
+    get_target = batch.get_transform_target
+    monkeypatch.setattr(batch, 'get_transform_target', lambda *args, **kwargs: targets.append(args[0]) or
+                        get_target(*args, **kwargs))
+    batch.rotate(angle=90).flip(mode='lr')
+    assert targets == ['rotate', 'flip']
+
+
+@pytest.mark.parametrize('transforms, expected', [
+    ([('flip', dict(mode='lr')), ('rotate', dict(angle=180))], lambda images: images[:, ::-1]),
+    ([('rotate', dict(angle=90)), ('rotate', dict(angle=-90)), 'flip'], lambda images: images[:, :, ::-1]),
+    ([('shift', dict(offset=(-1, -2))), ('crop', dict(origin='top_left', shape=(4, 3)))],
+     lambda images: images[:, 2:5, 1:5]),
+    ([('crop', dict(origin=(2, 1), shape=(5, 4))), ('flip', dict(mode='ud'))],
+     lambda images: images[:, 1:5, 2:7][:, ::-1]),
+])
+def test_affine(images, transforms, expected):
+    result = pil_to_array(pil_batch(images).affine(transforms))
+    assert np.array_equal(result, expected(images))
+
+
+def test_affine_probability(images):
+    batch = pil_batch(images)
+    batch.random_seed = 13
+    result = pil_to_array(batch.affine([('flip', dict(p=.5))]))
+    skip = make_rng(13).random(len(images)) >= .5
+    assert 0 < skip.sum() < len(images)
+    assert np.array_equal(result[skip], images[skip])
+    assert np.array_equal(result[~skip], images[~skip, :, ::-1])
+
+
+def test_affine_random_crop(images):
+    results = []
+    for _ in range(2):
+        batch = pil_batch(images)
+        batch.random_seed = 13
+        results.append(pil_to_array(batch.affine([('crop', dict(origin='random', shape=(5, 4)))])))
+    assert np.array_equal(results[0], results[1])
+    assert results[0].shape == (4, 4, 5, 3)
+    for image, crop in zip(images, results[0]):
+        assert any(np.array_equal(crop, image[row:row + 4, column:column + 5])
+                   for row in range(3) for column in range(4))
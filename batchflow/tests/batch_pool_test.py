@@ -0,0 +1,98 @@
+""" Tests for BatchPool. """
+# pylint: disable=missing-docstring, redefined-outer-name
+import pytest
+import numpy as np
+
+from batchflow import Batch, BatchPool, Dataset, DatasetIndex
+
+
+@pytest.fixture
+def data():
+    return np.arange(50 * 3, dtype=np.float32).reshape(50, 3)
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_data_with_auto_release(data, prefetch):
+    pipeline = Dataset(50, preloaded=data).p
+    n_batches = 0
+    for batch in pipeline.gen_batch(5, n_epochs=2, shuffle=13, prefetch=prefetch, pool=True):
+        assert np.array_equal(batch.data, data[batch.indices])
+        n_batches += 1
+    assert n_batches == 20
+
+
+@pytest.mark.parametrize('auto_release, expected', [(True, (1, 9)), (False, (10, 0))])
+def test_counters(data, auto_release, expected):
+    pool = BatchPool(auto_release=auto_release)
+    Dataset(50, preloaded=data).p.run(5, n_epochs=1, shuffle=False, pool=pool)
+    assert (pool.created, pool.reused) == expected
+    assert pool.stats == dict(created=expected[0], reused=expected[1], idle=int(auto_release))
+
+
+def test_manual_release(data):
+    pool = BatchPool(max_size=2)
+    batches = [pool.acquire(Batch, DatasetIndex(5), preloaded=data) for _ in range(3)]
+    for batch in batches:
+        batch.release()
+        batch.release()
+    assert len(pool) == 2
+
+    pool.acquire(Batch, DatasetIndex(5), preloaded=data)
+    assert (pool.created, pool.reused) == (3, 1)
+    pool.clear()
+    assert len(pool) == 0
+
+
+def acquire_data(pool, index, preloaded):
+    batch = pool.acquire(Batch, index, preloaded=preloaded)
+    return batch, batch.data
+
+
+@pytest.mark.parametrize('index, cast', [
+    (DatasetIndex(5), None),
+    (DatasetIndex(4), None),
+    (DatasetIndex(5), np.int64),
+])
+def test_buffer_reuse(data, index, cast):
+    pool = BatchPool()
+    batch, first = acquire_data(pool, DatasetIndex(5), data)
+    first_copy = first.copy()
+    batch.release()
+
+    preloaded = data[::-1].copy() if cast is None else data.astype(cast)
+    _, second = acquire_data(pool, index, preloaded)
+    assert np.array_equal(second, preloaded[index.indices])
+    reused = len(index) == 5 and cast is None
+    assert np.shares_memory(first, second) == reused
+    if not reused:
+        assert np.array_equal(first, first_copy)
+
+
+def test_no_buffer_reuse(data):
+    pool = BatchPool(reuse_buffers=False)
+    batch, first = acquire_data(pool, DatasetIndex(5), data)
+    batch.release()
+    _, second = acquire_data(pool, DatasetIndex(5), data)
+    assert pool.reused == 1
+    assert not np.shares_memory(first, second)
+
+
+class CountingBatch(Batch):
+    def __init__(self, index, preloaded=None, *args, scale=1, **kwargs):
+        super().__init__(index, preloaded, *args, **kwargs)
+        self.counter = 0
+        self.scale = scale
+
+
+def test_subclass_attributes(data):
+    pool = BatchPool()
+    dataset = Dataset(50, batch_class=CountingBatch, preloaded=data)
+    for batch in dataset.gen_batch(5, n_epochs=1, shuffle=False, pool=pool):
+        assert batch.counter == 0
+        batch.counter += 1
+        batch.release()
+    assert pool.reused == 9
+
+    batch = pool.acquire(CountingBatch, DatasetIndex(5), preloaded=data, scale=2)
+    assert (batch.counter, batch.scale) == (0, 2)
+    assert np.array_equal(batch.data, data[:5])
@@ -1,5 +1,6 @@
-# pylint: disable=redefined-outer-name, missing-docstring
+# pylint: disable=redefined-outer-name, missing-docstring, protected-access
 import sys
+import pickle
 import pytest
 
 sys.path.append('..')
@@ -59,3 +60,84 @@ class TestConfig:
 
     def test_pop_nested_missing_key_with_default(self, config):
         assert config.pop('key2/missing key', default=1) == 1
+
+    def test_nested_inplace_write(self, config):
+        for _ in range(2):
+            assert config.get('key2/subkey1') == 'val21'
+            assert config.flatten()['key2/subkey1'] == 'val21'
+        version = config.version
+
+        config['key2']['subkey1'] = 'new'
+        config['key2']['subkey2'] = 'val22'
+        assert config.version != version
+        for _ in range(2):
+            assert config.get('key2/subkey1') == 'new'
+            assert config['key2/subkey2'] == 'val22'
+            assert config.flatten() == {'key1': 'val1', 'key2/subkey1': 'new', 'key2/subkey2': 'val22'}
+
+    def test_plain_dict(self, config):
+        config.config = {'key1': {'subkey1': 1}}
+        assert config.version is None
+        for value in [1, 2]:
+            config.config['key1']['subkey1'] = value
+            for _ in range(2):
+                assert config.get('key1/subkey1') == value
+                assert config.flatten() == {'key1/subkey1': value}
+
+    def test_version_of_other_configs(self, config):
+        version = config.version
+        other = Config(dict(key1=dict(subkey1=1)))
+        other['key1/subkey1'] = 2
+        other.config['key1']['subkey2'] = 3
+        assert config.version == version
+
+    def test_version_of_shared_dicts(self, config):
+        other = Config()
+        other.config['shared'] = config.config['key2']
+        version, other_version = config.version, other.version
+        config.config['key2']['subkey1'] = 'new'
+        assert config.version != version
+        assert other.version != other_version
+        assert other['shared/subkey1'] == 'new'
+
+        # a removed dict does not change the config anymore
+        version = config.version
+        del config.config['key2']
+        other_version = other.version
+        assert config.version != version
+        version = config.version
+        other.config['shared']['subkey1'] = 'newer'
+        assert other.version != other_version
+        assert config.version == version
+
+    def test_version_after_pickle(self, config):
+        restored = pickle.loads(pickle.dumps(config))
+        version = restored.version
+        restored.config['key2']['subkey1'] = 'new'
+        assert restored.version != version
+        assert restored['key2/subkey1'] == 'new'
+
+
+class TestBuiltConfig:
+    class Model:
+        def __init__(self, config):
+            self.config = config
+            self._built_config = None
+            self.n_builds = 0
+
+        def build_config(self):
+            self.n_builds += 1
+            return Config(self.config)
+
+    def test_rebuild_after_put(self, config):
+        torch_base = pytest.importorskip('batchflow.models.torch.base')
+        model = self.Model(config)
+        for _ in range(3):
+            built = torch_base.TorchModel._get_built_config(model)
+        assert model.n_builds == 1
+        assert built['key2/subkey1'] == 'val21'
+
+        config.put('key2/subkey1', 'new')
+        built = torch_base.TorchModel._get_built_config(model)
+        assert model.n_builds == 2
+        assert built['key2/subkey1'] == 'new'
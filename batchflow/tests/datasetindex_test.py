@@ -4,10 +4,12 @@ When random values are needed, 'random_seed' is fixed to be 13.
 """
 # pylint: disable=missing-docstring
 # pylint: disable=protected-access
+import os
 import pytest
 import numpy as np
 
-from batchflow import DatasetIndex
+from batchflow import dsindex
+from batchflow import DatasetIndex, RangeIndex, FilesIndex, StreamIndex, BlockShuffle, Buckets
 
 
 def test_len():
@@ -259,3 +261,190 @@ def test_next_batch_bigger():
                                    n_epochs=None,
                                    drop_last=True)
             assert len(batch) == 7
+
+
+@pytest.mark.parametrize('index', [np.arange(10, 30, 2),
+                                   np.array([3, 7, 8, 20, 21]),
+                                   np.array([21, 3, 20, 8, 7]),
+                                   np.array([3, 2, 1], dtype=np.uint8),
+                                   np.array([10, 20, 30], dtype=np.uint64),
+                                   np.array(['e', 'b', 'a', 'd', 'c'])])
+def test_get_pos_lookup(index):
+    """ Positions are found for any kind of index (arithmetic, sorted, unsorted). """
+    dsi = DatasetIndex(index)
+    assert (dsi.get_pos(index[::-1]) == np.arange(len(index))[::-1]).all()
+    assert dsi.get_pos(index[1]) == 1
+
+@pytest.mark.parametrize('index, missing', [(np.arange(10, 30, 2), 11),
+                                            (np.array([3, 7, 8, 20, 21]), 9),
+                                            (np.array(['e', 'b', 'a', 'd', 'c']), 'f')])
+def test_get_pos_missing(index, missing):
+    """ Items which are not in the index raise KeyError, even along with existing ones. """
+    dsi = DatasetIndex(index)
+    with pytest.raises(KeyError):
+        dsi.get_pos(missing)
+    with pytest.raises(KeyError):
+        dsi.get_pos([index[0], missing])
+
+
+def test_range_index_get_pos():
+    dsi = RangeIndex(100, 200, 5)
+    assert len(dsi) == 20
+    assert dsi.get_pos(125) == 5
+    assert (dsi.get_pos([195, 100]) == [19, 0]).all()
+    with pytest.raises(KeyError):
+        dsi.get_pos(101)
+
+def test_range_index_split():
+    """ Subsets of a non-shuffled split are ranges too. """
+    dsi = RangeIndex(10)
+    dsi.split([0.6, 0.4])
+    assert isinstance(dsi.train, RangeIndex)
+    assert (np.concatenate([dsi.test.indices, dsi.train.indices]) == np.arange(10)).all()
+
+@pytest.mark.parametrize('shuffle', [False, True, 13])
+def test_range_index_epoch(shuffle):
+    """ Each item is used exactly once in an epoch. """
+    dsi = RangeIndex(1000)
+    items = np.concatenate([batch.indices for batch in dsi.gen_batch(64, shuffle=shuffle, n_epochs=1)])
+    assert len(items) == 1000
+    assert (np.sort(items) == np.arange(1000)).all()
+
+
+@pytest.mark.parametrize('shuffle', ['block', BlockShuffle(block_size=10, window=2, seed=42)])
+def test_block_shuffle(shuffle):
+    """ Each epoch is a permutation and each batch comes from a couple of adjacent blocks. """
+    dsi = DatasetIndex(95)
+    batches = [batch.indices for batch in dsi.gen_batch(10, shuffle=shuffle, n_epochs=1)]
+    assert np.array_equal(np.sort(np.concatenate(batches)), np.arange(95))
+    if isinstance(shuffle, BlockShuffle):
+        assert max(len(np.unique(batch // 10)) for batch in batches) <= 3
+
+
+@pytest.mark.parametrize('window', [0, 1, 3])
+def test_block_permutation(window):
+    """ Slices, items and arrays of positions agree with the whole lazy order. """
+    order = BlockShuffle(block_size=7, window=window, seed=42).permutation(100)
+    full = order[:]
+    assert np.array_equal(np.sort(full), np.arange(100))
+    assert np.array_equal(np.concatenate([order[i:i + 9] for i in range(0, 100, 9)]), full)
+    assert np.array_equal(order[[99, 0, 50]], full[[99, 0, 50]])
+    assert order[-1] == full[-1]
+    assert np.array_equal(order[::3], full[::3])
+    for start in range(0, 100, order.window_size):
+        assert len(np.unique(full[start:start + order.window_size] // 7)) <= max(window, 1) + 1
+    if window == 0:
+        # blocks are kept intact
+        assert np.sum(np.diff(full) != 1) < len(order.blocks)
+
+
+def test_block_shuffle_range_index():
+    """ A block order of a huge range index is not materialized. """
+    dsi = RangeIndex(10**9)
+    batch = dsi.next_batch(16, shuffle=BlockShuffle(block_size=1024, window=2, seed=1), n_epochs=1)
+    assert len(np.unique(batch.indices // 1024)) <= 2
+
+
+@pytest.mark.parametrize('buckets', [dict(batch_size=8, boundaries=[10, 50]), dict(budget=200)])
+def test_buckets(buckets):
+    """ Each item gets into a batch once per epoch, batches contain items of similar sizes. """
+    sizes = np.random.randint(1, 100, size=100)
+    buckets = Buckets(sizes, **buckets)
+    batches = [batch.indices for batch in DatasetIndex(100).gen_batch(buckets, shuffle=True, n_epochs=1)]
+    assert np.array_equal(np.sort(np.concatenate(batches)), np.arange(100))
+    for batch in batches:
+        if buckets.budget is not None:
+            assert len(batch) == 1 or sizes[batch].max() * len(batch) <= buckets.budget
+        else:
+            assert len(batch) <= 8
+            assert len(np.unique(np.searchsorted(buckets.boundaries, sizes[batch]))) == 1
+
+
+@pytest.mark.parametrize('shuffle', [False, True, 13])
+def test_stream_index_epochs(shuffle):
+    """ Each item is pulled once per epoch and gets a new id. """
+    dsi = StreamIndex(lambda: iter(range(100)), buffer_size=30)
+    batches = list(dsi.gen_batch(16, shuffle=shuffle, n_epochs=2))
+    assert np.array_equal(np.concatenate([batch.indices for batch in batches]), np.arange(200))
+    items = np.concatenate([batch.items for batch in batches])
+    assert np.array_equal(np.sort(items), np.repeat(np.arange(100), 2))
+    assert len(batches[-1]) == 200 % 16
+
+
+def test_stream_index_async_bounded():
+    """ Async sources are supported and the shuffle buffer stays within its byte limit. """
+    async def source():
+        for i in range(50):
+            yield np.full(100, i)
+
+    dsi = StreamIndex(source(), max_bytes=2000)
+    iter_params = dsi.get_default_iter_params()
+    items = []
+    while True:
+        try:
+            batch = dsi.next_batch(8, shuffle=True, n_epochs=None, drop_last=True, iter_params=iter_params)
+        except StopIteration:
+            break
+        items.extend(item[0] for item in batch.items)
+        assert iter_params['_stream']['nbytes'] < 2000 + 800
+    assert len(items) == 48 and len(set(items)) == 48
+
+
+def test_stream_index_subset_and_split():
+    """ Only batches of a stream can be subset and a stream cannot be split. """
+    dsi = StreamIndex(lambda: iter(range(10)))
+    with pytest.raises(TypeError):
+        dsi.create_subset([0, 1])
+    with pytest.raises(ValueError):
+        dsi.split()
+
+
+def test_files_index_scan(tmp_path, monkeypatch):
+    """ A saved scan is reused until a scanned directory changes. """
+    for folder in ['a', 'b']:
+        (tmp_path / folder).mkdir()
+        for name in ['1.png', '2.png', '3.txt']:
+            (tmp_path / folder / name).write_text(name)
+    path = str(tmp_path / '*' / '*.png')
+    index_file = str(tmp_path / 'index.npz')
+
+    scans = []
+    scan_path = dsindex.scan_path
+    def _scan_path(*args, **kwargs):
+        scans.append(args[0])
+        return scan_path(*args, **kwargs)
+    monkeypatch.setattr(dsindex, 'scan_path', _scan_path)
+
+    fi = FilesIndex(path=path, no_ext=True, sort=True, index_file=index_file)
+    assert list(fi.indices) == ['1', '1', '2', '2']
+    assert fi.get_fullpath('2').endswith('2.png')
+    assert len(scans) == 1
+
+    fi = FilesIndex(path=path, no_ext=True, sort=True, index_file=index_file)
+    assert list(fi.indices) == ['1', '1', '2', '2']
+    assert fi.get_fullpath('2').endswith('2.png')
+    assert len(scans) == 1
+
+    (tmp_path / 'a' / '4.png').write_text('4')
+    os.utime(str(tmp_path / 'a'), ns=(0, 0))
+    fi = FilesIndex(path=path, no_ext=True, sort=True, index_file=index_file)
+    assert list(fi.indices) == ['1', '1', '2', '2', '4']
+    assert len(scans) == 2
+
+
+def test_files_index_scan_literal_name(tmp_path):
+    """ A saved scan is rebuilt when a file matched by a literal name is removed. """
+    for folder in ['a', 'b']:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / 'img.png').write_text(folder)
+    path = str(tmp_path / '*' / 'img.png')
+    index_file = str(tmp_path / 'index.npz')
+
+    fi = FilesIndex(path=path, no_ext=True, index_file=index_file)
+    assert len(fi) == 2
+
+    (tmp_path / 'b' / 'img.png').unlink()
+    os.utime(str(tmp_path / 'b'), ns=(0, 0))
+    fi = FilesIndex(path=path, no_ext=True, index_file=index_file)
+    assert len(fi) == 1
+    assert os.path.isfile(fi.get_fullpath(fi.indices[0]))
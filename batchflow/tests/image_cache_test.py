@@ -0,0 +1,126 @@
+""" Tests for ImageCache. """
+# pylint: disable=missing-docstring, redefined-outer-name, protected-access
+import uuid
+import pickle
+import pytest
+import numpy as np
+
+from batchflow import ImageCache
+from batchflow import image_cache
+
+
+@pytest.fixture
+def paths(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / ('%d.png' % i)
+        path.write_bytes(b'%d' % i)
+        paths.append(str(path))
+    return paths
+
+
+class Loader:
+    """ Make images of 100 bytes and count decodings """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, value=0):
+        def _load():
+            self.calls += 1
+            return np.full((10, 10), value, dtype=np.uint8)
+        return _load
+
+
+def shared_cache(**kwargs):
+    if image_cache.shared_memory is None:
+        pytest.skip("multiprocessing.shared_memory is not available")
+    return ImageCache(shared=True, name='test_' + uuid.uuid4().hex[:8], **kwargs)
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_hits_and_misses(paths, shared):
+    cache = shared_cache() if shared else ImageCache()
+    loader = Loader()
+    for _ in range(3):
+        image = cache.get(paths[0], loader(1))
+        assert (image == 1).all()
+    assert loader.calls == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    cache.get(paths[0], loader(2), params='other')
+    assert loader.calls == 2
+    assert len(cache) == 2
+    cache.clear()
+
+
+def test_read_only():
+    cache = ImageCache()
+    image = cache.get(__file__, Loader()(1))
+    with pytest.raises(ValueError):
+        image[0, 0] = 0
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_budget_and_eviction(paths, shared):
+    # shared images are stored with a header
+    max_bytes = (100 + (ImageCache._HEADER_SIZE if shared else 0)) * 5 // 2
+    cache = shared_cache(max_bytes=max_bytes) if shared else ImageCache(max_bytes=max_bytes)
+    loader = Loader()
+    for path in paths[:3]:
+        cache.get(path, loader())
+    assert len(cache) == 2
+    assert cache.nbytes <= max_bytes
+    assert cache.evictions == 1
+
+    # the first image is evicted, while the last ones are kept
+    cache.get(paths[2], loader())
+    assert loader.calls == 3
+    cache.get(paths[0], loader())
+    assert loader.calls == 4
+    cache.clear()
+    assert (len(cache), cache.nbytes) == (0, 0)
+
+
+def test_too_large(paths):
+    cache = ImageCache(max_bytes=50)
+    cache.get(paths[0], Loader()())
+    assert len(cache) == 0
+    assert cache.misses == 1
+
+
+def test_shared_between_caches(paths):
+    cache = shared_cache()
+    other = pickle.loads(pickle.dumps(cache))
+    loader = Loader()
+    cache.get(paths[0], loader(1))
+    image = other.get(paths[0], loader(2))
+    assert (image == 1).all()
+    assert loader.calls == 1
+    assert other.hits == 1
+    other.clear()
+    cache.clear()
+
+
+def test_shared_not_ready(paths):
+    cache = shared_cache()
+    key = cache.make_key(paths[0])
+    # a segment which is created but not filled yet by another process
+    segment = image_cache.shared_memory.SharedMemory(key, create=True, size=1024)
+    try:
+        loader = Loader()
+        image = cache.get(paths[0], loader(1))
+        assert (image == 1).all()
+        assert len(cache) == 0
+
+        image = cache.get(paths[0], loader(1))
+        assert loader.calls == 2
+        assert len(cache) == 0
+        assert cache._create(key, image) is None
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def test_key_length(paths):
+    # macOS limits shared memory names to 30 characters (besides a leading slash)
+    assert len(ImageCache().make_key(paths[0], params=((224, 224), 'RGB', 0))) <= 30
@@ -0,0 +1,46 @@
+""" Tests for named expressions. """
+# pylint: disable=missing-docstring
+import pytest
+import numpy as np
+
+from batchflow import Dataset, Pipeline, B, F, V, R
+from batchflow.named_expr import eval_expr, compile_expr
+
+
+@pytest.mark.parametrize('size', [None, 3, (2, 2)])
+def test_buffered_random(size):
+    buffered = R('normal', 0, 1, seed=5, size=size, buffer=10)
+    direct = np.random.default_rng(5).normal(0, 1, size=(6, *np.atleast_1d(size or ())))
+    for i in range(6):
+        assert np.array_equal(buffered.get(), direct[i])
+
+
+def test_buffered_random_params():
+    buffered = R('uniform', R('uniform', 5, 6, seed=1), 10, seed=5, buffer=10)
+    values = [buffered.get() for _ in range(5)]
+    assert all(5 <= value < 10 for value in values)
+
+
+TREES = [
+    B('size'),
+    [1, (2, 3), {'a': [4]}],
+    [B('size'), (2, V('var')), {'a': [F(lambda batch: batch.indices[0])], 'b': 1}],
+    {B('size'): V('var'), 'const': (1, [2, {'c': 3}]), 'nested': {'d': [V('var'), (B('indices'),)]}},
+    ({'a': 1}, [[[], [V('var')]]], ()),
+]
+
+
+@pytest.mark.parametrize('tree', TREES)
+def test_compile_expr(tree):
+    pipeline = Pipeline().init_variable('var', 5)
+    batch = Dataset(10).create_batch(np.arange(3, 7))
+    batch.pipeline = pipeline
+    expected = eval_expr(tree, batch=batch, pipeline=pipeline)
+    result = compile_expr(tree)(batch=batch, pipeline=pipeline)
+    assert repr(result) == repr(expected)
+    assert type(result) is type(expected)
+
+
+def test_compile_constant():
+    tree = [1, (2, 3), {'a': [4]}]
+    assert compile_expr(tree)() is tree
@@ -0,0 +1,58 @@
+""" Tests for replaying execution plans of pipelines. """
+# pylint: disable=missing-docstring
+import pytest
+
+from batchflow import Dataset, Pipeline, R
+
+
+def make_pipeline(trace):
+    def mark(name):
+        def _mark(batch):
+            trace.append((tuple(batch.indices), name))
+        return _mark
+
+    def nested(name):
+        return Pipeline().call(mark(name + '_a')).call(mark(name + '_b'))
+
+    return (Dataset(40).p
+            + (nested('single') @ 0.5)
+            + (nested('nested') @ 0.7) * R('integers', 1, 4)
+            + nested('repeated') * R('integers', 1, 3))
+
+
+def run(random_seed, **kwargs):
+    trace = []
+    pipeline = make_pipeline(trace)
+    pipeline.run(4, n_epochs=2, shuffle=False, random_seed=random_seed, **kwargs)
+    return trace, pipeline.exec_plan
+
+
+def test_replay():
+    trace, plan = run(1, record_plan=True)
+    assert len(plan.rows) == 20
+
+    replayed, _ = run(2, exec_plan=plan)
+    other, _ = run(2)
+    assert replayed == trace
+    assert other != trace
+
+
+def test_replay_with_prefetch():
+    trace, plan = run(1, record_plan=True)
+    replayed, _ = run(2, exec_plan=plan, prefetch=2)
+    assert sorted(replayed) == sorted(trace)
+
+
+def test_no_recording():
+    _, plan = run(1)
+    assert plan.rows == []
+    with pytest.raises(ValueError):
+        run(2, exec_plan=plan)
+
+
+def test_short_plan():
+    trace = []
+    pipeline = make_pipeline(trace)
+    pipeline.run(4, n_epochs=1, shuffle=False, random_seed=1, record_plan=True)
+    with pytest.raises(RuntimeError):
+        run(1, exec_plan=pipeline.exec_plan)
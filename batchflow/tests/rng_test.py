@@ -0,0 +1,49 @@
+""" Tests for random number streams. """
+# pylint: disable=missing-docstring
+import pytest
+import numpy as np
+
+from batchflow import Dataset, R
+from batchflow.rng import make_rng, spawn
+
+
+def test_make_rng():
+    assert np.array_equal(make_rng(13).random(5), make_rng(13).random(5))
+    assert not np.array_equal(make_rng(13).random(5), make_rng(14).random(5))
+
+    rng = np.random.default_rng(13)
+    assert make_rng(rng) is rng
+
+
+def test_spawn():
+    first, second = spawn(13, 2), spawn(13, 2)
+    for one, other in zip(first, second):
+        assert np.array_equal(make_rng(one).random(5), make_rng(other).random(5))
+    assert not np.array_equal(make_rng(first[0]).random(5), make_rng(first[1]).random(5))
+
+
+def run_draws(prefetch, random_seed=13):
+    """ Return draws from batch streams and from `R` for each batch """
+    draws = {}
+    def _draw(batch, values):
+        draws[tuple(batch.indices)] = np.concatenate([batch.random.random(3), values])
+
+    (Dataset(20).p
+     .call(_draw, values=R('uniform', size=3))
+     .run(4, n_epochs=2, shuffle=13, prefetch=prefetch, random_seed=random_seed))
+    return draws
+
+
+@pytest.mark.parametrize('prefetch', [1, 3])
+def test_run_random_seed(prefetch):
+    expected = run_draws(prefetch=0)
+    draws = run_draws(prefetch=prefetch)
+    assert len(draws) == 10
+    assert draws.keys() == expected.keys()
+    for key, value in expected.items():
+        assert np.array_equal(draws[key], value)
+
+
+def test_run_other_random_seed():
+    draws, other = run_draws(prefetch=0), run_draws(prefetch=0, random_seed=14)
+    assert not any(np.array_equal(value, other[key]) for key, value in draws.items())
@@ -0,0 +1,92 @@
+""" Tests for samplers. """
+# pylint: disable=missing-docstring, protected-access
+import pickle
+import pytest
+import numpy as np
+
+from batchflow.sampler import ConstantSampler, NumpySampler, BufferedSampler, HistoSampler
+
+
+@pytest.mark.parametrize('background', [False, True])
+@pytest.mark.parametrize('sizes', [[1, 2, 3], [7, 1, 20, 5]])
+def test_buffered_sampler(background, sizes):
+    expected = NumpySampler('n', seed=5).sample(sum(sizes))
+    sampler = NumpySampler('n', seed=5).buffered(block_size=4, background=background)
+    samples = np.concatenate([sampler.sample(size) for size in sizes])
+    assert np.array_equal(samples, expected)
+
+
+def test_buffered_callable():
+    rng = np.random.default_rng(5)
+    expected = np.random.default_rng(5).uniform(size=10)
+    sampler = BufferedSampler(lambda size: rng.uniform(size=size), block_size=3)
+    samples = np.concatenate([sampler.sample(size) for size in [1, 4, 5]])
+    assert np.array_equal(samples, expected)
+
+
+def test_buffered_pickle():
+    expected = NumpySampler('n', seed=5).sample(12)
+    sampler = NumpySampler('n', seed=5).buffered(block_size=4, background=True)
+    first = sampler.sample(5)
+    restored = pickle.loads(pickle.dumps(sampler))
+    assert np.array_equal(np.concatenate([first, restored.sample(7)]), expected)
+
+
+def test_histo_sampler_update():
+    edges = [np.linspace(0, 1, 5), np.linspace(0, 2, 3)]
+    sampler = HistoSampler(edges=edges, seed=5)
+    sampler.update(np.array([[.1, .1], [.6, 1.5], [.6, 1.7]]))
+    sampler.update(np.array([[.9, .5]]))
+    assert np.array_equal(sampler._cumulative, np.cumsum(sampler.bins))
+    assert sampler._cumulative[-1] == 4
+
+    points = sampler.sample(1000)
+    bins = np.histogramdd(points, bins=edges)[0]
+    assert np.array_equal(bins > 0, sampler.bins > 0)
+    assert bins[2, 1] > bins[0, 0]
+
+
+def test_histo_sampler_bins_assignment():
+    sampler = HistoSampler(edges=[np.linspace(0, 1, 5)], seed=5)
+    sampler.update(np.array([.1, .2, .3]).reshape(-1, 1))
+    bins = sampler.bins.copy()
+    bins[:] = [0, 0, 0, 1]
+    sampler.bins = bins
+    assert np.array_equal(sampler._cumulative, [0, 0, 0, 1])
+    assert (sampler.sample(100) >= .75).all()
+
+
+def test_mixture_weights():
+    first, second, third = ConstantSampler(0), ConstantSampler(1), ConstantSampler(2)
+    mixture = (first | (2 & second)) | (3 & third)
+    assert [sampler.sample(1)[0, 0] for sampler, _ in mixture._mixture] == [0, 1, 2]
+    assert np.allclose([weight for _, weight in mixture._mixture], [1, 2, 3])
+    assert mixture.weight == 6
+
+    nested = (2 & (first | second)) | third
+    assert np.allclose([weight for _, weight in nested._mixture], [1, 1, 1])
+
+    counts = np.bincount(mixture.sample(6000).astype(int).ravel(), minlength=3)
+    assert np.allclose(counts / 6000, [1 / 6, 2 / 6, 3 / 6], atol=.03)
+
+
+def test_product_columns():
+    product = ConstantSampler([0, 1]) & (ConstantSampler(2) & ConstantSampler([3, 4]))
+    assert len(product._factors) == 3
+    assert np.array_equal(product.sample(3), np.tile(np.arange(5), (3, 1)))
+
+
+def test_apply_order():
+    base = ConstantSampler(1)
+    transformed = base.apply(lambda x: x + 1).apply(lambda x: x * 10)
+    assert transformed._transforms[0] is base
+    assert len(transformed._transforms[1]) == 2
+    assert (transformed.sample(4) == 20).all()
+
+
+@pytest.mark.parametrize('size', [0, 1, 1000])
+def test_truncate_size(size):
+    sampler = NumpySampler('n', seed=5).truncate(high=0, low=-1, prob=.3)
+    sample = sampler.sample(size)
+    assert sample.shape == (size, 1)
+    assert ((sample >= -1) & (sample <= 0)).all()
@@ -0,0 +1,113 @@
+""" Tests for accumulating pipeline variables. """
+# pylint: disable=missing-docstring
+import pickle
+import pytest
+import numpy as np
+
+from batchflow import Dataset, B, F
+from batchflow.variables import Accumulator, GrowableArray
+
+
+def run_pipeline(prefetch):
+    pipeline = (Dataset(50).p
+                .init_variable('count', accumulate='count', init_on_each_run=0)
+                .init_variable('sum', accumulate='sum', init_on_each_run=0)
+                .init_variable('list', accumulate='list', init_on_each_run=list)
+                .init_variable('items', accumulate='list', init_on_each_run=list)
+                .init_variable('concat', accumulate='concat', init_on_each_run=None)
+                .init_variable('metrics', accumulate='metrics', init_on_each_run=None)
+                .inc_variable('count')
+                .update_variable('sum', B('size'), mode='a')
+                .update_variable('list', B('size'), mode='a')
+                .update_variable('items', B('indices'), mode='e')
+                .update_variable('concat', B('indices'), mode='a')
+                .update_variable('metrics', F(lambda batch: dict.fromkeys(batch.indices, 1)), mode='u')
+                .run(7, n_epochs=2, shuffle=False, drop_last=False, prefetch=prefetch))
+    return {name: pipeline.get_variable(name) for name in ['count', 'sum', 'list', 'items', 'concat', 'metrics']}
+
+
+@pytest.mark.parametrize('prefetch', [0, 4])
+def test_kinds(prefetch):
+    values = run_pipeline(prefetch)
+    indices = np.tile(np.arange(50), 2)
+    assert values['count'] == 15
+    assert values['sum'] == 100
+    assert sorted(values['list']) == [2] + [7] * 14
+    assert sorted(values['items']) == sorted(indices)
+    assert isinstance(values['concat'], np.ndarray)
+    assert np.array_equal(np.sort(values['concat']), np.sort(indices))
+    assert values['metrics'] == dict.fromkeys(range(50), 1)
+
+
+def test_extend_count_and_sum():
+    pipeline = (Dataset(10).p
+                .init_variable('count', accumulate='count', init_on_each_run=0)
+                .init_variable('sum', accumulate='sum', init_on_each_run=0)
+                .update_variable('count', B('indices'), mode='e')
+                .update_variable('sum', B('indices'), mode='e')
+                .run(3, n_epochs=1, shuffle=False, drop_last=False))
+    assert pipeline.get_variable('count') == 10
+    assert pipeline.get_variable('sum') == 45
+
+    var = Accumulator(accumulate='sum')
+    var.accumulate(np.ones((2, 3)), mode='e')
+    var.accumulate(np.ones(3))
+    assert np.array_equal(var.get(), [3, 3, 3])
+
+
+def test_order():
+    values = run_pipeline(prefetch=0)
+    indices = np.tile(np.arange(50), 2)
+    assert values['items'] == list(indices)
+    assert np.array_equal(values['concat'], indices)
+
+
+def test_set_clears_shards():
+    var = Accumulator(default=[], accumulate='list')
+    var.accumulate(1)
+    var.accumulate([2, 3], mode='e')
+    assert var.get() == [1, 2, 3]
+    var.set([0])
+    assert var.get() == [0]
+    var.accumulate(4)
+    assert var.get() == [0, 4]
+
+
+@pytest.mark.parametrize('kind, values, expected', [
+    ('count', [1, 1, 1], 3),
+    ('sum', [1, 2, 3], 6),
+    ('list', [1, 2, 3], [1, 2, 3]),
+    ('metrics', [{'a': 1}, {'b': 2}], {'a': 1, 'b': 2}),
+])
+def test_pickle(kind, values, expected):
+    var = Accumulator(accumulate=kind)
+    for value in values:
+        var.accumulate(value)
+    restored = pickle.loads(pickle.dumps(var))
+    assert restored.get() == expected
+
+    # restored variable keeps accumulating
+    if kind == 'count':
+        restored.accumulate(1)
+        assert restored.get() == 4
+
+
+def test_pickle_concat():
+    var = Accumulator(accumulate='concat')
+    var.accumulate(np.arange(3))
+    var.accumulate(np.arange(3, 5))
+    restored = pickle.loads(pickle.dumps(var))
+    restored.accumulate(np.arange(5, 6))
+    assert np.array_equal(restored.get(), np.arange(6))
+
+
+def test_growable_array():
+    array = GrowableArray(capacity=2)
+    array.extend(np.arange(3))
+    array.extend(np.arange(3, 10))
+    assert len(array) == 10
+    assert np.array_equal(array.data, np.arange(10))
+
+    array.extend([.5])
+    assert array.data.dtype == np.float64
+    assert np.array_equal(array.data, [*range(10), .5])
@@ -1,6 +1,9 @@
 """ Contains Variable class and Variables storage class """
 import threading
 import logging
+import itertools
+
+import numpy as np
 
 from .named_expr import eval_expr, L
 
@@ -60,6 +63,173 @@ class Variable:
             self._lock.release()
 
 
+class GrowableArray:
+    """ An array which grows along the first axis into a preallocated buffer
+
+    The buffer is reallocated with doubled capacity when it is full, so appending is amortized O(1)
+    and does not keep a list of small arrays.
+
+    Parameters
+    ----------
+    capacity : int
+        an initial number of preallocated rows
+    """
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._data = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def data(self):
+        """ np.ndarray or None : filled rows (a view of the buffer) """
+        size = self._size
+        return self._data[:size] if self._data is not None else None
+
+    def extend(self, values):
+        """ Append rows to the array """
+        values = np.asarray(values)
+        if values.ndim == 0:
+            values = values.reshape(1)
+        size, new_size = self._size, self._size + len(values)
+
+        data = self._data
+        if data is None:
+            data = np.empty((max(self.capacity, new_size), *values.shape[1:]), dtype=values.dtype)
+        elif new_size > len(data) or not np.can_cast(values.dtype, data.dtype):
+            new_data = np.empty((max(2 * len(data), new_size), *data.shape[1:]),
+                                dtype=np.result_type(data.dtype, values.dtype))
+            new_data[:size] = data[:size]
+            data = new_data
+        data[size:new_size] = values
+        self._data = data
+        # size is updated last, so concurrent readers see filled rows only
+        self._size = new_size
+
+
+class Accumulator(Variable):
+    """ Pipeline variable which accumulates values without locks
+
+    Each thread adds values to its own shard, and shards are merged when a variable value is requested,
+    so prefetching threads do not wait for each other. Values are merged in the order they were added.
+
+    Parameters
+    ----------
+    accumulate : str
+        how to accumulate values:
+
+        - 'count' - a number of added values (or items of values if mode is 'e' or 'extend')
+        - 'sum' - a sum of added values (or items of values if mode is 'e' or 'extend')
+        - 'list' - a list of added values (or items of values if mode is 'e' or 'extend')
+        - 'concat' - an array of values concatenated along the first axis
+          (values are stored in :class:`GrowableArray` buffers)
+        - 'metrics' - metrics merged with `update` (e.g. from :meth:`~.Pipeline.gather_metrics`)
+
+    Notes
+    -----
+    A default value is a starting value which added values are merged with.
+
+    Writing a value (mode 'w') replaces the accumulated value and clears all shards.
+    """
+    KINDS = ('count', 'sum', 'list', 'concat', 'metrics')
+
+    def __init__(self, default=None, accumulate='list', lock=True, pipeline=None, **kwargs):
+        if accumulate not in self.KINDS:
+            raise ValueError("accumulate should be one of %s, but given '%s'" % (self.KINDS, accumulate))
+        self.kind = accumulate
+        self._shards = {}
+        self._counter = itertools.count()
+        super().__init__(default, lock=lock, pipeline=pipeline, **kwargs)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['value'] = self.get()
+        state.pop('_shards')
+        state.pop('_counter')
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._shards = {}
+        self._counter = itertools.count()
+
+    def set(self, value):
+        """ Assign a variable value and clear accumulated values """
+        self.value = value
+        self._shards = {}
+
+    def accumulate(self, value, mode='a'):
+        """ Add a value to a shard of the current thread """
+        shard = self._shards.get(threading.get_ident())
+        if shard is None:
+            shard = self._shards[threading.get_ident()] = [] if self.kind != 'concat' else (GrowableArray(), [])
+        order = next(self._counter)
+
+        if self.kind == 'count':
+            count = len(value) if mode in ['e', 'extend'] else 1
+            shard[:] = [shard[0] + count if shard else count]
+        elif self.kind == 'sum':
+            if mode in ['e', 'extend']:
+                value = np.sum(value, axis=0)
+            shard[:] = [shard[0] + value if shard else value]
+        elif self.kind == 'list':
+            shard.append((order, list(value) if mode in ['e', 'extend'] else [value]))
+        elif self.kind == 'concat':
+            array, chunks = shard
+            start = len(array)
+            array.extend(value)
+            chunks.append((order, start, len(array)))
+        elif self.kind == 'metrics':
+            if shard:
+                shard[1].update(value)
+            else:
+                shard[:] = [order, value.copy() if hasattr(value, 'copy') else value]
+
+    def get(self):
+        """ Return a value merged from all shards """
+        shards = list(self._shards.values())
+        if self.kind in ['count', 'sum']:
+            values = [shard[0] for shard in shards if shard]
+            value = self.value if self.value is not None else 0
+            for item in values:
+                value = value + item
+            return value
+
+        if self.kind == 'list':
+            items = sorted(item for shard in shards for item in list(shard))
+            return list(self.value or []) + [value for _, values in items for value in values]
+
+        if self.kind == 'concat':
+            return self._merge_arrays(shards)
+
+        items = sorted(shard for shard in shards if shard)
+        values = ([self.value] if self.value is not None else []) + [metrics for _, metrics in items]
+        if not values:
+            return None
+        value = values[0].copy() if hasattr(values[0], 'copy') else values[0]
+        for metrics in values[1:]:
+            value.update(metrics)
+        return value
+
+    def _merge_arrays(self, shards):
+        # chunks are read before data, so all rows of the chunks are already in the buffer
+        chunks = [(list(shard[1]), shard[0]) for shard in shards]
+        chunks = [(chunk, array.data) for chunk, array in chunks if chunk]
+        if self.value is None and len(chunks) == 1:
+            chunk, data = chunks[0]
+            return data[:chunk[-1][2]]
+
+        parts = sorted((order, start, stop, data) for chunk, data in chunks for order, start, stop in chunk)
+        parts = [data[start:stop] for _, start, stop, data in parts]
+        if self.value is not None:
+            parts.insert(0, np.asarray(self.value))
+        if not parts:
+            return None
+        return np.concatenate(parts)
+
+
 class VariableDirectory:
     """ Storage for pipeline variables """
     def __init__(self):
@@ -112,6 +282,8 @@ class VariableDirectory:
             var.pop('value')
             var['lock'] = var['_lock']
             var.pop('_lock')
+            if 'kind' in var:
+                var['accumulate'] = var.pop('kind')
             yield v, var
 
     def exists(self, name):
@@ -123,7 +295,11 @@ class VariableDirectory:
         if not self.exists(name):
             with self._lock:
                 if not self.exists(name):
-                    self.variables[name] = Variable(*args, pipeline=pipeline, **kwargs)
+                    accumulate = kwargs.pop('accumulate', None)
+                    if accumulate is None:
+                        self.variables[name] = Variable(*args, pipeline=pipeline, **kwargs)
+                    else:
+                        self.variables[name] = Accumulator(*args, accumulate=accumulate, pipeline=pipeline, **kwargs)
 
     def create_many(self, variables, pipeline=None):
         """ Create many variables at once """
@@ -160,6 +336,16 @@ class VariableDirectory:
             raise KeyError("Variable '%s' does not exist" % name)
         self.variables[name].set(value)
 
+    def is_accumulator(self, name):
+        """ Check whether a variable accumulates values without locks """
+        return isinstance(self.variables.get(name), Accumulator)
+
+    def accumulate(self, name, value, mode='a'):
+        """ Add a value to an accumulator variable """
+        if not self.exists(name):
+            raise KeyError("Variable '%s' does not exist" % name)
+        self.variables[name].accumulate(value, mode)
+
     def delete(self, name):
         """ Remove the variable with a given name """
         if not self.exists(name):
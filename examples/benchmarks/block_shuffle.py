@@ -0,0 +1,83 @@
+""" Compare read throughput of a disk-backed dataset for different shuffle strategies
+
+Items are fixed-size records in a single binary file which is read by `np.memmap`.
+For meaningful figures the file should be larger than the available page cache
+(or the cache should be dropped before each run, e.g. ``echo 3 > /proc/sys/vm/drop_caches``).
+
+Usage::
+
+    python block_shuffle.py --path /data/records.bin --items 1000000 --item-size 4096
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from batchflow import DatasetIndex, BlockShuffle     # pylint: disable=wrong-import-position
+
+
+def make_file(path, n_items, item_size):
+    """ Create a file with random records unless it already exists """
+    if os.path.exists(path) and os.path.getsize(path) == n_items * item_size:
+        return
+    chunk = max(1, 2**26 // item_size)
+    with open(path, 'wb') as f:
+        for start in range(0, n_items, chunk):
+            size = min(chunk, n_items - start) * item_size
+            f.write(np.random.randint(0, 256, size=size, dtype=np.uint8).tobytes())
+
+
+def run(path, n_items, item_size, batch_size, n_batches, shuffle, region_size):
+    """ Read `n_batches` batches and return items per second and seeks per batch
+
+    A seek is counted for each file region of `region_size` bytes (e.g. a readahead window)
+    which a batch reads and which was not read by the previous batch.
+    """
+    data = np.memmap(path, dtype=np.uint8, mode='r', shape=(n_items, item_size))
+    index = DatasetIndex(n_items)
+    seeks = 0
+    regions = set()
+    start = time.perf_counter()
+    for i, batch in enumerate(index.gen_batch(batch_size, shuffle=shuffle, n_epochs=None)):
+        if i >= n_batches:
+            break
+        positions = np.sort(index.get_pos(batch.indices))
+        _ = np.array(data[positions])
+        batch_regions = set((positions * item_size // region_size).tolist())
+        seeks += len(batch_regions - regions)
+        regions = batch_regions
+    elapsed = time.perf_counter() - start
+    return n_batches * batch_size / elapsed, seeks / n_batches
+
+
+def main():
+    """ Parse arguments and print a table with results """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--path', default='block_shuffle.bin')
+    parser.add_argument('--items', type=int, default=250000)
+    parser.add_argument('--item-size', type=int, default=4096)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--block-size', type=int, default=1024)
+    parser.add_argument('--window', type=int, default=4)
+    parser.add_argument('--region-size', type=int, default=2**20,
+                        help='the size of a contiguous read (e.g. a readahead window) in bytes')
+    args = parser.parse_args()
+
+    make_file(args.path, args.items, args.item_size)
+
+    strategies = [('sequential', False),
+                  ('global', True),
+                  ('block', BlockShuffle(args.block_size, args.window))]
+    print('%-12s %15s %15s' % ('shuffle', 'items/sec', 'seeks/batch'))
+    for name, shuffle in strategies:
+        speed, seeks = run(args.path, args.items, args.item_size, args.batch_size, args.batches, shuffle,
+                           args.region_size)
+        print('%-12s %15.0f %15.1f' % (name, speed, seeks))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+""" Measure which parallelization target is faster for each image transform and image size
+
+The output table could be used to tune :attr:`~batchflow.ImagesBatch.transform_targets`
+and :attr:`~batchflow.ImagesBatch.threads_min_pixels` for a given machine.
+
+Usage::
+
+    python transform_targets.py --sizes 32 128 512 --batch-size 64
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import PIL.Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from batchflow import ImagesBatch, DatasetIndex     # pylint: disable=wrong-import-position
+
+
+TRANSFORMS = {
+    'scale': dict(factor=.7),
+    'rotate': dict(angle=30),
+    'resize': dict(size=(100, 100)),
+    'shift': dict(offset=(5, 5)),
+    'filter': dict(mode='GaussianBlur'),
+    'flip': dict(mode='lr'),
+    'invert': dict(),
+    'crop': dict(origin='center', shape=(24, 24)),
+    'posterize': dict(bits=4),
+    'multiply': dict(multiplier=1.2, preserve_type=True),
+    'salt': dict(),
+    'elastic_transform': dict(alpha=10, sigma=3),
+}
+
+TARGETS = ['for', 'threads']
+
+
+def make_batch(size, batch_size):
+    """ Create a batch of random RGB images """
+    images = np.empty(batch_size, dtype=object)
+    images[:] = [PIL.Image.fromarray(np.random.randint(0, 256, size=(size, size, 3), dtype=np.uint8))
+                 for _ in range(batch_size)]
+    batch = ImagesBatch(DatasetIndex(batch_size))
+    batch.images = images
+    return batch
+
+
+def measure(batch, name, target, n_iters):
+    """ Return the mean time of a transform """
+    images = batch.images
+    start = time.perf_counter()
+    for _ in range(n_iters):
+        batch.images = images
+        getattr(batch, name)(target=target, **TRANSFORMS[name])
+    return (time.perf_counter() - start) / n_iters
+
+
+def main():
+    """ Parse arguments and print a table with results """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 128, 512])
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--transforms', nargs='+', default=list(TRANSFORMS))
+    args = parser.parse_args()
+
+    print('%-20s %6s' % ('transform', 'size') + ''.join('%12s' % target for target in TARGETS) + '%12s' % 'best')
+    for name in args.transforms:
+        for size in args.sizes:
+            batch = make_batch(size, args.batch_size)
+            times = [measure(batch, name, target, args.iters) for target in TARGETS]
+            row = '%-20s %6d' % (name, size) + ''.join('%11.1fms' % (t * 1000) for t in times)
+            print(row + '%12s' % TARGETS[int(np.argmin(times))])
+
+
+if __name__ == '__main__':
+    main()
@@ -29,7 +29,7 @@ setup(
     zip_safe=False,
     platforms='any',
     install_requires=[
-        'numpy>=1.10',
+        'numpy>=1.17',
         'dill>=0.2.7',
         'tqdm>=4.19.7',
         'scipy>=0.19.1',